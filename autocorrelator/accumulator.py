@@ -0,0 +1,196 @@
+''' Streaming statistics for repeated scans over the same delay positions. '''
+import numpy as np
+
+
+class ScanAccumulator:
+    ''' Per-delay running mean and variance over repeated passes using Welford's algorithm.
+
+        Memory and update cost depend only on the number of delay positions, never on the number of passes.
+
+        Usage:  accumulator = ScanAccumulator(delay_positions)
+                accumulator.add(indices, intensities) # any number of points from any pass
+                accumulator.mean, accumulator.standard_error
+    '''
+    columns = ['delay (mm)', 'mean intensity ({unit})', 'std ({unit})', 'standard error ({unit})', 'count']
+
+    def __init__(self, positions):
+        self.positions = np.asarray(positions, dtype=np.float64)
+        self.count = np.zeros(len(self.positions), dtype=np.int64)
+        self.mean = np.zeros(len(self.positions))
+        self.m2 = np.zeros(len(self.positions)) # sum of squared deviations from the mean
+
+    def add(self, indices, values):
+        ''' Adds values measured at positions[indices]. '''
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(np.unique(indices)) < len(indices):
+            # the vectorized update needs unique indices, e.g. the turnaround point of a serpentine scan appears twice
+            for index, value in zip(indices, values):
+                self.add([index], [value])
+            return
+        self.count[indices] += 1
+        delta = values - self.mean[indices]
+        self.mean[indices] += delta/self.count[indices]
+        self.m2[indices] += delta*(values - self.mean[indices])
+
+    @property
+    def measured(self):
+        return self.count > 0
+
+    @property
+    def variance(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.count > 1, self.m2/(self.count - 1), np.nan)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def standard_error(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(self.variance/self.count)
+
+    def to_array(self):
+        ''' Measured positions as rows of (delay, mean, std, standard error, count). '''
+        measured = self.measured
+        return np.column_stack((self.positions, self.mean, self.std, self.standard_error, self.count))[measured]
+
+    def state(self):
+        ''' Arrays that restore() the statistics from, i.e. for the scan journal. '''
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+    def restore(self, state):
+        self.count[:] = state['count']
+        self.mean[:] = state['mean']
+        self.m2[:] = state['m2']
+
+    def save(self, path, header='', unit='V'):
+        ''' Saves the accumulated statistics to path (.npy) and a csv next to it. unit labels the intensity columns. '''
+        data = self.to_array()
+        np.save(path, data)
+        columns = ', '.join(self.columns).format(unit=unit)
+        np.savetxt(path[:-len('.npy')] + '.csv', data, delimiter=',', header=header + columns)
+
+
+class BidirectionalAccumulator(ScanAccumulator):
+    ''' Per-delay statistics of a serpentine scan, which acquires on both the forward and the reverse sweeps.
+
+        The two directions are accumulated separately. Stage backlash shifts the reverse sweeps relative to the
+        forward ones, so each time both directions completed another sweep the shift is estimated by aligning their
+        mean traces (see estimate_backlash). The merged statistics (mean, m2, count) combine the
+        forward sweeps with the reverse sweeps moved back by the shift, or unshifted without compensation.
+
+        Usage:  accumulator = BidirectionalAccumulator(delay_positions)
+                accumulator.add(indices, intensities, reverse) # reverse: True for the points of reverse sweeps
+                accumulator.mean, accumulator.standard_error   # merged
+                accumulator.backlash                           # mm
+
+        Inputs :
+            positions (array): delay positions (mm) in the order of the forward sweeps.
+            compensate (bool): merge the reverse sweeps at their backlash-corrected positions.
+            max_backlash (float): largest shift (mm) searched for.
+    '''
+    def __init__(self, positions, compensate=True, max_backlash=0.05):
+        super().__init__(positions)
+        self.forward = ScanAccumulator(positions)
+        self.reverse = ScanAccumulator(positions)
+        self.compensate = compensate
+        self.max_backlash = max_backlash
+        self.backlash = None # mm the reverse sweeps read ahead of the forward ones, None until both directions completed a sweep
+        self.sweeps = (0, 0) # forward and reverse sweeps completed at the last estimate
+
+    def add(self, indices, values, reverse):
+        ''' Adds values measured at positions[indices], on reverse sweeps where reverse is True. '''
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        values = np.asarray(values, dtype=np.float64).ravel()
+        reverse = np.broadcast_to(np.asarray(reverse, dtype=bool), indices.shape)
+        self.forward.add(indices[~reverse], values[~reverse])
+        self.reverse.add(indices[reverse], values[reverse])
+        sweeps = (self.forward.count.min(), self.reverse.count.min())
+        if min(sweeps) > 0 and sweeps != self.sweeps:
+            self.sweeps = sweeps
+            self.estimate_backlash()
+        self.merge()
+
+    def estimate_backlash(self, iterations=10):
+        ''' Shift (mm) of the reverse sweeps, reverse(x) = forward(x + backlash). The peak of the cross-correlation of
+            the mean traces gives the whole steps, a least-squares fit of the shifted forward trace to the reverse one
+            (allowing for a change of gain and baseline between the sweeps) the fraction of a step.
+        '''
+        n = len(self.positions)
+        if n < 5:
+            return
+        order = np.argsort(self.positions)
+        positions = self.positions[order]
+        forward = self.forward.mean[order]
+        reverse = self.reverse.mean[order]
+        step = (positions[-1] - positions[0])/(n - 1)
+
+        centered_forward, centered_reverse = forward - forward.mean(), reverse - reverse.mean()
+        max_lag = int(min(np.ceil(self.max_backlash/step), n//4))
+        lags = np.arange(-max_lag, max_lag + 1)
+        correlation = [np.dot(centered_forward[max(lag, 0):n + min(lag, 0)], centered_reverse[max(-lag, 0):n - max(lag, 0)]) for lag in lags]
+        shift = lags[int(np.argmax(correlation))]*step
+
+        slope = np.gradient(forward, positions)
+        for _ in range(iterations):
+            source = positions + shift
+            inside = (source >= positions[0]) & (source <= positions[-1])
+            # reverse ~ gain*forward(x + shift + d) + baseline, linearized in d
+            model = np.interp(source[inside], positions, forward)
+            design = np.column_stack([model, np.ones(len(model)), np.interp(source[inside], positions, slope)])
+            gain, baseline, gain_d = np.linalg.lstsq(design, reverse[inside], rcond=None)[0]
+            if gain <= 0:
+                break
+            update = float(np.clip(gain_d/gain, -step, step))
+            shift += update
+            if abs(update) < 1e-4*step:
+                break
+        self.backlash = float(shift)
+
+    def merge(self):
+        ''' Combines the statistics of both directions, with the reverse sweeps moved back by the backlash. '''
+        shift = self.backlash if self.compensate and self.backlash is not None else 0.
+        reverse = self.reverse
+        if shift:
+            # reverse values read at position x belong to x + backlash, interpolate them back onto the positions
+            order = np.argsort(self.positions)
+            positions = self.positions[order]
+            source = self.positions - shift
+            # only where both neighbouring reverse values were measured
+            usable = (source >= positions[0]) & (source <= positions[-1]) & (np.interp(source, positions, reverse.measured[order].astype(float)) == 1.)
+            count = np.where(usable, np.round(np.interp(source, positions, reverse.count[order])), 0).astype(np.int64)
+            mean = np.where(usable, np.interp(source, positions, reverse.mean[order]), 0.)
+            m2 = np.where(usable, np.interp(source, positions, reverse.m2[order]), 0.)
+        else:
+            count, mean, m2 = reverse.count, reverse.mean, reverse.m2
+        # pairwise combination of the two sets of statistics (Chan et al.)
+        total = self.forward.count + count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = mean - self.forward.mean
+            self.mean = np.where(total > 0, self.forward.mean + delta*count/total, 0.)
+            self.m2 = np.where(total > 0, self.forward.m2 + m2 + delta**2*self.forward.count*count/total, 0.)
+        self.count = total
+
+    def state(self):
+        state = {f'forward {name}': array for name, array in self.forward.state().items()}
+        state.update({f'reverse {name}': array for name, array in self.reverse.state().items()})
+        return state
+
+    def restore(self, state):
+        self.forward.restore({name: state[f'forward {name}'] for name in ['count', 'mean', 'm2']})
+        self.reverse.restore({name: state[f'reverse {name}'] for name in ['count', 'mean', 'm2']})
+        self.sweeps = (0, 0)
+        if self.forward.measured.all() and self.reverse.measured.all():
+            self.sweeps = (self.forward.count.min(), self.reverse.count.min())
+            self.estimate_backlash()
+        self.merge()
+
+    def save(self, path, header='', unit='V'):
+        ''' Saves the merged statistics to path (.npy and .csv) and those of each direction next to it. '''
+        backlash = f'backlash (mm): {self.backlash:.6f}, {"compensated" if self.compensate else "not compensated"}\n' if self.backlash is not None else ''
+        super().save(path, header + backlash, unit)
+        base = path[:-len('.npy')]
+        self.forward.save(f'{base}_forward.npy', header, unit)
+        self.reverse.save(f'{base}_reverse.npy', header, unit)
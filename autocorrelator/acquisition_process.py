@@ -0,0 +1,406 @@
+''' Acquisition core in its own process, so rendering in the GUI has no effect on the acquisition timing.
+
+    The GUI process only renders. AutocorrelatorCore runs in a child process, where plotting, a busy Qt event loop
+    or the GUI's garbage collection cannot hold up moves, reads or processing. The processes are connected by:
+        shared memory  rings of the reduced points (delay, intensity) and of the raw samples, written by the core
+                       and polled by the GUI at its frame rate (shared_ring.py)
+        command pipe   calls from the GUI (acquire, stop, resume, shutter, stage moves), each answered with its
+                       result and the core's state
+        event pipe     the other plot updates (clear, averaged trace, fit curve) and a periodic snapshot of the
+                       core's state (AutocorrelatorCore.snapshot)
+    The core never waits for the GUI: the shared rings overwrite what the GUI did not read in time, and the event
+    pipe is written by its own thread, which keeps only the latest plot update of each kind while the GUI is slow.
+'''
+import atexit
+import multiprocessing
+import time
+import traceback
+from collections import deque
+from threading import Thread, Condition, Event, Lock
+
+import numpy as np
+
+from core import AutocorrelatorCore, NullDisplay
+from shared_ring import SharedRing
+from timing import ScanTimeModel
+
+
+max_channels = 3 # sensor, reference photodiode and chopper reference
+
+# state of the core until the acquisition process sent its first snapshot
+initial_state = {
+    'acquiring': False, 'settings': {}, 'stage': 'connecting', 'position': None, 'velocity': None, 'acceleration': None,
+    'sample_rate': None, 'settle_time': None, 'zero_position': 0., 'scan_time_model': None,
+    'shutter_open': False, 'lock_in_phase': None, 'pulse_duration': None, 'pulse_duration_error': None, 'monitor': None,
+    'throughput': None, 'remaining_time': None, 'timing': {}, 'backlash': None,
+}
+
+
+class EventSender:
+    ''' Sends messages over a pipe from its own thread, so a receiver that falls behind never blocks the sender.
+        Messages sent with a key replace the previous unsent message with that key.
+    '''
+    def __init__(self, connection):
+        self.connection = connection
+        self.condition = Condition()
+        self.queue = deque() # messages that are all delivered, in order
+        self.latest = {} # key: latest message of that key
+        self.closed = False
+        self.thread = Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def send(self, message, key=None):
+        with self.condition:
+            if key is None:
+                self.queue.append(message)
+            else:
+                self.latest[key] = message
+            self.condition.notify()
+
+    def discard(self, *keys):
+        ''' Drops the unsent messages of keys. '''
+        with self.condition:
+            for key in keys:
+                self.latest.pop(key, None)
+
+    def __run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.latest and not self.closed:
+                    self.condition.wait()
+                if self.closed and not self.queue and not self.latest:
+                    return
+                messages = list(self.queue) + list(self.latest.values())
+                self.queue.clear()
+                self.latest.clear()
+            for message in messages:
+                try:
+                    self.connection.send(message)
+                except (OSError, EOFError):
+                    return # the GUI process is gone
+                except Exception:
+                    traceback.print_exc() # i.e. an exception that cannot be pickled
+
+    def close(self):
+        ''' Sends the pending messages, then stops. '''
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join(5.)
+
+
+class SharedDisplay(NullDisplay):
+    ''' Display of the core in the acquisition process. Points are written to the shared points ring, the other plot
+        updates are sent to the GUI as ('display', method, count, args), with count the number of points written
+        before them.
+    '''
+    def __init__(self, sender, points):
+        self.sender = sender
+        self.points = points
+
+    def clearIntensityPlot(self):
+        self.sender.discard('setAveragedPlot', 'setFitPlot') # stale updates of the previous acquisition
+        self.sender.send(('display', 'clearIntensityPlot', self.points.written, ()))
+
+    def setPlotHistoryLength(self, history_length=None):
+        self.sender.send(('display', 'setPlotHistoryLength', self.points.written, (history_length,)))
+
+    def appendIntensityPlot(self, intensity_data, x_axis=None):
+        # monitor points have no delay, they are plotted against the reading number
+        delays = np.full(len(intensity_data), np.nan) if x_axis is None else x_axis
+        self.points.write(np.column_stack([delays, intensity_data]))
+
+    def setAveragedPlot(self, intensity_data, error_data, x_axis):
+        self.sender.send(('display', 'setAveragedPlot', self.points.written, (intensity_data, error_data, x_axis)), key='setAveragedPlot')
+
+    def setFitPlot(self, fit_data, x_axis):
+        self.sender.send(('display', 'setFitPlot', self.points.written, (fit_data, x_axis)), key='setFitPlot')
+
+
+def write_samples(ring, data):
+    ''' Writes the raw sample blocks of a batch to the samples ring, one record of max_channels values per sample
+        (NaN for the channels that were not read).
+    '''
+    samples = np.concatenate([np.atleast_2d(block).T for block in data])
+    records = np.full((len(samples), ring.width), np.nan)
+    records[:, :samples.shape[1]] = samples
+    ring.write(records)
+
+
+class CoreHost:
+    ''' Runs an AutocorrelatorCore in the acquisition process and serves the GUI's commands until it closes. '''
+    def __init__(self, commands, events, points, samples, simulate=False, serve_port=None, state_interval=0.5):
+        self.commands = commands
+        self.sender = EventSender(events)
+        self.points = SharedRing(*points)
+        self.samples = SharedRing(*samples)
+        self.core = AutocorrelatorCore(simulate=simulate, display=SharedDisplay(self.sender, self.points))
+        self.core.sample_sink = lambda data: write_samples(self.samples, data)
+        self.state_interval = state_interval
+        self.lock = Lock() # so a state snapshot taken before a command is never sent after its reply
+        self.closed = Event()
+        self.server = None
+        if serve_port is not None:
+            from server import StreamServer
+            self.server = StreamServer(self.core, port=serve_port).start()
+
+    def run(self):
+        Thread(target=self.publish_state, daemon=True).start()
+        try:
+            while not self.closed.is_set():
+                try:
+                    request_id, command, args = self.commands.recv()
+                except EOFError:
+                    break # the GUI process exited without closing
+                with self.lock:
+                    try:
+                        result, error = getattr(self, f'command_{command}')(*args), None
+                    except Exception as exception:
+                        result, error = None, exception
+                    self.sender.discard('state')
+                    self.sender.send(('reply', request_id, result, error, self.core.snapshot()))
+        finally:
+            self.close()
+
+    def publish_state(self):
+        while not self.closed.wait(self.state_interval):
+            try:
+                with self.lock:
+                    self.sender.send(('state', self.core.snapshot()), key='state')
+            except Exception:
+                traceback.print_exc()
+
+    def close(self):
+        self.closed.set()
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        self.core.close()
+        self.sender.close()
+        self.points.close()
+        self.samples.close()
+
+    def command_acquire(self, settings):
+        self.core.acquire(settings)
+
+    def command_resume(self, directory):
+        self.core.resume(directory)
+
+    def command_stop(self):
+        self.core.stop_acquire()
+
+    def command_toggle_shutter(self):
+        self.core.toggle_shutter()
+
+    def command_move(self, position):
+        self.core.delay_stage.start_move(position)
+
+    def command_set_zero_position(self, position):
+        self.core.set_zero_position(position)
+
+    def command_close(self):
+        self.closed.set()
+
+
+def run_core(commands, events, points, samples, simulate, serve_port):
+    ''' Entry point of the acquisition process. '''
+    CoreHost(commands, events, points, samples, simulate, serve_port).run()
+
+
+class AcquisitionProcess:
+    ''' Acquisition core running in a child process, controlled from the GUI process.
+
+        Usage:  core = AcquisitionProcess(simulate=True, display=gui)
+                core.acquire(settings)
+                core.state['acquiring'], core.state['pulse_duration'] # snapshot of the core, see AutocorrelatorCore.snapshot
+                core.get_scan_time(settings)
+                core.latest_samples(1000) # raw samples, one column per channel
+                core.stop_acquire()
+                core.close()
+
+        Inputs :
+            simulate (bool): use the simulated hardware (see AutocorrelatorCore).
+            display: object receiving the plot updates in this process (see NullDisplay), called on a receiver thread.
+            serve_port (int): also stream the live data to local clients on this port (server.py), from the
+                acquisition process.
+            points_capacity (int): reduced points kept in shared memory for the display.
+            samples_capacity (int): raw samples kept in shared memory.
+            frame_interval (float): s between polls of the points for the display.
+            timeout (float): s to wait for the acquisition process to answer a command.
+    '''
+    def __init__(self, simulate=False, display=None, serve_port=None, points_capacity=2**18, samples_capacity=2**18,
+                 frame_interval=0.02, timeout=30.):
+        self.display = display if display is not None else NullDisplay()
+        self.frame_interval = frame_interval
+        self.timeout = timeout
+        self.points = SharedRing.create(points_capacity, 2)
+        self.samples = SharedRing.create(samples_capacity, max_channels)
+        self.count = 0 # points read for the display
+
+        # spawned rather than forked, as on Windows, so the child does not inherit the GUI's threads
+        context = multiprocessing.get_context('spawn')
+        child_commands, self.commands = context.Pipe(duplex=False)
+        self.events, child_events = context.Pipe(duplex=False)
+        self.process = context.Process(target=run_core, name='acquisition', args=(child_commands, child_events, self.points.spec, self.samples.spec, simulate, serve_port))
+        self.process.start()
+        child_commands.close()
+        child_events.close()
+
+        self.state = dict(initial_state)
+        self.lock = Lock() # of the command pipe
+        self.next_id = 1
+        self.replies = {} # request id: [Event, reply]
+        self.closed = False
+        self.receiver = Thread(target=self.__receive, daemon=True)
+        self.receiver.start()
+        atexit.register(self.close) # before multiprocessing waits for the child at exit
+
+    @property
+    def acquiring(self):
+        return self.state['acquiring']
+
+    @property
+    def settings(self):
+        return self.state['settings']
+
+    @property
+    def shutter_open(self):
+        return self.state['shutter_open']
+
+    def call(self, command, *args):
+        ''' Runs command_<command>(*args) of the CoreHost in the acquisition process and returns its result, raising
+            the exception it raised.
+        '''
+        if not self.process.is_alive():
+            raise RuntimeError('The acquisition process is not running.')
+        with self.lock:
+            request_id = self.next_id
+            self.next_id += 1
+            reply = self.replies[request_id] = [Event(), None]
+            self.commands.send((request_id, command, args))
+        if not reply[0].wait(self.timeout):
+            self.replies.pop(request_id, None)
+            raise TimeoutError(f'The acquisition process did not answer {command} within {self.timeout:.0f} s')
+        if reply[1] is None:
+            raise RuntimeError('The acquisition process exited.')
+        result, error = reply[1]
+        if error is not None:
+            raise error
+        return result
+
+    def __receive(self):
+        ''' Receives the acquisition process's messages and moves new points to the display. '''
+        while not self.closed:
+            try:
+                while self.events.poll(self.frame_interval):
+                    self.handle(self.events.recv())
+                self.read_points()
+            except (EOFError, OSError):
+                break # the acquisition process exited
+            except Exception:
+                traceback.print_exc()
+        self.state['acquiring'] = False
+        for reply in list(self.replies.values()):
+            reply[0].set()
+
+    def handle(self, message):
+        kind = message[0]
+        if kind == 'state':
+            self.state = message[1]
+        elif kind == 'reply':
+            _, request_id, result, error, self.state = message
+            reply = self.replies.pop(request_id, None)
+            if reply is not None:
+                reply[1] = result, error
+                reply[0].set()
+        elif kind == 'display':
+            _, method, count, args = message
+            self.read_points(count)
+            if method == 'clearIntensityPlot':
+                # points read ahead of the clear belong to the new acquisition, they are plotted again after it
+                self.count = count
+            getattr(self.display, method)(*args)
+
+    def read_points(self, until=None):
+        ''' Plots the points written since the last read (up to the count until). '''
+        count, records = self.points.read(self.count)
+        if until is not None and count > until:
+            records = records[:max(len(records) - (count - until), 0)]
+            count = until
+        self.count = max(count, self.count)
+        if len(records):
+            delays = records[:, 0]
+            self.display.appendIntensityPlot(records[:, 1], None if np.isnan(delays[0]) else delays)
+
+    def acquire(self, settings=None):
+        ''' Starts acquiring with settings in the acquisition process. Raises ValueError for invalid settings. '''
+        self.call('acquire', settings)
+
+    def resume(self, directory):
+        self.call('resume', directory)
+
+    def stop_acquire(self):
+        self.call('stop')
+
+    def toggle_shutter(self):
+        self.call('toggle_shutter')
+
+    def start_move(self, position):
+        ''' Moves the delay stage to position (mm) without waiting for it. '''
+        self.call('move', position)
+
+    def set_zero_position(self, position):
+        self.call('set_zero_position', position)
+
+    def delay_to_femto(self, delay_position):
+        c = 0.000299792 # mm/fs
+        return (delay_position - self.state['zero_position'])/c
+
+    def get_scan_time(self, settings):
+        ''' Predicted duration (s) of an acquisition with settings, None for Monitor (see AutocorrelatorCore.get_scan_time). '''
+        state = self.state
+        if state['scan_time_model'] is None:
+            return None
+        model = ScanTimeModel.from_dict(state['scan_time_model'])
+        return model.predict(settings, state['velocity'], state['acceleration'], state['sample_rate'], state['settle_time'], state['position'])
+
+    def latest_samples(self, n):
+        ''' The last n raw samples acquired, shape (n, channels read). '''
+        samples = self.samples.latest(n)
+        return samples[:, ~np.isnan(samples).all(axis=0)]
+
+    def close(self, timeout=30.):
+        ''' Stops acquiring and closes the core and the acquisition process. '''
+        if self.closed:
+            return
+        try:
+            self.call('close')
+        except (RuntimeError, TimeoutError, OSError) as error:
+            print(f'Could not close the acquisition process: {error}')
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.closed = True
+        self.receiver.join(1.)
+        self.commands.close()
+        self.events.close()
+        self.points.close()
+        self.points.unlink()
+        self.samples.close()
+        self.samples.unlink()
+        atexit.unregister(self.close)
+
+
+if __name__ == '__main__':
+    # Acquires a simulated scan in the acquisition process and prints its state
+    from core import default_settings
+
+    core = AcquisitionProcess(simulate=True)
+    settings = default_settings()
+    settings.update({'scan start': 12.4, 'scan end': 12.6, 'scan step': 0.002, 'samples': 20}) # around the simulated zero delay, 12.5 mm
+    core.acquire(settings)
+    while core.acquiring:
+        time.sleep(0.5)
+        print(f"{core.count} points, throughput {core.state['throughput']}")
+    print(f"Pulse duration: {core.state['pulse_duration']} fs, {len(core.latest_samples(1000))} raw samples")
+    core.close()
@@ -2,8 +2,12 @@
     NI DAQmx Documentation: https://documentation.help/NI-DAQmx-C-Functions/
     PyDAQmx  Documentation: https://pythonhosted.org/PyDAQmx/
 '''
+import time
+
 import numpy as np
 
+from blocks import BlockPool, count_channels
+
 try:
     import PyDAQmx as pdmx
 except:
@@ -13,10 +17,14 @@ except:
 class AnalogInput:
     def __init__(self, channel_name, voltage_min=-10., voltage_max=10., clock_rate=5000000, mode='continuous', samples_per_channel=1, source=None, trigger=None, offset=0):
         ''' Maximum clock rate is 5 MHz for analog input channels. Samples per channel should be no more than 1/10 clock rate.
+            channel_name may list several physical channels (i.e. 'Dev1/ai2, Dev1/ai3', 'Dev1/ai2:3' or a list), which are
+            sampled together in one task.
         '''
         assert mode in ['continuous', 'finite']
+        if not isinstance(channel_name, str):
+            channel_name = ', '.join(channel_name)
         self.channel_name = channel_name
-        self.number_of_channels = 1
+        self.number_of_channels = count_channels(channel_name)
         self.voltage_min = voltage_min
         self.voltage_max = voltage_max
         self.clock_rate = int(clock_rate)
@@ -26,6 +34,8 @@ class AnalogInput:
         self.trigger = trigger
         self.offset = offset
         self.task_started = False
+        self.pool = None
+        self.stream_start_time = None
 
         self.task = pdmx.Task()
         self.__configure_task()
@@ -75,7 +85,7 @@ class AnalogInput:
                 timeout (float): time to wait before stopping task. 
 
             Returns :
-                read_data: 1D numpy array containing read data
+                read_data: 1D numpy array containing read data, or a (channels, samples) array for several channels
         '''
         if not samples_per_channel:
             samples_per_channel = self.samples_per_channel
@@ -84,18 +94,91 @@ class AnalogInput:
 
         self.start()
 
-        read_array = np.zeros(samples_per_channel, dtype=np.float64)
+        read_array = np.zeros(self.block_shape(samples_per_channel), dtype=np.float64)
         self.task.ReadAnalogF64(
             numSampsPerChan=samples_per_channel,
             timeout=timeout,
             fillMode=pdmx.DAQmx_Val_GroupByChannel,
             readArray=read_array,
-            arraySizeInSamps=samples_per_channel,
+            arraySizeInSamps=read_array.size,
             sampsPerChanRead=None,
             reserved=None
         )
         return read_array
 
+    def block_shape(self, samples_per_channel):
+        ''' Shape of the array returned for a read of samples_per_channel samples. '''
+        if self.number_of_channels == 1:
+            return (samples_per_channel,)
+        return (self.number_of_channels, samples_per_channel)
+
+    def stream(self, samples_per_block, number_of_buffers=32, auto_release=True, timeout=10):
+        ''' Starts a callback-driven continuous acquisition and returns a generator of (block index, data) blocks.
+
+            An every-N-samples DAQmx callback reads each block into a buffer from a pool of preallocated arrays, so
+            neither the callback nor the consumer allocate memory and the consumer never waits on a read round trip.
+            Block indices count sample clock blocks since stream_start_time, including blocks dropped because every
+            buffer was still in use (see pool.dropped).
+
+            Inputs :
+                samples_per_block (int): samples per channel in each block.
+                number_of_buffers (int): size of the buffer pool.
+                auto_release (bool): if True a buffer is returned to the pool when the generator resumes, so the
+                    consumer must copy data it keeps. Otherwise the consumer calls release(data) when done with it.
+                timeout (float): time to wait for a block before raising.
+        '''
+        assert self.mode == 'continuous', 'Streaming needs a continuous task.'
+        samples_per_block = int(samples_per_block)
+        self.stop()
+        self.pool = BlockPool(number_of_buffers, self.block_shape(samples_per_block))
+        self.__block_index = 0
+
+        def callback(task_handle, event_type, number_of_samples, callback_data):
+            buffer = self.pool.take()
+            self.task.ReadAnalogF64(
+                numSampsPerChan=samples_per_block,
+                timeout=timeout,
+                fillMode=pdmx.DAQmx_Val_GroupByChannel,
+                readArray=buffer,
+                arraySizeInSamps=buffer.size,
+                sampsPerChanRead=None,
+                reserved=None
+            )
+            self.pool.publish(self.__block_index, buffer)
+            self.__block_index += 1
+            return 0
+
+        self.__callback = pdmx.DAQmxEveryNSamplesEventCallbackPtr(callback) # keep a reference so it is not garbage collected
+        self.task.CfgInputBuffer(samples_per_block*max(number_of_buffers, 8))
+        self.task.RegisterEveryNSamplesEvent(pdmx.DAQmx_Val_Acquired_Into_Buffer, samples_per_block, 0, self.__callback, None)
+        self.start()
+        self.stream_start_time = time.perf_counter()
+        return self.__blocks(self.pool, auto_release, timeout)
+
+    def __blocks(self, pool, auto_release, timeout):
+        try:
+            while True:
+                item = pool.get(timeout=timeout)
+                if item is None:
+                    return
+                yield item
+                if auto_release:
+                    pool.release(item[1])
+        finally:
+            self.stop_stream()
+
+    def release(self, data):
+        ''' Returns a streamed block to the buffer pool. '''
+        if self.pool is not None:
+            self.pool.release(data)
+
+    def stop_stream(self):
+        if self.pool is not None:
+            self.stop()
+            self.task.RegisterEveryNSamplesEvent(pdmx.DAQmx_Val_Acquired_Into_Buffer, 0, 0, None, None) # unregisters the callback
+            self.pool.close()
+            self.pool = None
+
     def start(self):
         ''' Preferred way to start the task. '''
         if not self.task_started:
@@ -174,7 +257,23 @@ if __name__ == '__main__':
         print(f'Time: {end_time - start_time}')
 
 
+    def test_streaming():
+        ''' Same acquisition as test_on_demand_sampling using the callback-driven stream in blocks of 100 samples. '''
+        clock_rate = 1000 # samples per second
+        number_of_samples = 5000 # samples
+        data = np.zeros(number_of_samples)
+        ai = AnalogInput('Dev1/ai3', clock_rate=clock_rate, mode='continuous')
+        for index, block in ai.stream(samples_per_block=100):
+            data[100*index:100*(index + 1)] = block
+            if index == number_of_samples//100 - 1: break
+        ai.clear()
+
+        plt.figure()
+        plt.plot(data)
+        plt.show()
+
     # test_analog_input()
     test_on_demand_sampling()
+    # test_streaming()
     # benchmark_read_speed()
 
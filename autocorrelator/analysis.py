@@ -0,0 +1,325 @@
+''' Pulse width analysis of autocorrelation traces.
+
+    Fits the intensity autocorrelations of sech^2 and Gaussian pulses with a vectorized Levenberg-Marquardt
+    solver (analytic Jacobians, no scipy) and deconvolves the autocorrelation FWHM to the pulse duration.
+    Delays are in femtoseconds (see Autocorrelator.delay_to_femto).
+'''
+import numpy as np
+
+
+# Ratio of pulse duration to autocorrelation FWHM for each pulse shape
+deconvolution_factors = {
+    'sech2': 0.6482,
+    'gaussian': 0.7071,
+}
+
+
+def sech2(t, duration):
+    return 1/np.cosh(1.76*t/duration)**2
+
+
+# x at which the sech^2 intensity autocorrelation is halved, times 2: x = sech2_scale*delay/FWHM
+sech2_scale = 2.7196
+
+
+def sech2_autocorrelation(x):
+    ''' Intensity autocorrelation of a sech^2 pulse, 3*(x*coth(x) - 1)/sinh(x)^2, and its derivative.
+        Written in terms of exp(-2|x|) so it neither overflows nor loses precision near 0.
+    '''
+    a = np.abs(x)
+    e = np.exp(-2*a)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coth = (1 + e)/(1 - e)
+        csch2 = 4*e/(1 - e)**2 # 1/sinh^2
+        small = a < 0.1 # Taylor series where the closed form cancels
+        a2 = a**2
+        value = np.where(small, 1 - a2*(2/5 - a2*(2/21 - a2*4/225)), 3*(a*coth - 1)*csch2)
+        derivative = np.where(small, -a*(4/5 - a2*(8/21 - a2*24/225)), 3*(coth - a*csch2)*csch2 - 2*coth*value)
+    return value, np.sign(x)*derivative
+
+
+def sech2_model(t, amplitude, center, width, offset):
+    return offset + amplitude*sech2_autocorrelation(sech2_scale*(t - center)/width)[0]
+
+
+def sech2_jacobian(t, amplitude, center, width, offset):
+    u = sech2_scale*(t - center)/width
+    s, ds = sech2_autocorrelation(u)
+    ds = -amplitude*ds # -d(amplitude*s)/du
+    return np.column_stack((s, ds*sech2_scale/width, ds*u/width, np.ones_like(t)))
+
+
+def gaussian_model(t, amplitude, center, width, offset):
+    return offset + amplitude*np.exp(-4*np.log(2)*(t - center)**2/width**2)
+
+
+def gaussian_jacobian(t, amplitude, center, width, offset):
+    a = 4*np.log(2)
+    g = np.exp(-a*(t - center)**2/width**2)
+    dg = 2*a*amplitude*g*(t - center)/width**2
+    return np.column_stack((g, dg, dg*(t - center)/width, np.ones_like(t)))
+
+
+models = {
+    'sech2': (sech2_model, sech2_jacobian),
+    'gaussian': (gaussian_model, gaussian_jacobian),
+}
+
+
+class FitResult:
+    ''' Result of an autocorrelation fit. Parameters are (amplitude, center, width, offset) with width the autocorrelation FWHM. '''
+    def __init__(self, model, params, covariance, residual, iterations, success):
+        self.model = model
+        self.params = params
+        self.covariance = covariance
+        self.residual = residual
+        self.iterations = iterations
+        self.success = success
+
+    @property
+    def errors(self):
+        return np.sqrt(np.abs(np.diag(self.covariance)))
+
+    @property
+    def autocorrelation_fwhm(self):
+        return abs(self.params[2])
+
+    @property
+    def pulse_duration(self):
+        return deconvolution_factors[self.model]*self.autocorrelation_fwhm
+
+    @property
+    def pulse_duration_error(self):
+        return deconvolution_factors[self.model]*self.errors[2]
+
+    def evaluate(self, t):
+        return models[self.model][0](np.asarray(t, dtype=np.float64), *self.params)
+
+    def __repr__(self):
+        return f'FitResult({self.model}, pulse duration = {self.pulse_duration:.1f} +/- {self.pulse_duration_error:.1f} fs)'
+
+
+def initial_guess(t, y):
+    ''' Estimates (amplitude, center, width, offset) from the half maximum crossings of the trace. '''
+    offset = np.percentile(y, 10)
+    peak = np.argmax(y)
+    amplitude = y[peak] - offset
+    above = t[y - offset > amplitude/2]
+    width = above.max() - above.min() if len(above) > 1 else (t.max() - t.min())/10
+    return np.array([amplitude, t[peak], max(width, np.abs(np.diff(t)).min() if len(t) > 1 else 1.), offset])
+
+
+def fit(t, y, model='sech2', initial=None, max_iterations=100, tolerance=1e-8, min_significance=5.):
+    ''' Levenberg-Marquardt least squares fit of an autocorrelation model.
+
+        Inputs :
+            t (array): delays (fs).
+            y (array): intensities.
+            model (str): 'sech2' or 'gaussian'.
+            initial (array): starting parameters, e.g. a previous fit (default estimates them from the trace).
+            min_significance (float): the fit only succeeds if the amplitude is this many standard errors above 0.
+
+        Returns :
+            FitResult
+    '''
+    function, jacobian = models[model]
+    t = np.asarray(t, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    params = initial_guess(t, y) if initial is None else np.array(initial, dtype=np.float64)
+
+    residuals = y - function(t, *params)
+    cost = np.dot(residuals, residuals)
+    damping = 1e-3
+    success = False
+    for iteration in range(1, max_iterations + 1):
+        J = jacobian(t, *params)
+        JTJ = J.T @ J
+        gradient = J.T @ residuals
+        try:
+            step = np.linalg.solve(JTJ + damping*np.diag(np.diag(JTJ) + 1e-12), gradient)
+        except np.linalg.LinAlgError:
+            break
+        trial = params + step
+        trial_residuals = y - function(t, *trial)
+        trial_cost = np.dot(trial_residuals, trial_residuals)
+        if trial_cost < cost:
+            converged = cost - trial_cost <= tolerance*cost or np.all(np.abs(step) <= tolerance*(np.abs(params) + tolerance))
+            params, residuals, cost = trial, trial_residuals, trial_cost
+            damping = max(damping/3, 1e-12)
+            if converged:
+                success = True
+                break
+        else:
+            damping *= 3
+            if damping > 1e12:
+                success = True # no further improvement possible
+                break
+
+    dof = max(len(t) - len(params), 1)
+    try:
+        covariance = np.linalg.inv(JTJ)*cost/dof
+    except np.linalg.LinAlgError:
+        covariance = np.full((len(params), len(params)), np.inf)
+    # a fit to noise converges to a dip, a peak wider than the scan or a bump no larger than the noise
+    significant = params[0] > min_significance*np.sqrt(abs(covariance[0, 0]))
+    success = success and significant and 0 < params[2] < np.ptp(t) and t.min() <= params[1] <= t.max()
+    return FitResult(model, params, covariance, cost, iteration, success)
+
+
+class FringeAnalysis:
+    ''' Components of an interferometric (fringe-resolved) autocorrelation on its delay grid (fs).
+
+        dc: low-pass component, i.e. the background plus intensity autocorrelation.
+        envelope: amplitude of the fringes at the carrier frequency.
+        contrast: envelope relative to the low-pass component.
+        carrier_frequency: fringe frequency (1/fs).
+    '''
+    def __init__(self, delay, dc, envelope, carrier_frequency):
+        self.delay = delay
+        self.dc = dc
+        self.envelope = envelope
+        self.carrier_frequency = carrier_frequency
+
+    @property
+    def contrast(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.dc != 0, self.envelope/self.dc, 0.)
+
+
+def fringe_envelope(delay, signal, wavelength=None):
+    ''' Separates an interferometric autocorrelation into its low-pass component and fringe envelope using the analytic signal.
+
+        The spectrum is split at half the carrier frequency: everything below is the low-pass (intensity autocorrelation)
+        component, and the band around the carrier is converted to an analytic signal whose magnitude is the fringe envelope.
+        Non-uniformly spaced or unsorted delays are resampled onto a uniform grid first.
+
+        Inputs :
+            delay (array): delays (fs).
+            signal (array): detector signal.
+            wavelength (float): central wavelength (nm). Default detects the carrier from the spectrum.
+
+        Returns :
+            FringeAnalysis on the (sorted) input delays
+    '''
+    delay = np.asarray(delay, dtype=np.float64)
+    signal = np.asarray(signal, dtype=np.float64)
+    order = np.argsort(delay, kind='stable')
+    delay, signal = delay[order], signal[order]
+
+    steps = np.diff(delay)
+    step = np.median(steps[steps > 0])
+    uniform = np.allclose(steps, step, rtol=1e-2)
+    if uniform:
+        grid, values = delay, signal
+    else:
+        grid = np.arange(delay[0], delay[-1] + step/2, step)
+        values = np.interp(grid, delay, signal)
+
+    n = len(values)
+    size = 1 << int(np.ceil(np.log2(n))) # power of two FFT length
+    padded = np.pad(values, (0, size - n), mode='edge')
+    spectrum = np.fft.fft(padded)
+    frequencies = np.fft.fftfreq(size, d=step)
+
+    if wavelength is None:
+        # weighting by frequency suppresses the low-pass band so the strongest remaining peak is the carrier
+        positive = slice(3, size//2)
+        carrier = abs(frequencies[positive][np.argmax(np.abs(spectrum[positive])*frequencies[positive])])
+    else:
+        carrier = 299.792458/wavelength # c in nm/fs
+
+    magnitude = np.abs(frequencies)
+    dc = np.fft.ifft(np.where(magnitude < carrier/2, spectrum, 0.)).real[:n]
+    band = (frequencies > carrier/2) & (frequencies < 3*carrier/2)
+    envelope = 2*np.abs(np.fft.ifft(np.where(band, spectrum, 0.))[:n])
+
+    if not uniform:
+        dc = np.interp(delay, grid, dc)
+        envelope = np.interp(delay, grid, envelope)
+    return FringeAnalysis(delay, dc, envelope, carrier)
+
+
+class IncrementalFitter:
+    ''' Keeps the points of a running scan and refits as they arrive, warm-started from the previous fit.
+
+        Usage:  fitter = IncrementalFitter('sech2')
+                result = fitter.update(delays, intensities) # returns None until enough points arrived
+
+        With fringe_resolved=True the model is fitted to the low-pass component of the interferometric trace.
+    '''
+    def __init__(self, model='sech2', min_points=10, max_iterations=20, fringe_resolved=False):
+        self.model = model
+        self.fringe_resolved = fringe_resolved
+        self.min_points = min_points
+        self.max_iterations = max_iterations
+        self.t = np.empty(1024)
+        self.y = np.empty(1024)
+        self.length = 0
+        self.result = None
+
+    def add_points(self, t, y):
+        t = np.asarray(t, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+        end = self.length + len(t)
+        if end > len(self.t):
+            size = max(2*len(self.t), end)
+            self.t = np.resize(self.t, size)
+            self.y = np.resize(self.y, size)
+        self.t[self.length:end] = t
+        self.y[self.length:end] = y
+        self.length = end
+
+    def update(self, t=(), y=()):
+        ''' Adds points and refits. Returns the latest FitResult or None. '''
+        self.add_points(t, y)
+        if self.length < self.min_points:
+            return None
+        t, y = self.t[:self.length], self.y[:self.length]
+        if self.fringe_resolved:
+            fringes = fringe_envelope(t, y)
+            t, y = fringes.delay, fringes.dc
+        initial = self.result.params if self.result is not None and self.result.success else None
+        result = fit(t, y, self.model, initial=initial, max_iterations=self.max_iterations)
+        if not result.success and initial is not None:
+            result = fit(t, y, self.model, max_iterations=self.max_iterations) # previous fit was a poor start, start over
+        self.result = result
+        return result
+
+    def clear(self):
+        self.length = 0
+        self.result = None
+
+
+def analyze_scan(path, zero_position, model='sech2', fringes=False):
+    ''' Fits a saved scan (intensities.npy). With fringes=True the fringe envelope is saved next to it as *_fringes.npy.
+
+        Returns :
+            FitResult
+    '''
+    from storage import load_scan
+
+    data = load_scan(path)
+    delays = (data[:, 0] - zero_position)/0.000299792
+    intensities = data[:, 1]
+    if fringes:
+        fringes = fringe_envelope(delays, intensities)
+        output = path[:-len('.npy')] + '_fringes.npy'
+        np.save(output, np.column_stack((fringes.delay, fringes.dc, fringes.envelope, fringes.contrast)))
+        print(f'Carrier: {1/fringes.carrier_frequency:.2f} fs period. Saved delay (fs), dc, envelope, contrast to {output}')
+        delays, intensities = fringes.delay, fringes.dc
+    return fit(delays, intensities, model)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Fits a saved autocorrelation scan.')
+    parser.add_argument('path', help='intensities.npy of a saved run')
+    parser.add_argument('zero_position', type=float, help='stage position of zero delay (mm)')
+    parser.add_argument('--model', default='sech2', choices=list(models))
+    parser.add_argument('--fringes', action='store_true', help='interferometric trace: fit the low-pass component and save the fringe envelope')
+    args = parser.parse_args()
+
+    result = analyze_scan(args.path, args.zero_position, args.model, args.fringes)
+    print(result)
+    print(f'Autocorrelation FWHM: {result.autocorrelation_fwhm:.1f} fs')
@@ -1,63 +1,40 @@
-import os
 import sys
-import time
 import traceback
-from threading import Thread
 
 import numpy as np
 from PyQt5 import QtCore, QtWidgets, QtGui
 
 from gui.gui import AutocorrelatorGUI
-from delay_controller import DelayStageController
-from analog_input import AnalogInput
+from acquisition_process import AcquisitionProcess
+from timing import format_duration, histogram_bins
 
-try:
-    import mcc
-    mcc_loaded = True
-    print('MCC loaded properly')
-except:
-    mcc_loaded = False
-    print('MCC failed to load')
 
 class Autocorrelator:
-    def __init__(self):
-        ''' Autocorrelator application. 
+    def __init__(self, simulate=False, serve_port=None):
+        ''' Autocorrelator application.
 
         Usage:  Autocorrelator = Autocorrelator()
-        
+
+        With simulate=True the delay stage, DAQ and MCC device are replaced by the simulated backends in simulator.py.
+        The acquisition itself runs in AutocorrelatorCore (core.py), in its own process (acquisition_process.py) so
+        rendering cannot delay it; the GUI only passes settings in and shows results.
+        With serve_port the live data is also streamed to local clients on that port (server.py, client.py).
+
         '''
-        self.path = os.path.dirname(os.path.abspath(__file__))
         self.app = QtWidgets.QApplication(sys.argv)
         self.gui = AutocorrelatorGUI()
-        self.settings = self.gui.getSettings()        
-        self.acquiring = False
-
-        self.delay_stage_serial_port = 'COM5'
-        self.delay_stage = DelayStageController(self.delay_stage_serial_port)
-
-        self.sensor_channel = 'Dev1/ai2'
-        self.sample_rate = 1000
-
-        self.zero_position = 0.000
-        self.intensities = []
+        self.settings = self.gui.getSettings()
+        self.core = AcquisitionProcess(simulate=simulate, display=self.gui, serve_port=serve_port)
 
-        if mcc_loaded:
-            self.mcc_model = '3101'
-            self.MCC = mcc.MCCDev(model=self.mcc_model)
-            self.shutter = 1 # pump shutter channel
-            # self.shutter = 2 # stokes shutter channel
-            self.close_shutter()
-        
         self.setup_signals()
-        sys.exit(self.app.exec_())
 
-    
+
     def __del__(self):
-        self.close_shutter()
-        self.sensor.clear()
+        self.core.close()
 
     def setup_signals(self):
         self.gui.ui.acquireButton.clicked.connect(self.acquire_toggle)
+        self.gui.ui.resumeButton.clicked.connect(self.resume)
         self.gui.signal.update.connect(self.update)
         self.gui.signal.close.connect(self.gui_closed)
 
@@ -65,171 +42,123 @@ class Autocorrelator:
         self.gui.ui.shutterButton.clicked.connect(self.toggle_shutter)
 
         # Delay stage position button
-        self.gui.ui.delaySelectButton.clicked.connect(lambda: self.delay_stage.set_position(self.gui.ui.delaySelectWidget.value()))
+        self.gui.ui.delaySelectButton.clicked.connect(lambda: self.core.start_move(self.gui.ui.delaySelectWidget.value()))
 
         # Change zero poisition
-        self.gui.ui.delayZeroButton.clicked.connect(lambda: self.set_zero_position(self.gui.ui.delayZeroWidget.value()))
+        self.gui.ui.delayZeroButton.clicked.connect(lambda: self.core.set_zero_position(self.gui.ui.delayZeroWidget.value()))
 
 
     def update(self):
         ''' Update config based on gui settings. '''
+        core = self.core
+        state = core.state # latest snapshot of the acquisition process
         # Update settings
         self.settings = self.gui.getSettings()
 
-        # Update estimated scan times
-        scan_time = self.get_scan_time(self.settings['scan start'], self.settings['scan end'], self.settings['scan step'], self.settings['samples'])
-        self.gui.ui.estimatedScanTimeLabel.setText(f'Estimated Scan Time: {scan_time} seconds')
-
-        # Update current delay stage position
-        delay_position = self.delay_stage.get_position()
-        self.gui.ui.delayStagePosition.setText(f'{delay_position:.3f} mm ({self.delay_to_femto(delay_position):.0f} fs)')
+        # Update estimated scan time (adaptive scans usually stop before covering the full range)
+        scan_time = core.get_scan_time(self.settings)
+        if scan_time is None:
+            self.gui.ui.estimatedScanTimeLabel.setText('Estimated Scan Time: -')
+        else:
+            bound = 'up to ' if self.settings['scan mode'] == 'Adaptive Scan' else ''
+            self.gui.ui.estimatedScanTimeLabel.setText(f'Estimated Scan Time: {bound}{format_duration(scan_time)}')
+
+        # Update measured throughput, remaining time and phase timing histograms
+        if state['acquiring']:
+            throughput = state['throughput']
+            remaining = state['remaining_time']
+            throughput_text = f'{throughput:.1f}' if throughput is not None else '-'
+            remaining_text = format_duration(remaining) if remaining is not None else '-'
+            self.gui.ui.timingLabel.setText(f'Throughput: {throughput_text} points/s   Remaining: {remaining_text}')
+            self.gui.setTimingPlot(state['timing'], histogram_bins)
+
+        # Update current delay stage position (cached by the stage service, no serial I/O)
+        if state['stage'] == 'ready':
+            delay_position = state['position']
+            self.gui.ui.delayStagePosition.setText(f'{delay_position:.3f} mm ({core.delay_to_femto(delay_position):.0f} fs)')
+        else:
+            self.gui.ui.delayStagePosition.setText('Not connected' if state['stage'] == 'failed' else 'Connecting...')
 
         # Update selected delay stage position femtoseconds calculations
-        self.gui.ui.delaySelectFemto.setText(f'{self.delay_to_femto(self.gui.ui.delaySelectWidget.value()):.0f} fs')
+        self.gui.ui.delaySelectFemto.setText(f'{core.delay_to_femto(self.gui.ui.delaySelectWidget.value()):.0f} fs')
 
         # Update scan values femtoseconds calculations
-        self.gui.ui.scanStartFemto.setText(f'{self.delay_to_femto(self.gui.ui.scanStartWidget.value()):.0f} fs')
-        self.gui.ui.scanEndFemto.setText(f'{self.delay_to_femto(self.gui.ui.scanEndWidget.value()):.0f} fs')
+        self.gui.ui.scanStartFemto.setText(f'{core.delay_to_femto(self.gui.ui.scanStartWidget.value()):.0f} fs')
+        self.gui.ui.scanEndFemto.setText(f'{core.delay_to_femto(self.gui.ui.scanEndWidget.value()):.0f} fs')
         self.gui.ui.scanStepFemto.setText(f'{self.gui.ui.scanStepWidget.value()/0.000299792:.0f} fs')
 
-    def gui_closed(self):
-        # Stop everything
-        self.acquiring = False
-        # self.app.quit()
-
-    def save_settings(fname, settings):
-        with open(fname, 'w') as file:
-            for key, value in settings.items():
-                file.write(f'{key} = {value}\n')
+        # Update acquisition and shutter state
+        self.gui.ui.acquireButton.setText('Stop' if state['acquiring'] else 'Acquire')
+        self.gui.ui.shutterStatusLabel.setText('Open' if state['shutter_open'] else 'Closed')
 
-    def delay_to_femto(self, delay_position):
-        c = 0.000299792 # mm/fs
-        return (delay_position - self.zero_position)/c
+        # Update rolling monitor statistics
+        monitor = state['monitor']
+        if monitor is not None:
+            self.gui.ui.monitorStatsLabel.setText(f"Mean: {monitor['mean']:.4f} V   Std: {monitor['std']:.4f} V   Min: {monitor['min']:.4f} V   Max: {monitor['max']:.4f} V")
 
-    def set_zero_position(self, position):
-        self.zero_position = position
+        # Update pulse duration from the latest fit
+        if state['pulse_duration'] is not None:
+            self.gui.ui.fitLabel.setText(f"Pulse Duration: {state['pulse_duration']:.1f} \u00b1 {state['pulse_duration_error']:.1f} fs")
 
-    def get_scan_time(self, start, stop, step, samples_per_point, time_per_sample=0.001):
-        return ((stop-start)/step+1)*samples_per_point*time_per_sample
+        # Update the lock-in phase of the latest point
+        if state['lock_in_phase'] is not None:
+            reference = 'chopper' if self.settings['lock-in reference'] else 'block start'
+            self.gui.ui.phaseLabel.setText(f"Lock-in Phase: {np.degrees(state['lock_in_phase']):.1f}\u00b0 (relative to {reference})")
+        else:
+            self.gui.ui.phaseLabel.setText('Lock-in Phase: -')
 
-    def open_shutter(self):
-        if mcc_loaded:
-            self.MCC.set_digital_out(0, self.shutter)
-            self.shutter_open = True
-            self.gui.ui.shutterStatusLabel.setText('Open')
+        # Update the backlash estimated from the forward and reverse sweeps of a bidirectional repeated scan
+        if state['backlash'] is not None:
+            self.gui.ui.backlashLabel.setText(f"Backlash: {1000*state['backlash']:.2f} \u00b5m ({state['backlash']/0.000299792:.1f} fs)")
 
-    def close_shutter(self):
-        if mcc_loaded:
-            self.MCC.set_digital_out(1, self.shutter)
-            self.shutter_open = False
-            self.gui.ui.shutterStatusLabel.setText('Closed')
+    def gui_closed(self):
+        # Stop everything
+        self.core.stop_acquire()
+        # self.app.quit()
 
     def toggle_shutter(self):
-        if self.shutter_open:
-            self.close_shutter()
-        else:
-            self.open_shutter()
+        self.core.toggle_shutter()
+        self.gui.ui.shutterStatusLabel.setText('Open' if self.core.shutter_open else 'Closed')
 
     def acquire_toggle(self):
-        if not self.acquiring:
+        if not self.core.acquiring:
             self.acquire()
-        elif self.acquiring:
+        else:
             self.stop_acquire()
 
     def acquire(self):
-        self.acquiring = True
         self.gui.ui.acquireButton.setText('Stop')
         if self.gui.display is None:
                 self.gui.createDisplayPanel()
-        
         self.settings = self.gui.getSettings()
+        try:
+            self.core.acquire(self.settings)
+        except (ValueError, RuntimeError) as error: # invalid settings, or a remote job started first
+            print(f'Cannot acquire: {error}')
+            self.gui.ui.acquireButton.setText('Acquire')
+
+    def resume(self, directory=None):
+        ''' Resumes an interrupted scan from the save directory selected in a dialog. '''
+        if self.core.acquiring:
+            return
+        if directory is None:
+            directory = QtWidgets.QFileDialog.getExistingDirectory(caption='Select the directory of the interrupted scan', directory=self.gui.ui.directoryText.text())
+            if not directory:
+                return
+        if self.gui.display is None:
+                self.gui.createDisplayPanel()
+        try:
+            self.core.resume(directory)
+        except (OSError, ValueError, KeyError) as error:
+            print(f'Cannot resume {directory}: {error}')
+            return
+        self.settings = self.core.settings
+        self.gui.ui.acquireButton.setText('Stop')
 
-        if self.settings['save']:
-            # Create save directory
-            self.save_time = time.strftime("%Y_%m_%d_%H%M%S", time.gmtime())
-            self.save_directory = f"{self.settings['directory']}/{self.settings['filename']}_{self.save_time}"
-            os.mkdir(self.save_directory)
-            
-            # Save settings
-            self.save_settings(f'{self.save_directory}/settings.txt', self.settings)
-
-            # Create csv for average intensities
-            np.savetxt(f'{self.save_directory}/intensities.csv', [], delimiter=',', header='delay (mm), intensity (V)')
-        
-        scan_mode = self.settings['scan mode']
-
-        if scan_mode == 'Scan':
-            scan_thread = Thread(target=self.acquire_scan)
-            scan_thread.deamon = True
-            scan_thread.start()
-        
-        elif scan_mode == 'Monitor':
-            monitor_thread = Thread(target=self.acquire_monitor)
-            monitor_thread.deamon = True
-            monitor_thread.start()
-            
-
-    def acquire_scan(self):
-        print('Scanning...')
-        self.intensities = []
-        self.sensor = AnalogInput(self.sensor_channel, clock_rate=self.sample_rate, mode='continuous')
-        # Calculate scan points
-        start = self.settings['scan start']
-        end   = self.settings['scan end']
-        step  = self.settings['scan step']
-        samples = int(self.settings['samples'])
-        if end < start:
-            step = -1*step
-        delay_positions = np.arange(start, end+step, step)
-        ### initiate scan
-        for position in delay_positions:
-            try:
-                self.delay_stage.set_position(position)
-                data = self.sensor.read(samples_per_channel=samples)
-                intensity = np.mean(data)
-                self.intensities.append(intensity)
-                self.gui.updateIntensityPlot(self.intensities)
-                if self.settings['save']:
-                    with open(f'{self.save_directory}/intensities.csv', 'a') as file:
-                        # append intensity to csv
-                        np.savetxt(file, [position, intensity], delimiter=',')
-                if not self.acquiring: break
-            except:
-                break
-        self.sensor.stop()
-        self.sensor.clear()
-        self.stop_acquire()
-        print('scan finished')
-
-    def acquire_monitor(self):
-        print('Monitoring...')
-        self.intensities = []
-        self.sensor = AnalogInput(self.sensor_channel, clock_rate=self.sample_rate, mode='continuous')
-        samples = int(self.settings['samples'])
-        while self.acquiring:
-            try:
-                data = self.sensor.read(samples_per_channel=samples)
-                intensity = np.mean(data)
-                self.intensities.append(intensity)
-                self.gui.updateIntensityPlot(self.intensities)
-                if self.settings['save']:
-                    with open(f'{self.save_directory}/intensities.csv', 'a') as file:
-                        # append intensity to csv
-                        np.savetxt(file, [self.delay_stage.get_position(), intensity], delimiter=',')
-            except KeyboardInterrupt:
-                break
-        self.sensor.stop()
-        self.sensor.clear()
-        self.stop_acquire()
-        print('Finished monitoring.')
-            
     def stop_acquire(self):
-        self.acquiring = False
+        self.core.stop_acquire()
         self.gui.ui.acquireButton.setText('Acquire')
 
-    def clear_data(self):
-        self.intensities = []
-
 def handle_exception(exc_type, exc_value, exc_traceback):
         ''' Prints error that crashed application. '''
         print("".join(traceback.format_exception(exc_type, exc_value, exc_traceback)))
@@ -237,7 +166,7 @@ def handle_exception(exc_type, exc_value, exc_traceback):
 
 def main():
     sys.excepthook = handle_exception
-    
+
     ############ Code required for custom application icon in taskbar ############
     import ctypes
     import os
@@ -245,8 +174,15 @@ def main():
     if os.name == "nt":
         ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
     ##############################################################################
-    
-    autocorrelator = Autocorrelator()
+
+    # --serve [port] streams the live data to local clients
+    serve_port = None
+    if '--serve' in sys.argv:
+        arguments = sys.argv[sys.argv.index('--serve') + 1:]
+        serve_port = int(arguments[0]) if arguments and arguments[0].isdigit() else 8765
+
+    autocorrelator = Autocorrelator(simulate='--simulate' in sys.argv, serve_port=serve_port)
+    sys.exit(autocorrelator.app.exec_())
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
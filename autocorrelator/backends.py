@@ -0,0 +1,99 @@
+''' Lazily loaded hardware backends.
+
+    Importing a driver package (zaber_motion, PyDAQmx, mcculw) and connecting to its device can take seconds.
+    The registry runs each backend's factory, which does its own imports, on a background thread the first
+    time it is needed, all backends in parallel, so the GUI comes up before any hardware is ready.
+'''
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Backend:
+    ''' A hardware backend created by factory() on first use.
+
+        Usage:  backend = Backend('stage', lambda: DelayStageController('COM5'))
+                backend.connect()   # starts connecting in the background
+                backend.ready       # True once connected
+                stage = backend.get() # blocks until connected, raises the connection error if it failed
+    '''
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.future = None
+        self.connect_time = None # s taken by factory()
+
+    def connect(self, executor=None):
+        ''' Starts creating the backend unless already started. Returns a concurrent.futures.Future. '''
+        if self.future is None:
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+            self.future = executor.submit(self.__create)
+        return self.future
+
+    def get(self, timeout=None):
+        return self.connect().result(timeout)
+
+    @property
+    def ready(self):
+        return self.future is not None and self.future.done() and self.future.exception() is None
+
+    @property
+    def failed(self):
+        return self.future is not None and self.future.done() and self.future.exception() is not None
+
+    def __create(self):
+        start = time.perf_counter()
+        try:
+            return self.factory()
+        except Exception:
+            print(f'{self.name} backend failed to connect.')
+            traceback.print_exc()
+            raise
+        finally:
+            self.connect_time = time.perf_counter() - start
+
+
+class BackendRegistry:
+    ''' Named backends that connect in parallel.
+
+        Usage:  backends = BackendRegistry()
+                backends.register('stage', create_stage)
+                backends.register('mcc', create_mcc)
+                backends.connect_all()   # returns immediately
+                backends.get('stage')    # blocks until the stage is connected
+    '''
+    def __init__(self):
+        self.backends = {}
+        self.executor = ThreadPoolExecutor(thread_name_prefix='backend')
+
+    def register(self, name, factory):
+        self.backends[name] = Backend(name, factory)
+
+    def __getitem__(self, name):
+        return self.backends[name]
+
+    def connect(self, name):
+        return self.backends[name].connect(self.executor)
+
+    def connect_all(self):
+        ''' Starts connecting every backend in parallel and returns immediately. '''
+        for name in self.backends:
+            self.connect(name)
+
+    def get(self, name, timeout=None):
+        ''' Connected backend, connecting it first if needed. '''
+        return self.connect(name).result(timeout)
+
+    def wait_all(self, timeout=None):
+        ''' Blocks until every started backend finished connecting (successfully or not). '''
+        for backend in self.backends.values():
+            if backend.future is not None:
+                try:
+                    backend.future.result(timeout)
+                except Exception:
+                    pass
+
+    @property
+    def connect_times(self):
+        return {name: backend.connect_time for name, backend in self.backends.items()}
@@ -0,0 +1,302 @@
+''' Benchmark suite for the startup, acquisition, storage, plotting and analysis hot paths.
+
+    Everything runs against the simulated devices with realtime=False, so the numbers measure the software
+    overhead rather than the sample clock or stage motion. Results are written as JSON and can be compared to a
+    previous run to catch regressions. Metric names carry their unit: '(ms)' and '(s)' are better when lower,
+    '(per s)' and '(MB/s)' when higher. Qt renders offscreen unless QT_QPA_PLATFORM is set, so the startup and
+    plot numbers do not depend on the screen.
+
+    Usage:  python benchmark.py --output results.json
+            python benchmark.py scan analysis --compare results.json
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+def best_time(function, repeat=5, number=1):
+    ''' Shortest time (s) per call of function() over repeat rounds of number calls. '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start)/number)
+    return min(times)
+
+
+def measure_startup():
+    ''' Runs in the child process. Returns the startup phase times (s) since the interpreter started importing the app. '''
+    start = time.perf_counter()
+    from PyQt5 import QtWidgets
+    import autocorrelator_app
+    imported = time.perf_counter()
+
+    autocorrelator = autocorrelator_app.Autocorrelator(simulate=True)
+    autocorrelator.app.processEvents() # window shown and responding
+    interactive = time.perf_counter()
+
+    backends = autocorrelator.core.backends
+    backends.wait_all()
+    connected = time.perf_counter()
+
+    return {
+        'import': imported - start,
+        'window interactive': interactive - start,
+        'backends connected': connected - start,
+        'backend connect times': backends.connect_times,
+    }
+
+
+def benchmark_startup(repeat=5):
+    ''' Median startup phase times over repeat launches in fresh processes, so imports are measured cold
+        (apart from the operating system's file cache).
+    '''
+    command = [sys.executable, os.path.abspath(__file__), '--child']
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout
+        total = time.perf_counter() - start
+        run = json.loads(output.strip().splitlines()[-1])
+        run['process'] = total
+        runs.append(run)
+
+    results = {f'{phase} (ms)': 1000*float(np.median([run[phase] for run in runs])) for phase in ['import', 'window interactive', 'backends connected', 'process']}
+    for name in runs[0]['backend connect times']:
+        results[f'{name} backend connect (ms)'] = 1000*float(np.median([run['backend connect times'][name] or 0. for run in runs]))
+    return results
+
+
+def create_core():
+    from core import AutocorrelatorCore
+    from timing import ScanTimeModel
+    core = AutocorrelatorCore(simulate=True)
+    core.delay_stage.stage.realtime = False
+    # benchmark scans are not realtime, calibrating the saved scan time model with them would break its estimates
+    core.scan_time_model = ScanTimeModel()
+    core.scan_time_model_path = os.devnull
+    return core
+
+
+def benchmark_scan(points=1000, samples=10):
+    ''' Step scan throughput and the overhead per point on top of sampling (stage command, read, processing). '''
+    from core import default_settings
+    core = create_core()
+    step = 0.001
+    settings = default_settings()
+    settings.update({'scan mode': 'Scan', 'scan start': 12.5 - step*points/2, 'scan end': 12.5 + step*(points/2 - 1), 'scan step': step, 'samples': samples})
+    core.run(settings) # warm up (task creation, imports)
+    start = time.perf_counter()
+    core.run(settings)
+    elapsed = time.perf_counter() - start
+    measured = len(core.intensities)
+    core.close()
+    return {
+        'points': measured,
+        'samples per point': samples,
+        'scan time (s)': elapsed,
+        'points (per s)': measured/elapsed,
+        'overhead per point (ms)': 1000*elapsed/measured,
+    }
+
+
+def benchmark_monitor(duration=2., samples=10):
+    ''' Monitor throughput of the streaming pipeline (stream, reduction, ring buffer, statistics). '''
+    from core import default_settings
+    core = create_core()
+    settings = default_settings()
+    settings.update({'scan mode': 'Monitor', 'samples': samples, 'history length': 10000})
+    core.run(settings, duration=0.2) # warm up
+    start = time.perf_counter()
+    core.run(settings, duration=duration)
+    elapsed = time.perf_counter() - start
+    points = core.monitor_buffer.count
+    core.close()
+    return {
+        'samples per point': samples,
+        'points (per s)': points/elapsed,
+        'samples (per s)': points*samples/elapsed,
+    }
+
+
+def benchmark_storage(rows=1000000, chunk=1000, blocks=2000, samples=1000):
+    ''' Binary scan file, CSV export and raw archive write throughput. '''
+    from storage import ScanWriter, RawArchive, export_csv
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        data = np.random.default_rng(0).random((chunk, 2))
+        writer = ScanWriter(f'{directory}/scan.npy', columns=['delay (mm)', 'intensity (V)'])
+        start = time.perf_counter()
+        for _ in range(rows//chunk):
+            writer.append_rows(data)
+        writer.close()
+        elapsed = time.perf_counter() - start
+        results['binary write rows (per s)'] = rows/elapsed
+        results['binary write (MB/s)'] = rows*2*8/elapsed/1e6
+
+        start = time.perf_counter()
+        export_csv(f'{directory}/scan.npy', f'{directory}/scan.csv')
+        elapsed = time.perf_counter() - start
+        results['csv export rows (per s)'] = rows/elapsed
+        results['csv export (MB/s)'] = os.path.getsize(f'{directory}/scan.csv')/elapsed/1e6
+
+        block = np.random.default_rng(0).random(samples)
+        archive = RawArchive(directory, blocks, samples)
+        start = time.perf_counter()
+        for index in range(blocks):
+            archive.write(index, 12.5, block)
+        archive.close()
+        elapsed = time.perf_counter() - start
+        results['raw archive write (MB/s)'] = blocks*samples*8/elapsed/1e6
+    return results
+
+
+def benchmark_plot(lengths=(1000, 10000, 100000, 1000000)):
+    ''' Display cost versus trace length: setIntensityPlot, a full redraw, and one frame of 100 appended points. '''
+    from PyQt5 import QtWidgets
+    from gui.display import Display
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    display = Display()
+    display.frame_timer.stop() # frames are drawn explicitly below
+    results = {}
+    for length in lengths:
+        x = np.linspace(12., 13., length)
+        y = np.random.default_rng(0).random(length)
+        results[f'setIntensityPlot {length} points (ms)'] = 1000*best_time(lambda: display.setIntensityPlot(y, x))
+        results[f'redraw {length} points (ms)'] = 1000*best_time(lambda: display.grab())
+
+        display.clearIntensityData()
+        display.appendIntensityData(y, x)
+        display.drawFrame()
+        new_x, new_y = np.linspace(13., 13.1, 100), np.zeros(100)
+        def append_frame():
+            display.appendIntensityData(new_y, new_x)
+            display.drawFrame()
+        results[f'append frame {length} points (ms)'] = 1000*best_time(append_frame)
+    display.close()
+    app.processEvents()
+    return results
+
+
+def benchmark_analysis(lengths=(100, 1000, 10000)):
+    ''' Pulse width fit, incremental refit and fringe envelope extraction times. '''
+    from analysis import fit, fringe_envelope, IncrementalFitter, sech2_model
+    rng = np.random.default_rng(0)
+    results = {}
+    for length in lengths:
+        t = np.linspace(-1000., 1000., length)
+        y = sech2_model(t, 1., 20., 290., 0.01) + rng.normal(0., 0.01, length)
+        results[f'fit {length} points (ms)'] = 1000*best_time(lambda: fit(t, y))
+
+    # refit after every batch of 10 points of a 1000 point scan, as during a scan
+    t = np.linspace(-1000., 1000., 1000)
+    y = sech2_model(t, 1., 20., 290., 0.01) + rng.normal(0., 0.01, len(t))
+    def incremental():
+        fitter = IncrementalFitter('sech2')
+        for batch in range(0, len(t), 10):
+            fitter.update(t[batch:batch + 10], y[batch:batch + 10])
+    results['incremental fit 1000 points in batches of 10 (ms)'] = 1000*best_time(incremental, repeat=3)
+
+    for length in (100000, 1000000):
+        delay = np.linspace(-1000., 1000., length)
+        phase = 2*np.pi*299.792458/800.*delay
+        envelope = 1/np.cosh(1.76*delay/190.)**2
+        signal = 1 + 2*envelope + 4*envelope*np.cos(phase)
+        results[f'fringe envelope {length} points (ms)'] = 1000*best_time(lambda: fringe_envelope(delay, signal), repeat=10)
+    return results
+
+
+benchmarks = {
+    'startup': benchmark_startup,
+    'scan': benchmark_scan,
+    'monitor': benchmark_monitor,
+    'storage': benchmark_storage,
+    'plot': benchmark_plot,
+    'analysis': benchmark_analysis,
+}
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+
+def run_suite(names=None):
+    ''' Runs the named benchmarks (default all). Returns {'metadata': ..., 'results': {benchmark: {metric: value}}}. '''
+    results = {}
+    for name in names or benchmarks:
+        print(f'Running {name} benchmark...', file=sys.stderr)
+        results[name] = benchmarks[name]()
+    return {'metadata': metadata(), 'results': results}
+
+
+def higher_is_better(metric):
+    return '(per s)' in metric or '(MB/s)' in metric
+
+
+def compare(results, baseline, tolerance=0.2):
+    ''' Metrics that got worse than the baseline by more than tolerance (relative). Returns a list of (benchmark, metric, old, new). '''
+    regressions = []
+    for name, metrics in results['results'].items():
+        for metric, new in metrics.items():
+            old = baseline['results'].get(name, {}).get(metric)
+            if not old or not isinstance(new, float):
+                continue
+            change = new/old - 1
+            if (-change if higher_is_better(metric) else change) > tolerance:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the autocorrelator software against the simulated devices.')
+    parser.add_argument('benchmarks', nargs='*', help=f"benchmarks to run: {', '.join(benchmarks)} (default all)")
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of a previous run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative slowdown reported as a regression')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen') # inherited by the startup benchmark processes
+    for name in args.benchmarks:
+        if name not in benchmarks:
+            parser.error(f"unknown benchmark '{name}', choose from {', '.join(benchmarks)}")
+
+    if args.child:
+        print(json.dumps(measure_startup()))
+        os._exit(0) # skip interpreter teardown, the window is never shown to the event loop
+
+    suite = run_suite(args.benchmarks)
+    for name, metrics in suite['results'].items():
+        print(f'{name}:')
+        for metric, value in metrics.items():
+            print(f'  {metric:<52} {value:12.4g}')
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(suite, file, indent=4)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(suite, baseline, args.tolerance)
+        for name, metric, old, new in regressions:
+            print(f'Regression in {name}: {metric} {old:.4g} -> {new:.4g}')
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {baseline['metadata'].get('commit') or args.compare}.")
@@ -0,0 +1,56 @@
+''' Sample block helpers shared by the DAQ drivers and their simulators, kept free of any driver import. '''
+import re
+from queue import Queue, Empty
+
+import numpy as np
+
+
+def count_channels(channel_name):
+    ''' Number of physical channels in a DAQmx channel string such as 'Dev1/ai2', 'Dev1/ai2, Dev1/ai3' or 'Dev1/ai2:3'. '''
+    count = 0
+    for channel in channel_name.split(','):
+        channel = channel.strip()
+        if ':' in channel:
+            first, last = channel.rsplit(':', 1)
+            count += abs(int(last) - int(re.search(r'(\d+)$', first).group(1))) + 1
+        elif channel:
+            count += 1
+    return count
+
+
+class BlockPool:
+    ''' Fixed pool of preallocated sample buffers passed between the DAQ callback (producer) and a consumer.
+
+        The producer takes a free buffer, fills it and publishes it with its block index. The consumer gets filled
+        buffers and releases them back to the pool when done, so no arrays are allocated while streaming.
+    '''
+    def __init__(self, number_of_buffers, shape):
+        self.free = Queue()
+        self.filled = Queue()
+        self.dropped = 0 # blocks read while every buffer was in use
+        for _ in range(number_of_buffers):
+            self.free.put(np.zeros(shape, dtype=np.float64))
+        self.scratch = np.zeros(shape, dtype=np.float64)
+
+    def take(self):
+        ''' Free buffer for the producer, or the scratch buffer (whose block is dropped) if the consumer fell behind. '''
+        try:
+            return self.free.get_nowait()
+        except Empty:
+            self.dropped += 1
+            return self.scratch
+
+    def publish(self, index, buffer):
+        if buffer is not self.scratch:
+            self.filled.put((index, buffer))
+
+    def get(self, timeout=None):
+        return self.filled.get(timeout=timeout)
+
+    def release(self, buffer):
+        if buffer is not self.scratch:
+            self.free.put(buffer)
+
+    def close(self):
+        ''' Wakes up a consumer waiting in get. '''
+        self.filled.put(None)
@@ -0,0 +1,217 @@
+''' Command line interface to the headless autocorrelator core, for batch runs without the GUI.
+
+    Usage:  python cli.py scan --mode fly --start 12.3 --end 12.7 --step 0.005 --save --directory D:/data
+            python cli.py monitor --duration 60
+            python cli.py analyze D:/data/run/intensities.npy 12.5 --model gaussian
+            python cli.py queue jobs.json --save --directory D:/data
+            python cli.py resume D:/data/autocorrelation_2024_01_01_120000
+            python cli.py serve --port 8765 --save --directory D:/data
+            python cli.py scan --reducer lock-in --frequency 137 --chopper-reference
+            python cli.py scan --simulate
+'''
+import argparse
+import asyncio
+
+import numpy as np
+
+from core import AutocorrelatorCore, default_settings
+from analysis import analyze_scan, models
+from reducers import reducers
+from scheduler import ScanScheduler
+from server import StreamServer
+
+
+modes = {
+    'step': 'Scan',
+    'fly': 'Fly Scan',
+    'adaptive': 'Adaptive Scan',
+    'repeated': 'Repeated Scan',
+}
+
+
+def build_parser():
+    defaults = default_settings()
+    parser = argparse.ArgumentParser(description='Headless autocorrelator acquisition and analysis.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    acquisition = argparse.ArgumentParser(add_help=False)
+    acquisition.add_argument('--simulate', action='store_true', help='use the simulated hardware')
+    acquisition.add_argument('--samples', type=int, default=defaults['samples'], help='samples averaged per point')
+    acquisition.add_argument('--zero', type=float, default=defaults['zero position'], help='stage position of zero delay (mm)')
+    acquisition.add_argument('--normalize', action='store_true', help='normalize to the reference photodiode')
+    acquisition.add_argument('--reducer', choices=list(reducers), default=defaults['reducer'], help='reduction of the samples of each point')
+    acquisition.add_argument('--frequency', type=float, default=defaults['lock-in frequency'], help='chopper frequency of the lock-in (Hz)')
+    acquisition.add_argument('--chopper-reference', action='store_true', help='measure the lock-in phase against the chopper reference output')
+    acquisition.add_argument('--save', action='store_true', help='save the run to directory/filename_<time>')
+    acquisition.add_argument('--raw', action='store_true', help='also save the raw sample blocks')
+    acquisition.add_argument('--directory', default=defaults['directory'])
+    acquisition.add_argument('--filename', default=defaults['filename'])
+
+    scan = commands.add_parser('scan', parents=[acquisition], help='scan the delay and fit the autocorrelation')
+    scan.add_argument('--mode', choices=list(modes), default='step')
+    scan.add_argument('--start', type=float, default=defaults['scan start'], help='scan start (mm)')
+    scan.add_argument('--end', type=float, default=defaults['scan end'], help='scan end (mm)')
+    scan.add_argument('--step', type=float, default=defaults['scan step'], help='scan step (mm)')
+    scan.add_argument('--passes', type=int, default=defaults['passes'], help='passes of a repeated scan')
+    scan.add_argument('--save-passes', action='store_true', help='save every pass of a repeated scan')
+    scan.add_argument('--bidirectional', action='store_true', help='repeated scan: also acquire on the reverse sweeps instead of returning to the start')
+    scan.add_argument('--no-backlash-compensation', action='store_true', help='bidirectional scan: merge the reverse sweeps without correcting their backlash')
+    scan.add_argument('--model', choices=list(models), default=defaults['fit model'])
+    scan.add_argument('--fringes', action='store_true', help='interferometric trace: fit the low-pass component')
+
+    monitor = commands.add_parser('monitor', parents=[acquisition], help='monitor the signal at the current delay')
+    monitor.add_argument('--duration', type=float, default=10., help='monitoring time (s)')
+    monitor.add_argument('--history', type=int, default=defaults['history length'], help='readings kept for the statistics')
+
+    queue = commands.add_parser('queue', parents=[acquisition], help='run a list of scan jobs back-to-back')
+    queue.add_argument('jobs', help='JSON file with a list of settings, i.e. [{"scan mode": "Fly Scan", "scan step": 0.002}, {"scan mode": "Monitor", "duration": 60}]')
+
+    resume = commands.add_parser('resume', help='continue an interrupted saved scan from its last completed point')
+    resume.add_argument('directory', help='save directory of the interrupted scan')
+    resume.add_argument('--simulate', action='store_true', help='use the simulated hardware')
+
+    serve = commands.add_parser('serve', parents=[acquisition], help='stream live data to local clients and accept remote commands (see client.py)')
+    serve.add_argument('--host', default='127.0.0.1', help='interface to listen on')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--path', help='serve on this Unix socket instead of TCP')
+
+    analyze = commands.add_parser('analyze', help='fit a saved scan')
+    analyze.add_argument('path', help='intensities.npy of a saved run')
+    analyze.add_argument('zero_position', type=float, help='stage position of zero delay (mm)')
+    analyze.add_argument('--model', choices=list(models), default=defaults['fit model'])
+    analyze.add_argument('--fringes', action='store_true')
+    return parser
+
+
+def settings_from_args(args):
+    ''' Acquisition settings for the parsed arguments. '''
+    settings = default_settings()
+    settings.update({
+        'samples': args.samples,
+        'zero position': args.zero,
+        'normalize': args.normalize,
+        'reducer': args.reducer,
+        'lock-in frequency': args.frequency,
+        'lock-in reference': args.chopper_reference,
+        'save': args.save,
+        'save raw': args.raw,
+        'directory': args.directory,
+        'filename': args.filename,
+    })
+    if args.command == 'scan':
+        settings.update({
+            'scan mode': modes[args.mode],
+            'scan start': args.start,
+            'scan end': args.end,
+            'scan step': args.step,
+            'passes': args.passes,
+            'save passes': args.save_passes,
+            'bidirectional': args.bidirectional,
+            'backlash compensation': not args.no_backlash_compensation,
+            'fit model': args.model,
+            'fringe resolved': args.fringes,
+        })
+    elif args.command == 'monitor':
+        settings.update({
+            'scan mode': 'Monitor',
+            'history length': args.history,
+        })
+    return settings
+
+
+def print_fit(result):
+    if result is not None and result.success:
+        print(result)
+        print(f'Autocorrelation FWHM: {result.autocorrelation_fwhm:.1f} fs')
+    else:
+        print('Fit failed.')
+
+
+def print_results(core):
+    settings = core.settings
+    if settings['scan mode'] == 'Monitor':
+        buffer = core.monitor_buffer
+        print(f'Mean: {buffer.mean:.4f} V   Std: {buffer.std:.4f} V   Min: {buffer.min:.4f} V   Max: {buffer.max:.4f} V')
+    else:
+        if settings['scan mode'] == 'Repeated Scan':
+            print(f"{settings['passes']} passes over {len(core.accumulator.positions)} delays")
+        else:
+            print(f'{len(core.intensities)} points')
+        print_fit(core.fit_result)
+    if core.lock_in_phase is not None:
+        print(f'Lock-in phase of the last point: {np.degrees(core.lock_in_phase):.1f} deg')
+    if core.save_directory:
+        print(f'Saved to {core.save_directory}')
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == 'analyze':
+        print_fit(analyze_scan(args.path, args.zero_position, args.model, args.fringes))
+        return
+
+    if args.command == 'resume':
+        core = AutocorrelatorCore(simulate=args.simulate)
+        try:
+            core.resume(args.directory)
+            try:
+                core.wait()
+            except KeyboardInterrupt:
+                core.stop_acquire()
+                core.wait()
+        except (OSError, ValueError) as error:
+            print(f'Cannot resume {args.directory}: {error}')
+            return
+        finally:
+            core.close()
+        print_results(core)
+        return
+
+    settings = settings_from_args(args)
+    core = AutocorrelatorCore(simulate=args.simulate)
+    core.set_zero_position(settings['zero position'])
+
+    if args.command == 'queue':
+        scheduler = ScanScheduler(core, base_settings=settings)
+        try:
+            scheduler.load(args.jobs)
+        except (OSError, ValueError) as error:
+            print(f'Cannot queue {args.jobs}: {error}')
+            core.close()
+            return
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            scheduler.stop()
+        finally:
+            core.close()
+        for job in scheduler.jobs:
+            summary = job.summary()
+            pulse = f"{summary['pulse duration (fs)']:.1f} fs" if summary['pulse duration (fs)'] is not None else '-'
+            print(f"{job.name:<32} {job.status:<10} {pulse}")
+        if scheduler.session_directory:
+            print(f'Saved to {scheduler.session_directory}')
+        return
+
+    if args.command == 'serve':
+        # remote acquisitions and jobs start from these settings
+        core.settings = settings
+        server = StreamServer(core, args.host, args.port, args.path)
+        try:
+            asyncio.run(server.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            core.close()
+        return
+
+    try:
+        core.run(settings, duration=args.duration if args.command == 'monitor' else None)
+    finally:
+        core.close()
+    print_results(core)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+''' Client of the autocorrelator streaming server (server.py) for other lab tools.
+
+    Plain blocking sockets, so it can be used from any script without an event loop.
+
+    Usage:  with StreamClient(port=8765) as client:
+                client.status()
+                client.queue([{'scan mode': 'Fly Scan', 'scan step': 0.002}, {'scan mode': 'Monitor', 'duration': 60}])
+                client.subscribe()
+                for event in client.events():
+                    if event['event'] == 'points':
+                        print(event['positions'], event['intensities'])
+'''
+import json
+import socket
+from collections import deque
+
+
+class ServerError(Exception):
+    ''' A request was rejected by the server. '''
+
+
+class StreamClient:
+    ''' Connection to a StreamServer.
+
+        Inputs :
+            host (str), port (int): TCP address of the server.
+            path (str): Unix socket of the server, instead of host and port.
+            timeout (float): socket timeout (s) for requests. Waiting for events has no timeout unless given.
+    '''
+    def __init__(self, host='127.0.0.1', port=8765, path=None, timeout=10.):
+        if path:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port), timeout=timeout)
+        self.timeout = timeout
+        self.buffer = b'' # received bytes not yet split into messages
+        self.pending = deque() # events received while waiting for a response
+        self.next_id = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self):
+        self.socket.close()
+
+    def receive(self):
+        ''' Next message. A socket timeout leaves partly received messages in the buffer, so reading can continue. '''
+        while b'\n' not in self.buffer:
+            data = self.socket.recv(65536)
+            if not data:
+                raise ConnectionError('Server closed the connection.')
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return json.loads(line)
+
+    def request(self, command, **arguments):
+        ''' Sends a command and returns its result. Events arriving in the meantime are kept for events(). '''
+        request_id = self.next_id
+        self.next_id += 1
+        self.socket.settimeout(self.timeout)
+        self.socket.sendall((json.dumps({'id': request_id, 'command': command, **arguments}) + '\n').encode())
+        while True:
+            message = self.receive()
+            if 'event' in message:
+                self.pending.append(message)
+            elif message.get('id') == request_id:
+                if 'error' in message:
+                    raise ServerError(message['error'])
+                return message['result']
+
+    def subscribe(self, policy='drop oldest', queue_size=None):
+        ''' Starts receiving events. policy ('drop oldest', 'drop newest' or 'disconnect') applies when this client
+            falls more than queue_size messages behind.
+        '''
+        return self.request('subscribe', policy=policy, queue_size=queue_size)
+
+    def unsubscribe(self):
+        return self.request('unsubscribe')
+
+    def status(self):
+        return self.request('status')
+
+    def acquire(self, settings=None, **overrides):
+        ''' Starts an acquisition with the server's current settings updated by settings and overrides. '''
+        return self.request('acquire', settings={**(settings or {}), **overrides})
+
+    def stop(self):
+        return self.request('stop')
+
+    def queue(self, jobs):
+        ''' Queues scan jobs (settings dictionaries, optionally with 'name' and 'duration'). Returns their names. '''
+        return self.request('queue', jobs=list(jobs))
+
+    def jobs(self):
+        return self.request('jobs')
+
+    def cancel(self):
+        return self.request('cancel')
+
+    def events(self, timeout=None):
+        ''' Yields subscribed events as they arrive. Stops after timeout (s) without an event if given. '''
+        self.socket.settimeout(timeout)
+        while True:
+            while self.pending:
+                yield self.pending.popleft()
+            try:
+                message = self.receive()
+            except socket.timeout:
+                return
+            if 'event' in message:
+                yield message
+
+
+if __name__ == '__main__':
+    import argparse
+
+    # Prints the live events of a running server, i.e. python client.py --port 8765
+    parser = argparse.ArgumentParser(description='Prints the live data of an autocorrelator streaming server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--path', help='Unix socket of the server')
+    args = parser.parse_args()
+
+    with StreamClient(args.host, args.port, args.path) as client:
+        print(client.status())
+        client.subscribe()
+        for event in client.events():
+            if event['event'] == 'points':
+                print(f"{len(event['intensities'])} points, last {event['positions'][-1]:.4f} mm {event['intensities'][-1]:.4f} V")
+            else:
+                print(event)
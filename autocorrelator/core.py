@@ -0,0 +1,1020 @@
+''' Headless acquisition core of the autocorrelator.
+
+    Owns the delay stage, DAQ and shutter and runs the scans, monitor, saving and analysis without Qt. The GUI
+    (autocorrelator_app.py) and the command line (cli.py) are thin clients that pass settings in and read
+    results out; plotting goes through an optional display object.
+'''
+import asyncio
+import concurrent.futures
+import os
+import time
+import traceback
+from threading import Event, Lock
+
+import numpy as np
+
+from backends import BackendRegistry
+from stage_service import StageService
+from motion import move_time, trapezoid_position
+from pipeline import ProcessingWorker
+from analysis import IncrementalFitter, fit, fringe_envelope
+from accumulator import ScanAccumulator, BidirectionalAccumulator
+from scan_planning import coarse_positions, max_points, refine_positions, step_positions
+from ring_buffer import RingBuffer
+from storage import ScanWriter, RawArchive, save_settings, saved_rows, sort_scan, load_scan
+from journal import ScanJournal
+from timing import PhaseTimer, ScanTimeModel, histogram_bins
+from reducers import LockIn, create_reducer, mean
+from orchestrator import AcquisitionOrchestrator, HardwareTimeout
+
+
+scan_modes = ['Scan', 'Monitor', 'Fly Scan', 'Adaptive Scan', 'Repeated Scan']
+journaled_modes = ['Scan', 'Repeated Scan'] # saved scans of these modes can be resumed after an interruption
+
+
+class AlreadyAcquiring(RuntimeError):
+    ''' An acquisition was started while another one is running. '''
+
+
+def default_settings():
+    ''' Acquisition settings with the same keys and defaults as the GUI (AutocorrelatorGUI.getSettings). '''
+    return {
+        'scan mode': 'Scan',
+        'filename': 'autocorrelation',
+        'directory': os.getcwd(),
+        'save': False,
+        'save raw': False,
+        'scan start': 0.,
+        'scan end': 25.,
+        'scan step': 0.005,
+        'samples': 100,
+        'zero position': 0.,
+        'history length': 10000,
+        'fit model': 'sech2',
+        'fringe resolved': False,
+        'passes': 20,
+        'save passes': False,
+        'bidirectional': False, # repeated scans acquire on the reverse sweeps too instead of returning to the start
+        'backlash compensation': True,
+        'normalize': False,
+        'reducer': 'mean',
+        'lock-in frequency': 137.,
+        'lock-in reference': False,
+    }
+
+
+class NullDisplay:
+    ''' Display that ignores all updates, used when running headless.
+
+        A display (i.e. AutocorrelatorGUI) implements these methods. They are called from the acquisition and
+        processing threads, so they must be thread-safe.
+    '''
+    def clearIntensityPlot(self):
+        pass
+
+    def setPlotHistoryLength(self, history_length=None):
+        pass
+
+    def appendIntensityPlot(self, intensity_data, x_axis=None):
+        pass
+
+    def setAveragedPlot(self, intensity_data, error_data, x_axis):
+        pass
+
+    def setFitPlot(self, fit_data, x_axis):
+        pass
+
+
+class AutocorrelatorCore:
+    ''' Autocorrelator acquisition without a GUI.
+
+        Usage:  core = AutocorrelatorCore(simulate=True)
+                settings = default_settings()
+                settings['scan mode'] = 'Fly Scan'
+                core.run(settings) # blocks until the scan finished
+                core.fit_result, core.positions, core.intensities
+                core.close()
+
+        Inputs :
+            simulate (bool): use the simulated delay stage, DAQ and MCC device in simulator.py instead of the hardware.
+            display: object receiving plot updates (see NullDisplay). Default discards them.
+    '''
+    def __init__(self, simulate=False, display=None):
+        self.simulate = simulate
+        self.display = display if display is not None else NullDisplay()
+        self.listeners = [] # callback(event, data) for every acquisition event, see notify
+        self.settings = default_settings()
+        # acquisitions run as asyncio tasks, hardware calls are awaited with per-operation timeouts (see orchestrator.py)
+        self.orchestrator = AcquisitionOrchestrator()
+        self.start_lock = Lock() # acquire() checks and starts under it, so callers on other threads cannot both start
+        self.status_interval = 1. # s between 'status' events while acquiring
+        self.error = None # exception that ended the last acquisition
+
+        self.delay_stage_serial_port = 'COM5'
+        self.stage_poll_interval = 0.2 # s
+
+        self.sensor_channel = 'Dev1/ai2'
+        self.reference_channel = 'Dev1/ai3' # photodiode sampling the laser power
+        self.reference_exponent = 2 # the autocorrelation signal is second order in the laser power
+        self.chopper_channel = 'Dev1/ai1' # TTL reference output of the chopper, for the lock-in phase
+        self.sample_rate = 1000
+        self.sensor = None
+        self.reducer = mean # reduces sample blocks to intensities, see reducers.py
+        self.sample_sink = None # callable(data) also receiving the raw sample blocks of every processed batch
+        self.trim_proportion = 0.1 # of the lowest and highest samples dropped by the trimmed mean
+        self.settle_time = 0. # s waited after each step before reading
+
+        # per-point phase timings of the running acquisition, and the scan time model calibrated by them
+        self.timer = PhaseTimer()
+        # (simulated runs keep their own model so they do not skew the hardware estimates)
+        model_name = 'timing_model_simulated.json' if simulate else 'timing_model.json'
+        self.scan_time_model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), model_name)
+        self.scan_time_model = ScanTimeModel.load(self.scan_time_model_path)
+
+        self.zero_position = 0.000
+        self.intensities = []
+        self.positions = []
+        self.phases = [] # lock-in phase (rad) of each point
+        self.lock_in_phase = None # of the latest point
+        self.monitor_buffer = None
+        self.fitter = None
+        self.accumulator = None
+        self.fit_result = None
+        self.writer = None
+        self.raw_archive = None
+        self.save_directory = None
+        self.export_csv = True # convert the binary scan file to csv once acquisition finishes
+        self.journal = None # checkpoints of the running saved scan, see journal.py
+        self.resuming = False
+        self.completed_points = 0
+
+        self.mcc_model = '3101'
+        self.shutter = 1 # pump shutter channel
+        # self.shutter = 2 # stokes shutter channel
+        self.shutter_open = False
+
+        # drivers are imported and connected in parallel in the background, the first use waits for them
+        self.backends = BackendRegistry()
+        self.backends.register('stage', self.connect_delay_stage)
+        self.backends.register('daq', self.load_daq)
+        self.backends.register('mcc', self.connect_mcc)
+        self.backends.connect_all()
+
+    def add_listener(self, callback):
+        ''' Registers callback(event, data) for the acquisition events, called on the acquisition and processing threads:
+                'start'  {settings, save_directory}
+                'points' {scan_mode, positions, intensities, phases} for every processed batch
+                'fit'    {pulse_duration, pulse_duration_error, autocorrelation_fwhm, model}
+                'status' {position, points, throughput, remaining_time} every status_interval while acquiring
+                'finish' {error, points, save_directory}
+            Callbacks must return quickly, the acquisition waits for them.
+        '''
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def notify(self, event, **data):
+        for callback in self.listeners:
+            try:
+                callback(event, data)
+            except Exception:
+                traceback.print_exc()
+
+    @property
+    def delay_stage(self):
+        ''' StageService of the delay stage. Blocks until connected. '''
+        return self.backends.get('stage')
+
+    @property
+    def MCC(self):
+        ''' MCC device of the shutter, or None if there is none. Blocks until connected. '''
+        try:
+            return self.backends.get('mcc')
+        except Exception:
+            return None
+
+    def connect_delay_stage(self):
+        if self.simulate:
+            from simulator import SimulatedDelayStageController
+            stage = SimulatedDelayStageController(self.delay_stage_serial_port)
+        else:
+            from delay_controller import DelayStageController
+            stage = DelayStageController(self.delay_stage_serial_port)
+        # all stage commands go through the service thread, clients only read its cached position
+        return StageService(stage, poll_interval=self.stage_poll_interval)
+
+    def load_daq(self):
+        ''' Analog input class of the DAQ (the task itself is created per acquisition by create_sensor). '''
+        if self.simulate:
+            from simulator import SimulatedAnalogInput
+            return SimulatedAnalogInput
+        from analog_input import AnalogInput
+        return AnalogInput
+
+    def connect_mcc(self):
+        if self.simulate:
+            from simulator import SimulatedMCCDev
+            device = SimulatedMCCDev(model=self.mcc_model)
+        else:
+            try:
+                import mcc
+                print('MCC loaded properly')
+            except:
+                print('MCC failed to load')
+                return None
+            device = mcc.MCCDev(model=self.mcc_model)
+        device.set_digital_out(1, self.shutter) # start with the shutter closed
+        return device
+
+    def close(self):
+        ''' Stops acquiring, closes the shutter and releases the DAQ task and stage. '''
+        self.stop_acquire()
+        self.wait()
+        self.close_sensor()
+        self.close_shutter()
+        if self.backends['stage'].ready:
+            self.delay_stage.close()
+        self.orchestrator.close()
+
+    def delay_to_femto(self, delay_position):
+        c = 0.000299792 # mm/fs
+        return (delay_position - self.zero_position)/c
+
+    def set_zero_position(self, position):
+        self.zero_position = position
+
+    def stage_motion(self):
+        ''' Velocity (mm/s) and acceleration (mm/s^2) of the stage, cached by the stage service, or typical values while connecting. '''
+        if self.backends['stage'].ready:
+            return self.delay_stage.velocity, self.delay_stage.acceleration
+        return 7., 200.
+
+    def get_scan_time(self, settings=None):
+        ''' Predicted duration (s) of an acquisition with settings (default the current settings), from the stage motion,
+            the sample clock and the latencies measured in past scans. None for Monitor.
+        '''
+        velocity, acceleration = self.stage_motion()
+        position = self.delay_stage.position if self.backends['stage'].ready else None
+        return self.scan_time_model.predict(settings or self.settings, velocity, acceleration, self.sample_rate, self.settle_time, position)
+
+    def remaining_time(self):
+        ''' Estimated time (s) until the running scan finishes, from its measured point rate. None if unknown. '''
+        return self.timer.remaining_time() if self.acquiring else None
+
+    def snapshot(self):
+        ''' State shown by the GUI, as plain values that can be sent to another process (see acquisition_process.py). '''
+        stage = self.backends['stage']
+        velocity, acceleration = self.stage_motion()
+        result = self.fit_result if self.fit_result is not None and self.fit_result.success else None
+        buffer = self.monitor_buffer
+        state = {
+            'acquiring': self.acquiring,
+            'settings': dict(self.settings),
+            'stage': 'ready' if stage.ready else 'failed' if stage.failed else 'connecting',
+            'position': self.delay_stage.position if stage.ready else None,
+            'velocity': velocity,
+            'acceleration': acceleration,
+            'sample_rate': self.sample_rate,
+            'settle_time': self.settle_time,
+            'zero_position': self.zero_position,
+            'scan_time_model': self.scan_time_model.to_dict(),
+            'shutter_open': self.shutter_open,
+            'lock_in_phase': self.lock_in_phase,
+            'backlash': getattr(self.accumulator, 'backlash', None) if self.settings['scan mode'] == 'Repeated Scan' else None,
+            'pulse_duration': float(result.pulse_duration) if result is not None else None,
+            'pulse_duration_error': float(result.pulse_duration_error) if result is not None else None,
+            'monitor': {'mean': buffer.mean, 'std': buffer.std, 'min': buffer.min, 'max': buffer.max} if buffer is not None and len(buffer) else None,
+            'throughput': None,
+            'remaining_time': None,
+            'timing': {},
+        }
+        if state['acquiring']:
+            throughput = self.timer.throughput()
+            state['throughput'] = throughput if np.isfinite(throughput) else None
+            state['remaining_time'] = self.remaining_time()
+            histograms = {phase: self.timer.histogram(phase, histogram_bins) for phase in self.timer.durations}
+            state['timing'] = {phase: counts for phase, counts in histograms.items() if counts.any()}
+        return state
+
+    def move_stage(self, position):
+        ''' Moves the delay stage to position (mm), halting it if the move exceeds its timeout. '''
+        stage = self.delay_stage
+        timeout = self.orchestrator.timeout('move', move_time(position - stage.position, stage.velocity, stage.acceleration))
+        with self.timer.phase('move'):
+            try:
+                stage.submit_move(position).result(timeout)
+            except concurrent.futures.TimeoutError:
+                stage.stop()
+                raise HardwareTimeout(f'Delay stage move to {position:.4f} mm did not finish within {timeout:.1f} s') from None
+
+    def settle(self):
+        ''' Waits settle_time after a step for the stage to stop ringing. '''
+        if self.settle_time > 0:
+            with self.timer.phase('settle'):
+                time.sleep(self.settle_time)
+
+    def acquire_point(self, position, samples):
+        ''' Moves to position, settles and reads samples per channel, each with its own timeout. Blocking, call it on
+            the hardware thread.
+        '''
+        self.move_stage(position)
+        self.settle()
+        with self.timer.phase('read'):
+            return self.sensor.read(samples_per_channel=samples, timeout=self.orchestrator.timeout('read', samples/self.sample_rate))
+
+    async def hardware(self, function, *args):
+        ''' Awaits function(*args) on the hardware thread. Cancelling returns at once and halts the stage, a DAQ read
+            already running finishes in the background.
+        '''
+        try:
+            return await self.orchestrator.call(None, function, *args)
+        except asyncio.CancelledError:
+            # sent directly to the controller, not queued behind the move, and waited for off the event loop
+            await self.orchestrator.run_blocking(self.delay_stage.stop)
+            raise
+
+    async def hardware_loop(self, items, step):
+        ''' Calls step(item) for every item on the hardware thread, until step returns True. The loop runs on the
+            hardware thread as a whole, so points cost no hand-offs to and from the event loop. Cancelling halts the
+            stage at once and ends the loop after the current item, which is waited for so the acquisition's cleanup
+            never runs alongside it.
+        '''
+        stop = Event()
+        def run():
+            for item in items:
+                if step(item) or stop.is_set():
+                    return
+        try:
+            await self.hardware(run)
+        except asyncio.CancelledError:
+            stop.set()
+            await self.orchestrator.idle()
+            raise
+
+    async def start_sensor(self):
+        ''' Waits for the stage and DAQ to connect, then opens the analog input task. '''
+        await asyncio.wrap_future(self.backends.connect('stage'))
+        await asyncio.wrap_future(self.backends.connect('daq'))
+        return await self.orchestrator.call('command', self.open_sensor)
+
+    async def stop_sensor(self, blocks=None):
+        ''' Closes the block stream (if any) and stops the analog input task, after any read still running. '''
+        if blocks is not None:
+            await self.orchestrator.call('command', blocks.close)
+        if self.sensor is not None:
+            await self.orchestrator.call('command', self.sensor.stop)
+
+    @property
+    def lock_in(self):
+        return self.settings['reducer'] == 'lock-in'
+
+    def sensor_channels(self):
+        ''' The intensity sensor channel, the reference photodiode when normalizing and the chopper reference when
+            the lock-in phase is measured against it.
+        '''
+        channels = [self.sensor_channel]
+        if self.settings['normalize']:
+            channels.append(self.reference_channel)
+        if self.lock_in and self.settings['lock-in reference']:
+            channels.append(self.chopper_channel)
+        return channels
+
+    def create_sensor(self):
+        ''' Creates the analog input task used to read the intensity sensor, and the reference photodiode when normalizing. '''
+        channels = self.sensor_channels()
+        AnalogInput = self.backends.get('daq')
+        if self.simulate:
+            return AnalogInput(channels, clock_rate=self.sample_rate, mode='continuous', stage=self.delay_stage.stage, realtime=self.delay_stage.stage.realtime,
+                               chopper_channel=self.chopper_channel)
+        return AnalogInput(channels, clock_rate=self.sample_rate, mode='continuous')
+
+    def open_sensor(self):
+        ''' Analog input task for the current settings. The task is kept between acquisitions and only recreated when
+            the channels change, so back-to-back scans do not pay the task setup and teardown.
+        '''
+        if self.sensor is None or self.sensor.channel_name != ', '.join(self.sensor_channels()):
+            self.close_sensor()
+            self.sensor = self.create_sensor()
+        if self.simulate:
+            # the simulated chopper is in the beam only while using the lock-in
+            self.sensor.chopper_frequency = self.settings['lock-in frequency'] if self.lock_in else None
+        return self.sensor
+
+    def close_sensor(self):
+        if self.sensor is not None:
+            self.sensor.stop()
+            self.sensor.clear()
+            self.sensor = None
+
+    def reduce_blocks(self, data):
+        ''' Reduces a batch of sample blocks to one intensity each with the reducer. Returns intensities and the
+            lock-in phases (None for the other reducers).
+
+            When normalizing, intensities are divided by mean(reference)**reference_exponent, which removes laser power
+            drift from the trace.
+        '''
+        data = np.stack(data)
+        if data.ndim == 2:
+            signal, channels = data, [self.sensor_channel]
+        else:
+            signal, channels = data[:, 0], self.sensor_channels()
+        phases = None
+        if isinstance(self.reducer, LockIn):
+            chopper = data[:, channels.index(self.chopper_channel)] if self.chopper_channel in channels else None
+            intensities, phases = self.reducer.demodulate(signal, chopper)
+            self.lock_in_phase = float(phases[-1])
+        else:
+            intensities = self.reducer(signal)
+        if self.reference_channel in channels:
+            intensities = intensities/data[:, channels.index(self.reference_channel)].mean(axis=-1)**self.reference_exponent
+        return intensities, phases
+
+    def open_shutter(self):
+        if self.MCC:
+            self.MCC.set_digital_out(0, self.shutter)
+            self.shutter_open = True
+
+    def close_shutter(self):
+        if self.MCC:
+            self.MCC.set_digital_out(1, self.shutter)
+            self.shutter_open = False
+
+    def toggle_shutter(self):
+        if self.shutter_open:
+            self.close_shutter()
+        else:
+            self.open_shutter()
+
+    def scan_positions(self, settings=None):
+        ''' Delay positions (mm) of one pass of a step scan with settings (default the current settings). '''
+        settings = self.settings if settings is None else settings
+        return step_positions(settings['scan start'], settings['scan end'], settings['scan step'])
+
+    @property
+    def acquiring(self):
+        return self.orchestrator.running
+
+    def acquire(self, settings=None, resume=None):
+        ''' Starts acquiring in the background with settings (default the current settings). Returns a
+            concurrent.futures.Future of the acquisition. With resume (a ScanJournal) the interrupted scan is continued
+            instead, see resume(). Raises AlreadyAcquiring if another acquisition is running.
+        '''
+        with self.start_lock:
+            return self.__start(settings, resume)
+
+    def __start(self, settings, resume):
+        if self.acquiring:
+            raise AlreadyAcquiring('Already acquiring.')
+        if settings is not None:
+            self.settings = dict(settings)
+        if self.settings['scan mode'] not in scan_modes:
+            raise ValueError(f"Unknown scan mode: {self.settings['scan mode']}")
+        self.reducer = create_reducer(self.settings['reducer'], self.sample_rate, self.settings['lock-in frequency'], self.trim_proportion)
+        self.display.clearIntensityPlot()
+        self.display.setPlotHistoryLength(self.settings['history length'] if self.settings['scan mode'] == 'Monitor' else None)
+        self.fitter = IncrementalFitter(self.settings['fit model'], fringe_resolved=self.settings['fringe resolved'])
+        self.fit_result = None
+        self.timer = PhaseTimer(self.expected_points(self.settings))
+        self.phases = []
+        self.lock_in_phase = None
+        self.journal = None
+        self.resuming = resume is not None
+
+        if self.resuming:
+            self.open_resumed(resume)
+        elif self.settings['save']:
+            # Create save directory
+            self.save_time = time.strftime("%Y_%m_%d_%H%M%S", time.gmtime())
+            self.save_directory = f"{self.settings['directory']}/{self.settings['filename']}_{self.save_time}"
+            os.mkdir(self.save_directory)
+
+            # Save settings
+            save_settings(f'{self.save_directory}/settings.txt', self.settings)
+
+            # Create binary file for average intensities (and lock-in phases)
+            columns = self.saved_columns()
+            if columns:
+                self.writer = ScanWriter(f'{self.save_directory}/intensities.npy', columns=columns)
+
+            # Checkpoint the scan so it can be resumed if it is interrupted
+            if self.settings['scan mode'] in journaled_modes:
+                self.journal = ScanJournal.create(self.save_directory, self.settings, self.scan_positions())
+
+        scan_mode = self.settings['scan mode']
+        target = {
+            'Scan': self.acquire_scan,
+            'Monitor': self.acquire_monitor,
+            'Fly Scan': self.acquire_fly_scan,
+            'Adaptive Scan': self.acquire_adaptive_scan,
+            'Repeated Scan': self.acquire_repeated_scan,
+        }[scan_mode]
+        self.error = None
+        self.notify('start', settings=dict(self.settings), save_directory=self.save_directory if self.settings['save'] else None)
+        return self.orchestrator.start(self.__run_acquisition(target))
+
+    @property
+    def intensity_unit(self):
+        ''' Unit of the saved intensities: V, or normalized to the reference photodiode. '''
+        return 'normalized' if self.settings['normalize'] else 'V'
+
+    def saved_columns(self):
+        ''' Columns of intensities.npy, None if the mode saves no rows. '''
+        phase_column = ['phase (rad)'] if self.lock_in else []
+        intensity_column = [f'intensity ({self.intensity_unit})']
+        if self.settings['scan mode'] != 'Repeated Scan':
+            return ['delay (mm)'] + intensity_column + phase_column
+        if self.settings['save passes']:
+            return ['pass', 'delay (mm)'] + intensity_column + phase_column
+        return None
+
+    def resume(self, directory):
+        ''' Continues the interrupted scan saved in directory from its last completed point, appending to the same
+            files. Returns the acquisition's future.
+        '''
+        self.wait() # a stopped scan finishes its checkpoint first
+        journal = ScanJournal.load(directory)
+        if journal.status == 'finished':
+            raise ValueError(f'The scan in {directory} already finished.')
+        self.set_zero_position(journal.settings['zero position'])
+        # settings added since the journal was written keep their defaults
+        return self.acquire({**default_settings(), **journal.settings}, resume=journal)
+
+    def open_resumed(self, journal):
+        ''' Reopens the files of an interrupted scan to append to them. '''
+        self.journal = journal
+        self.save_directory = journal.directory
+        if self.settings['scan mode'] == 'Repeated Scan':
+            # the scan resumes from the checkpointed statistics, which the journal may lag behind
+            journal.completed = journal.accumulated_points()
+        columns = self.saved_columns()
+        if columns:
+            path = f'{self.save_directory}/intensities.npy'
+            rows = saved_rows(path)
+            if self.settings['scan mode'] == 'Scan':
+                # rows flushed to disk are the completed points, the journal may lag behind them
+                rows = min(rows, len(journal.positions))
+                journal.completed = rows
+                self.timer.expected_points = len(journal.positions) - rows
+            else:
+                # pass rows written after the last checkpoint are acquired again
+                rows = min(rows, journal.completed)
+            self.writer = ScanWriter(path, columns=columns, rows=rows)
+        print(f'Resuming {self.save_directory} after {journal.completed} points')
+
+    def expected_points(self, settings):
+        ''' Number of points a step or repeated scan acquires, None if it is not known in advance. '''
+        if settings['scan mode'] not in ('Scan', 'Repeated Scan') or settings['scan step'] == 0:
+            return None
+        points = len(self.scan_positions(settings))
+        return points*int(settings['passes']) if settings['scan mode'] == 'Repeated Scan' else points
+
+    async def __run_acquisition(self, target):
+        if self.listeners:
+            self.orchestrator.spawn(self.publish_status())
+        try:
+            await target()
+        except asyncio.CancelledError:
+            pass # stopped before the acquisition got going
+        except Exception as error:
+            traceback.print_exc()
+            self.error = error
+        else:
+            if self.error is None: # scans that failed part way would skew the model
+                self.update_scan_time_model()
+        self.notify('finish', error=str(self.error) if self.error else None, points=self.acquired_points(), save_directory=self.save_directory if self.settings['save'] else None)
+
+    def acquired_points(self):
+        ''' Points acquired by the last acquisition. '''
+        scan_mode = self.settings['scan mode']
+        if scan_mode == 'Monitor':
+            return self.monitor_buffer.count if self.monitor_buffer is not None else 0
+        if scan_mode == 'Repeated Scan':
+            return self.completed_points
+        return len(self.intensities)
+
+    def update_scan_time_model(self):
+        ''' Calibrates the scan time model with the timings of the finished acquisition and saves it. '''
+        velocity, acceleration = self.stage_motion()
+        self.scan_time_model.update(self.timer, self.settings, velocity, acceleration, self.sample_rate)
+        try:
+            self.scan_time_model.save(self.scan_time_model_path)
+        except OSError as error:
+            print(f'Could not save the scan time model: {error}')
+
+    async def publish_status(self):
+        ''' Sends a 'status' event to the listeners every status_interval, concurrently with the acquisition. '''
+        while True:
+            await asyncio.sleep(self.status_interval)
+            throughput = self.timer.throughput()
+            self.notify('status', position=self.delay_stage.position, points=self.timer.points,
+                        throughput=throughput if np.isfinite(throughput) else None, remaining_time=self.remaining_time())
+
+    def wait(self, timeout=None):
+        ''' Blocks until the running acquisition finished, including its saving. '''
+        self.orchestrator.wait(timeout)
+
+    def run(self, settings=None, duration=None):
+        ''' Acquires with settings and blocks until finished. Monitoring (which never finishes by itself) stops after duration (s). '''
+        self.acquire(settings)
+        try:
+            self.wait(duration)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop_acquire()
+            self.wait()
+        return self.fit_result
+
+    def process_blocks(self, blocks):
+        ''' Reduces a batch of (position, data, ...) sample blocks to intensities, updates the plot and saves them.
+            Runs on the processing worker so the acquisition loop never waits on it.
+        '''
+        timer = self.timer
+        points = len(blocks)
+        positions = [block[0] for block in blocks]
+        data = [block[1] for block in blocks]
+        if self.sample_sink is not None:
+            self.sample_sink(data)
+        with timer.phase('reduce', points):
+            intensities, phases = self.reduce_blocks(data)
+        columns = [positions, intensities] if phases is None else [positions, intensities, phases]
+        scan_mode = self.settings['scan mode']
+        if self.listeners:
+            self.notify('points', scan_mode=scan_mode, positions=positions, intensities=intensities, phases=phases)
+        if scan_mode == 'Repeated Scan':
+            self.process_repeated_blocks(blocks, columns)
+            return
+        with timer.phase('save', points):
+            if self.raw_archive:
+                for index, (position, data) in enumerate(blocks, start=len(self.intensities)):
+                    self.raw_archive.write(index, position, data)
+        if scan_mode == 'Monitor':
+            self.monitor_buffer.extend(intensities)
+        else:
+            self.intensities.extend(intensities)
+            self.positions.extend(positions)
+            if phases is not None:
+                self.phases.extend(phases)
+            with timer.phase('fit', points):
+                self.update_fit(positions, intensities)
+        # monitor points are plotted against reading number, scan points against delay
+        x_axis = None if scan_mode == 'Monitor' else positions
+        with timer.phase('plot', points):
+            self.display.appendIntensityPlot(intensities, x_axis)
+        with timer.phase('save', points):
+            if self.writer:
+                self.writer.append_rows(np.column_stack(columns))
+            if self.journal:
+                self.journal.checkpoint(len(self.intensities), self.writer)
+
+    def process_streamed_blocks(self, blocks):
+        ''' process_blocks for blocks streamed from the sensor's buffer pool, which are returned to the pool afterwards. '''
+        try:
+            self.process_blocks(blocks)
+        finally:
+            for block in blocks:
+                self.sensor.release(block[1])
+
+    def process_repeated_blocks(self, blocks, columns):
+        ''' Adds (position, data, index, pass) blocks with their reduced [positions, intensities(, phases)] to the
+            per-delay statistics and plots the averaged trace.
+        '''
+        timer = self.timer
+        points = len(blocks)
+        intensities = columns[1]
+        indices = [block[2] for block in blocks]
+        if self.settings['bidirectional']:
+            # odd passes are the reverse sweeps
+            self.accumulator.add(indices, intensities, [block[3] % 2 == 1 for block in blocks])
+        else:
+            self.accumulator.add(indices, intensities)
+        measured = self.accumulator.measured
+        x_axis = self.accumulator.positions[measured]
+        mean = self.accumulator.mean[measured]
+        with timer.phase('plot', points):
+            self.display.setAveragedPlot(mean, self.accumulator.standard_error[measured], x_axis)
+
+        with timer.phase('fit', points):
+            self.refit_averaged(x_axis, mean, measured)
+
+        with timer.phase('save', points):
+            if self.raw_archive:
+                for index, block in enumerate(blocks, start=self.completed_points):
+                    self.raw_archive.write(index, block[0], block[1])
+            self.completed_points += points
+            if self.writer:
+                passes = [block[3] for block in blocks]
+                self.writer.append_rows(np.column_stack([passes] + columns))
+            if self.journal:
+                self.journal.checkpoint(self.completed_points, self.writer, self.accumulator)
+
+    def refit_averaged(self, x_axis, mean, measured):
+        ''' Fits the averaged trace of the measured delays and plots the fitted curve. '''
+        # warm-started from the previous fit once the first pass covered every delay
+        if np.count_nonzero(measured) >= self.fitter.min_points:
+            initial = self.fit_result.params if self.fit_result is not None and measured.all() else None
+            t, y = self.delay_to_femto(x_axis), mean
+            if self.fitter.fringe_resolved:
+                fringes = fringe_envelope(t, y)
+                t, y = fringes.delay, fringes.dc
+            result = fit(t, y, self.fitter.model, initial=initial, max_iterations=self.fitter.max_iterations)
+            if result.success:
+                self.fit_result = result
+                self.notify_fit()
+                delays = np.linspace(result.params[1] - 3*result.autocorrelation_fwhm, result.params[1] + 3*result.autocorrelation_fwhm, 500)
+                self.display.setFitPlot(result.evaluate(delays), self.zero_position + delays*0.000299792)
+
+    def notify_fit(self):
+        if self.listeners:
+            result = self.fit_result
+            self.notify('fit', pulse_duration=float(result.pulse_duration), pulse_duration_error=float(result.pulse_duration_error),
+                        autocorrelation_fwhm=float(result.autocorrelation_fwhm), model=result.model)
+
+    def update_fit(self, positions, intensities):
+        ''' Adds scan points to the pulse width fit, warm-started from the previous fit, and plots the fitted curve. '''
+        result = self.fitter.update(self.delay_to_femto(np.asarray(positions)), intensities)
+        if result is not None and result.success:
+            self.fit_result = result
+            self.notify_fit()
+            delays = self.fitter.t[:self.fitter.length]
+            delays = np.linspace(delays.min(), delays.max(), 500)
+            self.display.setFitPlot(result.evaluate(delays), self.zero_position + delays*0.000299792)
+
+    def open_raw_archive(self, number_of_positions, samples_per_position):
+        ''' Preallocates the raw sample archive if raw saving is enabled (or reopens it when resuming). '''
+        if self.settings['save'] and self.settings['save raw']:
+            self.raw_archive = RawArchive(self.save_directory, number_of_positions, samples_per_position, self.sensor.number_of_channels, resume=self.resuming)
+
+    def restore_scan(self, rows):
+        ''' Puts the saved rows (delay, intensity(, phase)) of an interrupted scan back into the trace and fit. '''
+        positions, intensities = rows[:, 0], rows[:, 1]
+        self.positions.extend(positions)
+        self.intensities.extend(intensities)
+        if rows.shape[1] > 2:
+            self.phases.extend(rows[:, 2])
+        self.update_fit(positions, intensities)
+        self.display.appendIntensityPlot(intensities, positions)
+
+    def finish_saving(self):
+        ''' Flushes and closes the scan and raw files, exports the scan to csv and saves the phase timings. '''
+        if self.raw_archive:
+            self.raw_archive.close()
+            self.raw_archive = None
+        if self.writer:
+            self.writer.close()
+            if self.export_csv:
+                self.writer.export_csv()
+            self.writer = None
+        if self.settings['save'] and self.save_directory:
+            self.timer.save(f'{self.save_directory}/timing.json')
+        if self.journal:
+            # the journal is finished last, once the data it counts is on disk
+            journal = self.journal
+            if journal.completed >= journal.total_points:
+                status = 'finished'
+            else:
+                status = 'failed' if self.error else 'stopped'
+            journal.finish(status, str(self.error) if self.error else None, self.accumulator if self.settings['scan mode'] == 'Repeated Scan' else None)
+            self.journal = None
+
+    def timed_blocks(self, blocks):
+        ''' Yields the streamed blocks, recording the wait for each as its read phase. '''
+        while True:
+            with self.timer.phase('read'):
+                item = next(blocks, None)
+            if item is None:
+                return
+            self.timer.point_done()
+            yield item
+
+    async def acquire_scan(self):
+        print('Scanning...')
+        self.intensities = []
+        self.positions = []
+        worker = ProcessingWorker(self.process_blocks)
+        worker.start()
+        # Calculate scan points, or continue the planned points of a resumed scan
+        samples = int(self.settings['samples'])
+        delay_positions = self.journal.positions if self.journal else self.scan_positions()
+        first = 0
+        if self.resuming:
+            first = self.journal.completed
+            if first:
+                self.restore_scan(load_scan(self.writer.path, mmap=False)[:first])
+        ### initiate scan
+        try:
+            await self.start_sensor()
+            self.open_raw_archive(len(delay_positions), samples)
+            def measure(position):
+                worker.submit(position, self.acquire_point(position, samples))
+                self.timer.point_done()
+            await self.hardware_loop(delay_positions[first:], measure)
+        except asyncio.CancelledError:
+            pass # stopped
+        except Exception as error:
+            # the journal keeps the completed points, so the scan can be resumed from here
+            print(f'Scan failed: {error}')
+            self.error = error
+        await self.orchestrator.run_blocking(worker.finish)
+        await self.orchestrator.run_blocking(self.finish_saving)
+        await self.stop_sensor()
+        print('scan finished')
+
+    async def acquire_fly_scan(self):
+        ''' Moves the stage at constant velocity from scan start to scan end while the DAQ streams continuously.
+
+            The stage speed is chosen so that each block of samples spans one scan step. The delay of each block is
+            reconstructed from its sample clock timestamp and the trapezoidal motion profile of the stage.
+        '''
+        print('Fly scanning...')
+        self.intensities = []
+        self.positions = []
+        worker = ProcessingWorker(self.process_streamed_blocks)
+        worker.start()
+        start = self.settings['scan start']
+        end   = self.settings['scan end']
+        step  = self.settings['scan step']
+        samples = int(self.settings['samples'])
+        block_time = samples/self.sample_rate
+        blocks = None
+
+        try:
+            await self.start_sensor()
+            stage = self.delay_stage
+            default_velocity = stage.get_velocity()
+            velocity = min(step/block_time, default_velocity)
+            acceleration = stage.get_acceleration()
+            move_duration = move_time(end - start, velocity, acceleration)
+            number_of_blocks = int(np.ceil(move_duration/block_time))
+            self.timer.expected_points = number_of_blocks
+            self.open_raw_archive(number_of_blocks, samples)
+
+            await self.hardware(self.move_stage, start)
+            try:
+                await self.orchestrator.call('command', stage.set_velocity, velocity)
+                blocks = await self.orchestrator.call('command', self.sensor.stream, samples, auto_release=False, timeout=self.orchestrator.timeout('read', block_time))
+                move_start = time.perf_counter()
+                stage.start_move(end)
+                def submit(item):
+                    block, data = item
+                    # time of the middle sample of the block relative to the start of the move
+                    block_center = self.sensor.stream_start_time + (block*samples + (samples - 1)/2)/self.sample_rate - move_start
+                    position = float(trapezoid_position(block_center, start, end, velocity, acceleration))
+                    worker.submit(position, data)
+                    return block >= number_of_blocks - 1
+                await self.hardware_loop(self.timed_blocks(blocks), submit)
+                await self.orchestrator.call('move', stage.wait_until_idle, expected=move_duration)
+            finally:
+                # halts the stage if the scan was stopped early, otherwise it is already idle
+                await self.orchestrator.run_blocking(stage.stop)
+                await self.orchestrator.call('command', stage.set_velocity, default_velocity)
+        except asyncio.CancelledError:
+            pass # stopped
+        except Exception as error:
+            print(f'Fly scan failed: {error}')
+            self.error = error
+        await self.orchestrator.run_blocking(worker.finish)
+        await self.orchestrator.run_blocking(self.finish_saving)
+        await self.stop_sensor(blocks)
+        print('Fly scan finished')
+
+    async def acquire_adaptive_scan(self, coarse_factor=8, max_passes=8, target_uncertainty=0.005):
+        ''' Coarse uniform pass followed by refinement passes that only bisect intervals with signal or high curvature.
+
+            Stops when no interval needs refinement at the fine scan step, the relative pulse duration uncertainty of the
+            fit drops below target_uncertainty, or after max_passes refinement passes. The saved scan is sorted by delay
+            once finished, the raw blocks stay in acquisition order.
+        '''
+        print('Adaptive scanning...')
+        self.intensities = []
+        self.positions = []
+        worker = ProcessingWorker(self.process_blocks)
+        worker.start()
+        start = self.settings['scan start']
+        end   = self.settings['scan end']
+        step  = self.settings['scan step']
+        samples = int(self.settings['samples'])
+
+        delay_positions = coarse_positions(start, end, step, coarse_factor)
+        try:
+            await self.start_sensor()
+            self.open_raw_archive(max_points(start, end, step), samples) # blocks are archived in acquisition order
+            def measure(position):
+                worker.submit(position, self.acquire_point(position, samples))
+                self.timer.point_done()
+            for scan_pass in range(max_passes + 1):
+                await self.hardware_loop(delay_positions, measure)
+
+                await self.orchestrator.run_blocking(worker.drain)
+                # redraw sorted so refinement points do not zigzag across the trace
+                order = np.argsort(self.positions)
+                self.display.clearIntensityPlot()
+                self.display.appendIntensityPlot(np.asarray(self.intensities)[order], np.asarray(self.positions)[order])
+
+                result = self.fit_result
+                if result is not None and result.pulse_duration_error < target_uncertainty*result.pulse_duration:
+                    print(f'Pulse duration uncertainty target reached after {scan_pass} refinement passes.')
+                    break
+                delay_positions = refine_positions(self.positions, self.intensities, step)
+                if len(delay_positions) == 0:
+                    break
+                if scan_pass % 2 == 0:
+                    delay_positions = delay_positions[::-1] # alternate direction to avoid return travel
+        except asyncio.CancelledError:
+            pass # stopped
+        except Exception as error:
+            print(f'Adaptive scan failed: {error}')
+            self.error = error
+        await self.orchestrator.run_blocking(worker.finish)
+        if self.writer:
+            # refinement points are saved as they are measured, the finished scan is sorted by delay
+            await self.orchestrator.run_blocking(self.writer.close)
+            await self.orchestrator.run_blocking(sort_scan, self.writer.path)
+        await self.orchestrator.run_blocking(self.finish_saving)
+        await self.stop_sensor()
+        print(f'Adaptive scan finished ({len(self.intensities)} points)')
+
+    async def acquire_repeated_scan(self):
+        ''' Repeats the scan settings['passes'] times, accumulating the per-delay mean and variance of every pass.
+            Only the accumulated statistics are kept in memory and saved (averaged.npy/csv), plus each pass if enabled.
+            Bidirectional scans sweep back and forth instead of returning to the start after every pass, and merge
+            both directions after correcting the reverse sweeps for the stage backlash (see BidirectionalAccumulator).
+        '''
+        print('Repeated scanning...')
+        worker = ProcessingWorker(self.process_blocks)
+        worker.start()
+        samples = int(self.settings['samples'])
+        passes = int(self.settings['passes'])
+        delay_positions = self.journal.positions if self.journal else self.scan_positions()
+        bidirectional = self.settings['bidirectional']
+        if bidirectional:
+            self.accumulator = BidirectionalAccumulator(delay_positions, compensate=self.settings['backlash compensation'])
+        else:
+            self.accumulator = ScanAccumulator(delay_positions)
+        self.completed_points = 0
+        if self.resuming:
+            self.completed_points = self.journal.restore_accumulator(self.accumulator)
+            self.timer.expected_points = passes*len(delay_positions) - self.completed_points
+            measured = self.accumulator.measured
+            self.display.setAveragedPlot(self.accumulator.mean[measured], self.accumulator.standard_error[measured], self.accumulator.positions[measured])
+        first_pass, first_index = divmod(self.completed_points, len(delay_positions))
+        def sweep(scan_pass):
+            ''' Indices of the delays in the order a pass measures them. '''
+            return range(len(delay_positions) - 1, -1, -1) if bidirectional and scan_pass % 2 else range(len(delay_positions))
+
+        try:
+            await self.start_sensor()
+            self.open_raw_archive(passes*len(delay_positions), samples) # every pass, in acquisition order
+            def measure(point):
+                scan_pass, index = point
+                position = delay_positions[index]
+                worker.submit(position, self.acquire_point(position, samples), index, scan_pass)
+                self.timer.point_done()
+                if index == sweep(scan_pass)[-1]:
+                    print(f'Pass {scan_pass + 1}/{passes} finished')
+            points = ((scan_pass, index) for scan_pass in range(first_pass, passes) for index in sweep(scan_pass)[first_index if scan_pass == first_pass else 0:])
+            await self.hardware_loop(points, measure)
+        except asyncio.CancelledError:
+            pass # stopped
+        except Exception as error:
+            print(f'Repeated scan failed: {error}')
+            self.error = error
+        await self.orchestrator.run_blocking(worker.finish)
+        if bidirectional and self.accumulator.backlash is not None:
+            print(f'Backlash of the reverse sweeps: {1000*self.accumulator.backlash:.2f} um ({self.accumulator.backlash/0.000299792:.1f} fs)')
+        if self.settings['save']:
+            await self.orchestrator.run_blocking(self.accumulator.save, f'{self.save_directory}/averaged.npy', '', self.intensity_unit)
+        await self.orchestrator.run_blocking(self.finish_saving)
+        await self.stop_sensor()
+        print('Repeated scan finished')
+
+    async def acquire_monitor(self):
+        print('Monitoring...')
+        self.monitor_buffer = RingBuffer(self.settings['history length'])
+        worker = ProcessingWorker(self.process_streamed_blocks)
+        worker.start()
+        samples = int(self.settings['samples'])
+        blocks = None
+        try:
+            await self.start_sensor()
+            # the stage does not move while monitoring
+            position = self.delay_stage.get_position()
+            blocks = await self.orchestrator.call('command', self.sensor.stream, samples, auto_release=False, timeout=self.orchestrator.timeout('read', samples/self.sample_rate))
+            await self.hardware_loop(self.timed_blocks(blocks), lambda item: worker.submit(position, item[1]))
+        except asyncio.CancelledError:
+            pass # stopped
+        except Exception as error:
+            print(f'Monitoring failed: {error}')
+            self.error = error
+        await self.orchestrator.run_blocking(worker.finish)
+        await self.orchestrator.run_blocking(self.finish_saving)
+        await self.stop_sensor(blocks)
+        print('Finished monitoring.')
+
+    def stop_acquire(self):
+        ''' Cancels the running acquisition. The current move or read is abandoned at once and the stage halted. '''
+        self.orchestrator.cancel()
+
+    def clear_data(self):
+        self.intensities = []
@@ -1,7 +1,12 @@
-from zaber_motion import Units, Library
-from zaber_motion.binary import Connection
+from threading import Thread
 
-Library.enable_device_db_store() # stores retrieved device info in local database
+try:
+    from zaber_motion import Units, Library
+    from zaber_motion.binary import Connection, BinarySettings
+
+    Library.enable_device_db_store() # stores retrieved device info in local database
+except:
+    print('zaber_motion import failed.')
 
 class DelayStageController:
     ''' Preferred usage with context manager (i.e. "with Connection.open_serial_port("COM5") as connection") so that connection properly closes. '''
@@ -10,6 +15,9 @@ class DelayStageController:
         self.connection = Connection.open_serial_port(serial_port)
         self.device = self.connection.detect_devices()[0]
         self.units = Units.LENGTH_MILLIMETRES
+        self.velocity_units = Units.VELOCITY_MILLIMETRES_PER_SECOND
+        self.acceleration_units = Units.ACCELERATION_MILLIMETRES_PER_SECOND_SQUARED
+        self.move_thread = None
 
     def __del__(self):
         if self.connection:
@@ -22,6 +30,37 @@ class DelayStageController:
     def set_position(self, position):
         self.device.move_absolute(position, self.units)
 
+    def start_move(self, position):
+        ''' Starts moving to position (mm) and returns immediately. Use wait_until_idle to block until the move is done. '''
+        self.move_thread = Thread(target=self.__move, args=(position,), daemon=True)
+        self.move_thread.start()
+
+    def __move(self, position):
+        try:
+            self.set_position(position)
+        except Exception as error:
+            print(f'Delay stage move interrupted: {error}')
+
+    def wait_until_idle(self):
+        if self.move_thread:
+            self.move_thread.join()
+            self.move_thread = None
+
+    def stop(self):
+        self.device.stop(self.units)
+        self.wait_until_idle()
+
+    def get_velocity(self):
+        ''' Target speed of moves (mm/s). '''
+        return self.device.settings.get(BinarySettings.TARGET_SPEED, self.velocity_units)
+
+    def set_velocity(self, velocity):
+        self.device.settings.set(BinarySettings.TARGET_SPEED, velocity, self.velocity_units)
+
+    def get_acceleration(self):
+        ''' Acceleration and deceleration of moves (mm/s^2). '''
+        return self.device.settings.get(BinarySettings.ACCELERATION, self.acceleration_units)
+
     def home(self):
         self.device.home()
 
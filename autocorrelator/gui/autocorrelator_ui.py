@@ -14,7 +14,7 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 class Ui_MainWindow(object):
     def setupUi(self, MainWindow):
         MainWindow.setObjectName("MainWindow")
-        MainWindow.resize(425, 400)
+        MainWindow.resize(425, 615)
         self.centralwidget = QtWidgets.QWidget(MainWindow)
         self.centralwidget.setObjectName("centralwidget")
         self.filenameLabel = QtWidgets.QLabel(self.centralwidget)
@@ -25,6 +25,9 @@ class Ui_MainWindow(object):
         self.scanModeWidget.setObjectName("scanModeWidget")
         self.scanModeWidget.addItem("")
         self.scanModeWidget.addItem("")
+        self.scanModeWidget.addItem("")
+        self.scanModeWidget.addItem("")
+        self.scanModeWidget.addItem("")
         self.acquireButton = QtWidgets.QPushButton(self.centralwidget)
         self.acquireButton.setGeometry(QtCore.QRect(330, 10, 81, 81))
         self.acquireButton.setObjectName("acquireButton")
@@ -154,6 +157,94 @@ class Ui_MainWindow(object):
         self.scanStepFemto = QtWidgets.QLabel(self.centralwidget)
         self.scanStepFemto.setGeometry(QtCore.QRect(260, 200, 47, 13))
         self.scanStepFemto.setObjectName("scanStepFemto")
+        self.rawCheckBox = QtWidgets.QCheckBox(self.centralwidget)
+        self.rawCheckBox.setGeometry(QtCore.QRect(280, 41, 45, 19))
+        self.rawCheckBox.setObjectName("rawCheckBox")
+        self.historyLabel = QtWidgets.QLabel(self.centralwidget)
+        self.historyLabel.setGeometry(QtCore.QRect(10, 320, 91, 16))
+        self.historyLabel.setObjectName("historyLabel")
+        self.historyWidget = QtWidgets.QSpinBox(self.centralwidget)
+        self.historyWidget.setGeometry(QtCore.QRect(100, 320, 81, 21))
+        self.historyWidget.setMinimum(10)
+        self.historyWidget.setMaximum(10000000)
+        self.historyWidget.setSingleStep(1000)
+        self.historyWidget.setProperty("value", 10000)
+        self.historyWidget.setObjectName("historyWidget")
+        self.monitorStatsLabel = QtWidgets.QLabel(self.centralwidget)
+        self.monitorStatsLabel.setGeometry(QtCore.QRect(10, 345, 401, 16))
+        self.monitorStatsLabel.setObjectName("monitorStatsLabel")
+        self.fitModelLabel = QtWidgets.QLabel(self.centralwidget)
+        self.fitModelLabel.setGeometry(QtCore.QRect(10, 370, 91, 16))
+        self.fitModelLabel.setObjectName("fitModelLabel")
+        self.fitModelWidget = QtWidgets.QComboBox(self.centralwidget)
+        self.fitModelWidget.setGeometry(QtCore.QRect(100, 370, 81, 22))
+        self.fitModelWidget.addItem("")
+        self.fitModelWidget.addItem("")
+        self.fitModelWidget.setObjectName("fitModelWidget")
+        self.fitLabel = QtWidgets.QLabel(self.centralwidget)
+        self.fitLabel.setGeometry(QtCore.QRect(190, 370, 221, 16))
+        self.fitLabel.setObjectName("fitLabel")
+        self.fringeCheckBox = QtWidgets.QCheckBox(self.centralwidget)
+        self.fringeCheckBox.setGeometry(QtCore.QRect(10, 395, 171, 19))
+        self.fringeCheckBox.setObjectName("fringeCheckBox")
+        self.passesLabel = QtWidgets.QLabel(self.centralwidget)
+        self.passesLabel.setGeometry(QtCore.QRect(10, 420, 91, 16))
+        self.passesLabel.setObjectName("passesLabel")
+        self.passesWidget = QtWidgets.QSpinBox(self.centralwidget)
+        self.passesWidget.setGeometry(QtCore.QRect(100, 420, 61, 21))
+        self.passesWidget.setMinimum(1)
+        self.passesWidget.setMaximum(1000)
+        self.passesWidget.setSingleStep(1)
+        self.passesWidget.setProperty("value", 20)
+        self.passesWidget.setObjectName("passesWidget")
+        self.passDataCheckBox = QtWidgets.QCheckBox(self.centralwidget)
+        self.passDataCheckBox.setGeometry(QtCore.QRect(180, 420, 131, 19))
+        self.passDataCheckBox.setObjectName("passDataCheckBox")
+        self.normalizeCheckBox = QtWidgets.QCheckBox(self.centralwidget)
+        self.normalizeCheckBox.setGeometry(QtCore.QRect(10, 445, 221, 19))
+        self.normalizeCheckBox.setObjectName("normalizeCheckBox")
+        self.timingLabel = QtWidgets.QLabel(self.centralwidget)
+        self.timingLabel.setGeometry(QtCore.QRect(10, 470, 401, 16))
+        self.timingLabel.setObjectName("timingLabel")
+        self.reducerLabel = QtWidgets.QLabel(self.centralwidget)
+        self.reducerLabel.setGeometry(QtCore.QRect(10, 495, 81, 16))
+        self.reducerLabel.setObjectName("reducerLabel")
+        self.reducerWidget = QtWidgets.QComboBox(self.centralwidget)
+        self.reducerWidget.setGeometry(QtCore.QRect(100, 495, 81, 22))
+        self.reducerWidget.addItem("")
+        self.reducerWidget.addItem("")
+        self.reducerWidget.addItem("")
+        self.reducerWidget.addItem("")
+        self.reducerWidget.setObjectName("reducerWidget")
+        self.lockInFrequencyWidget = QtWidgets.QDoubleSpinBox(self.centralwidget)
+        self.lockInFrequencyWidget.setGeometry(QtCore.QRect(190, 495, 71, 22))
+        self.lockInFrequencyWidget.setDecimals(1)
+        self.lockInFrequencyWidget.setMinimum(0.1)
+        self.lockInFrequencyWidget.setMaximum(100000.0)
+        self.lockInFrequencyWidget.setProperty("value", 137.0)
+        self.lockInFrequencyWidget.setObjectName("lockInFrequencyWidget")
+        self.lockInFrequencyLabel = QtWidgets.QLabel(self.centralwidget)
+        self.lockInFrequencyLabel.setGeometry(QtCore.QRect(265, 495, 21, 16))
+        self.lockInFrequencyLabel.setObjectName("lockInFrequencyLabel")
+        self.lockInReferenceCheckBox = QtWidgets.QCheckBox(self.centralwidget)
+        self.lockInReferenceCheckBox.setGeometry(QtCore.QRect(290, 495, 121, 17))
+        self.lockInReferenceCheckBox.setObjectName("lockInReferenceCheckBox")
+        self.phaseLabel = QtWidgets.QLabel(self.centralwidget)
+        self.phaseLabel.setGeometry(QtCore.QRect(10, 520, 401, 16))
+        self.phaseLabel.setObjectName("phaseLabel")
+        self.resumeButton = QtWidgets.QPushButton(self.centralwidget)
+        self.resumeButton.setGeometry(QtCore.QRect(330, 160, 81, 23))
+        self.resumeButton.setObjectName("resumeButton")
+        self.bidirectionalCheckBox = QtWidgets.QCheckBox(self.centralwidget)
+        self.bidirectionalCheckBox.setGeometry(QtCore.QRect(320, 420, 91, 19))
+        self.bidirectionalCheckBox.setObjectName("bidirectionalCheckBox")
+        self.backlashCheckBox = QtWidgets.QCheckBox(self.centralwidget)
+        self.backlashCheckBox.setGeometry(QtCore.QRect(10, 545, 171, 19))
+        self.backlashCheckBox.setChecked(True)
+        self.backlashCheckBox.setObjectName("backlashCheckBox")
+        self.backlashLabel = QtWidgets.QLabel(self.centralwidget)
+        self.backlashLabel.setGeometry(QtCore.QRect(190, 545, 221, 16))
+        self.backlashLabel.setObjectName("backlashLabel")
         MainWindow.setCentralWidget(self.centralwidget)
         self.menubar = QtWidgets.QMenuBar(MainWindow)
         self.menubar.setGeometry(QtCore.QRect(0, 0, 425, 21))
@@ -172,6 +263,9 @@ class Ui_MainWindow(object):
         self.filenameLabel.setText(_translate("MainWindow", "Filename"))
         self.scanModeWidget.setItemText(0, _translate("MainWindow", "Scan"))
         self.scanModeWidget.setItemText(1, _translate("MainWindow", "Monitor"))
+        self.scanModeWidget.setItemText(2, _translate("MainWindow", "Fly Scan"))
+        self.scanModeWidget.setItemText(3, _translate("MainWindow", "Adaptive Scan"))
+        self.scanModeWidget.setItemText(4, _translate("MainWindow", "Repeated Scan"))
         self.acquireButton.setText(_translate("MainWindow", "Acquire"))
         self.directoryBrowseButton.setText(_translate("MainWindow", "Browse"))
         self.saveCheckBox.setText(_translate("MainWindow", "Save"))
@@ -195,6 +289,30 @@ class Ui_MainWindow(object):
         self.shutterButton.setText(_translate("MainWindow", "Shutter"))
         self.shutterStatusLabel.setText(_translate("MainWindow", "Closed"))
         self.scanStepFemto.setText(_translate("MainWindow", "0 fs"))
+        self.rawCheckBox.setText(_translate("MainWindow", "Raw"))
+        self.historyLabel.setText(_translate("MainWindow", "Monitor History:"))
+        self.monitorStatsLabel.setText(_translate("MainWindow", "Mean: - V   Std: - V   Min: - V   Max: - V"))
+        self.fitModelLabel.setText(_translate("MainWindow", "Fit Model:"))
+        self.fitModelWidget.setItemText(0, _translate("MainWindow", "sech2"))
+        self.fitModelWidget.setItemText(1, _translate("MainWindow", "gaussian"))
+        self.fitLabel.setText(_translate("MainWindow", "Pulse Duration: -"))
+        self.fringeCheckBox.setText(_translate("MainWindow", "Fringe-resolved trace"))
+        self.passesLabel.setText(_translate("MainWindow", "Passes:"))
+        self.passDataCheckBox.setText(_translate("MainWindow", "Save each pass"))
+        self.normalizeCheckBox.setText(_translate("MainWindow", "Normalize to reference"))
+        self.timingLabel.setText(_translate("MainWindow", "Throughput: - points/s   Remaining: -"))
+        self.reducerLabel.setText(_translate("MainWindow", "Reducer:"))
+        self.reducerWidget.setItemText(0, _translate("MainWindow", "mean"))
+        self.reducerWidget.setItemText(1, _translate("MainWindow", "median"))
+        self.reducerWidget.setItemText(2, _translate("MainWindow", "trimmed mean"))
+        self.reducerWidget.setItemText(3, _translate("MainWindow", "lock-in"))
+        self.lockInFrequencyLabel.setText(_translate("MainWindow", "Hz"))
+        self.lockInReferenceCheckBox.setText(_translate("MainWindow", "Chopper Reference"))
+        self.phaseLabel.setText(_translate("MainWindow", "Lock-in Phase: -"))
+        self.resumeButton.setText(_translate("MainWindow", "Resume..."))
+        self.bidirectionalCheckBox.setText(_translate("MainWindow", "Bidirectional"))
+        self.backlashCheckBox.setText(_translate("MainWindow", "Backlash compensation"))
+        self.backlashLabel.setText(_translate("MainWindow", "Backlash: -"))
 
 
 if __name__ == "__main__":
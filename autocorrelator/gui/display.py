@@ -1,3 +1,5 @@
+from collections import deque
+
 import numpy as np
 import pyqtgraph as pg
 from PyQt5 import QtWidgets, QtCore, QtGui
@@ -14,6 +16,7 @@ class Display(pg.GraphicsLayoutWidget):
     signal = Signal()
         
     __title  = "Autocorrelator - Display"
+    frame_rate = 30 # maximum plot redraws per second
 
     def __init__(self, parent=None):
         ''' Displays autocorrelator data.
@@ -21,6 +24,17 @@ class Display(pg.GraphicsLayoutWidget):
         super().__init__()
         self.parent = parent
 
+        # points appended from acquisition threads wait here until the next frame is drawn
+        self.pending = deque()
+        self.x_data = np.empty(1024)
+        self.y_data = np.empty(1024)
+        self.length = 0
+        self.readings = 0 # readings appended since the last clear, numbers the points plotted without an x axis
+        self.history_length = None # if set, only the most recent history_length points are kept
+        self.pending_fit = None
+        self.pending_average = None
+        self.pending_timing = None
+
         self.setupUI()
         self.setupSignals()
         self.activateWindow()
@@ -28,17 +42,37 @@ class Display(pg.GraphicsLayoutWidget):
 
     def setupUI(self):
         self.setWindowTitle(self.__title)
-        self.resize(1200, 400)
+        self.resize(1200, 550)
         screen = QtGui.QGuiApplication.primaryScreen().geometry()
         self.move(0,int(0.25*screen.height()))
             
         # Add empty plot
         plot = self.addPlot(row=0, col=0)
+        plot.setDownsampling(auto=True, mode='peak')
+        plot.setClipToView(True)
         self.plot = plot.plot() # Initializes plot so it can be updated later
+        self.fit_plot = plot.plot(pen=pg.mkPen('r', width=2))
+        self.error_bars = pg.ErrorBarItem(x=np.zeros(0), y=np.zeros(0), height=np.zeros(0))
+        plot.addItem(self.error_bars)
+
+        # Per-point phase timing histograms below the intensity plot
+        timing_plot = self.addPlot(row=1, col=0)
+        timing_plot.setLogMode(x=True)
+        timing_plot.setLabel('bottom', 'Time per point', units='s')
+        timing_plot.setLabel('left', 'Points')
+        timing_plot.addLegend(offset=(-10, 10))
+        self.ci.layout.setRowStretchFactor(0, 3)
+        self.ci.layout.setRowStretchFactor(1, 1)
+        self.timing_plot = timing_plot
+        self.timing_curves = {}
 
     def setupSignals(self):
         ''' Connects signals to slots. '''
-        pass
+        # Frame timer that draws the points appended since the last frame
+        self.frame_timer = QtCore.QTimer(self)
+        self.frame_timer.setInterval(int(1000/self.frame_rate)) # in milliseconds
+        self.frame_timer.timeout.connect(self.drawFrame)
+        self.frame_timer.start()
 
     def setIntensityPlot(self, intensity_data, x_axis=None):
         ''' Sets the average intensity plot. 
@@ -47,11 +81,98 @@ class Display(pg.GraphicsLayoutWidget):
                 intensity_data = 1D array containing the sensor intensity readings acquired so far in the scan.
                 x_axis = 1D array containing the delay positions (mm) or delay time (fs) to associate with each delay position in the scan (deault is None)
         '''
-        if x_axis:
+        if x_axis is not None:
             self.plot.setData(y=intensity_data, x=x_axis)
         else:
             self.plot.setData(intensity_data)
 
+    def appendIntensityData(self, intensity_data, x_axis=None):
+        ''' Appends points to the intensity plot. Safe to call from any thread; the plot is redrawn at most frame_rate times per second.
+
+            INPUT :
+                intensity_data = 1D array containing the new sensor intensity readings.
+                x_axis = 1D array containing the delay positions of the new readings (default is None, which plots against reading number)
+        '''
+        intensity_data = np.asarray(intensity_data, dtype=np.float64)
+        if x_axis is not None:
+            x_axis = np.asarray(x_axis, dtype=np.float64)
+        self.pending.append((intensity_data, x_axis))
+
+    def setHistoryLength(self, history_length=None):
+        ''' Limits the plot to the most recent history_length points (None keeps every point). '''
+        self.history_length = history_length
+
+    def clearIntensityData(self):
+        ''' Clears the intensity and fit plots at the next frame. Safe to call from any thread. '''
+        self.pending.append(None)
+        self.pending_fit = (np.zeros(0), np.zeros(0))
+        self.pending_average = (np.zeros(0), np.zeros(0), np.zeros(0))
+
+    def setAveragedData(self, intensity_data, error_data, x_axis):
+        ''' Replaces the intensity plot with an averaged trace and error bars (+/- error_data) at the next frame. Safe to call from any thread. '''
+        self.pending_average = tuple(np.asarray(data, dtype=np.float64) for data in (intensity_data, error_data, x_axis))
+
+    def setFitData(self, fit_data, x_axis):
+        ''' Replaces the fitted curve at the next frame. Safe to call from any thread. '''
+        self.pending_fit = (np.asarray(fit_data, dtype=np.float64), np.asarray(x_axis, dtype=np.float64))
+
+    def setTimingData(self, histograms, bins):
+        ''' Replaces the phase timing histograms at the next frame. Safe to call from any thread.
+
+            INPUT :
+                histograms = dictionary of phase name to the number of points per bin.
+                bins = 1D array of the bin edges (s), one more than each histogram.
+        '''
+        self.pending_timing = (histograms, np.asarray(bins, dtype=np.float64))
+
+    def drawTiming(self, histograms, bins):
+        for index, (name, counts) in enumerate(histograms.items()):
+            if name not in self.timing_curves:
+                self.timing_curves[name] = self.timing_plot.plot(stepMode='center', pen=pg.mkPen(pg.intColor(index, hues=8), width=2), name=name)
+            self.timing_curves[name].setData(x=bins, y=counts)
+
+    def drawFrame(self):
+        ''' Moves pending points into the plot buffers and redraws the plot once. '''
+        pending_timing, self.pending_timing = self.pending_timing, None
+        if pending_timing is not None:
+            self.drawTiming(*pending_timing)
+        pending_fit, self.pending_fit = self.pending_fit, None
+        if pending_fit is not None:
+            self.fit_plot.setData(y=pending_fit[0], x=pending_fit[1])
+        pending_average, self.pending_average = self.pending_average, None
+        if pending_average is not None:
+            intensity_data, error_data, x_axis = pending_average
+            self.plot.setData(y=intensity_data, x=x_axis)
+            self.error_bars.setData(x=x_axis, y=intensity_data, height=2*np.nan_to_num(error_data))
+        if not self.pending:
+            return
+        while self.pending:
+            item = self.pending.popleft()
+            if item is None:
+                self.length = 0
+                self.readings = 0
+                continue
+            intensity_data, x_axis = item
+            if x_axis is None:
+                x_axis = np.arange(self.readings, self.readings + len(intensity_data))
+            self.readings += len(intensity_data)
+            end = self.length + len(intensity_data)
+            if end > len(self.y_data):
+                # grow buffers geometrically so appends stay amortized O(1)
+                size = max(2*len(self.y_data), end)
+                self.x_data = np.resize(self.x_data, size)
+                self.y_data = np.resize(self.y_data, size)
+            self.x_data[self.length:end] = x_axis
+            self.y_data[self.length:end] = intensity_data
+            self.length = end
+            if self.history_length and self.length > 2*self.history_length:
+                # drop old points in bulk so trimming stays amortized O(1) per point
+                self.x_data[:self.history_length] = self.x_data[self.length - self.history_length:self.length]
+                self.y_data[:self.history_length] = self.y_data[self.length - self.history_length:self.length]
+                self.length = self.history_length
+        start = max(0, self.length - self.history_length) if self.history_length else 0
+        self.plot.setData(x=self.x_data[start:self.length], y=self.y_data[start:self.length])
+
     def closeEvent(self, event):
         self.signal.close.emit()
         event.accept()
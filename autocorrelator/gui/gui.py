@@ -50,6 +50,39 @@ class AutocorrelatorGUI(QtWidgets.QMainWindow):
 
     def updateIntensityPlot(self, intensity_data, x_axis=None):
         self.display.setIntensityPlot(intensity_data, x_axis)
+
+    def appendIntensityPlot(self, intensity_data, x_axis=None):
+        ''' Thread-safe, frame-rate-limited append to the intensity plot. '''
+        display = self.display
+        if display is not None:
+            display.appendIntensityData(intensity_data, x_axis)
+
+    def setPlotHistoryLength(self, history_length=None):
+        if self.display is not None:
+            self.display.setHistoryLength(history_length)
+
+    def clearIntensityPlot(self):
+        display = self.display
+        if display is not None:
+            display.clearIntensityData()
+
+    def setAveragedPlot(self, intensity_data, error_data, x_axis):
+        ''' Thread-safe replacement of the intensity plot with an averaged trace and its error bars. '''
+        display = self.display
+        if display is not None:
+            display.setAveragedData(intensity_data, error_data, x_axis)
+
+    def setFitPlot(self, fit_data, x_axis):
+        ''' Thread-safe update of the fitted curve overlaid on the intensity plot. '''
+        display = self.display
+        if display is not None:
+            display.setFitData(fit_data, x_axis)
+
+    def setTimingPlot(self, histograms, bins):
+        ''' Thread-safe update of the phase timing histograms. '''
+        display = self.display
+        if display is not None:
+            display.setTimingData(histograms, bins)
     
     def getSettings(self):
         settings = {}
@@ -57,11 +90,23 @@ class AutocorrelatorGUI(QtWidgets.QMainWindow):
         settings['filename'] = self.ui.filenameText.text()
         settings['directory'] = self.ui.directoryText.text()
         settings['save'] = self.ui.saveCheckBox.isChecked()
+        settings['save raw'] = self.ui.rawCheckBox.isChecked()
         settings['scan start'] = self.ui.scanStartWidget.value()
         settings['scan end'] = self.ui.scanEndWidget.value()
         settings['scan step'] = self.ui.scanStepWidget.value()
         settings['samples'] = self.ui.scanSamplesWidget.value()
         settings['zero position'] = self.ui.delayZeroWidget.value()
+        settings['history length'] = self.ui.historyWidget.value()
+        settings['fit model'] = self.ui.fitModelWidget.currentText()
+        settings['fringe resolved'] = self.ui.fringeCheckBox.isChecked()
+        settings['passes'] = self.ui.passesWidget.value()
+        settings['save passes'] = self.ui.passDataCheckBox.isChecked()
+        settings['bidirectional'] = self.ui.bidirectionalCheckBox.isChecked()
+        settings['backlash compensation'] = self.ui.backlashCheckBox.isChecked()
+        settings['normalize'] = self.ui.normalizeCheckBox.isChecked()
+        settings['reducer'] = self.ui.reducerWidget.currentText()
+        settings['lock-in frequency'] = self.ui.lockInFrequencyWidget.value()
+        settings['lock-in reference'] = self.ui.lockInReferenceCheckBox.isChecked()
         return settings
 
     def closeEvent(self, event):
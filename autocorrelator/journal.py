@@ -0,0 +1,145 @@
+''' Journal of a saved scan, so an interrupted scan can be resumed from its last completed point.
+
+    The journal holds the settings, the planned delay positions and the number of completed points. It is
+    checkpointed to the save directory while the scan runs and every write is atomic (written to a temporary
+    file, then renamed over the journal), so a crash leaves either the previous or the new checkpoint, never a
+    partial one. Repeated scans also checkpoint their accumulated per-delay statistics.
+'''
+import json
+import os
+import time
+
+import numpy as np
+
+
+def write_atomic(path, write):
+    ''' Calls write(file) on a temporary file next to path, then renames it over path. '''
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as file:
+        write(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+class ScanJournal:
+    ''' Checkpointed state of a saved scan.
+
+        Usage:  journal = ScanJournal.create(directory, settings, positions)
+                journal.checkpoint(completed, writer)        # throttled, call after every processed batch
+                journal.checkpoint(completed, writer, accumulator) # repeated scans
+                journal.finish('finished')                   # or 'stopped', 'failed'
+
+                journal = ScanJournal.load(directory)        # after an interruption
+                journal.completed, journal.remaining_positions
+
+        Inputs :
+            directory (str): save directory of the scan.
+            settings (dict): acquisition settings.
+            positions (array): planned delay positions (mm) of one pass.
+            interval (float): minimum time between checkpoints (s).
+    '''
+    filename = 'journal.json'
+    accumulator_filename = 'journal_accumulator.npz'
+
+    def __init__(self, directory, settings, positions, completed=0, status='running', error=None, interval=0.5):
+        self.directory = directory
+        self.settings = dict(settings)
+        self.positions = np.asarray(positions, dtype=np.float64)
+        self.completed = completed # points done, counting every pass of a repeated scan
+        self.status = status
+        self.error = error
+        self.interval = interval
+        self.last_checkpoint = 0.
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, self.filename)
+
+    @property
+    def accumulator_path(self):
+        return os.path.join(self.directory, self.accumulator_filename)
+
+    @property
+    def total_points(self):
+        passes = int(self.settings['passes']) if self.settings['scan mode'] == 'Repeated Scan' else 1
+        return passes*len(self.positions)
+
+    @property
+    def remaining_positions(self):
+        ''' Positions left in the current pass, in the order they are measured. '''
+        if self.completed >= self.total_points:
+            return self.positions[:0]
+        scan_pass, index = divmod(self.completed, len(self.positions))
+        # the odd passes of bidirectional scans sweep back
+        positions = self.positions[::-1] if self.settings.get('bidirectional') and scan_pass % 2 else self.positions
+        return positions[index:]
+
+    @classmethod
+    def create(cls, directory, settings, positions):
+        journal = cls(directory, settings, positions)
+        journal.save()
+        return journal
+
+    @classmethod
+    def load(cls, directory):
+        ''' Journal of the scan saved in directory. Raises FileNotFoundError if it was not journaled. '''
+        with open(os.path.join(directory, cls.filename)) as file:
+            state = json.load(file)
+        return cls(directory, state['settings'], state['positions'], state['completed'], state['status'], state.get('error'))
+
+    def to_dict(self):
+        return {
+            'settings': self.settings,
+            'positions': self.positions.tolist(),
+            'completed': self.completed,
+            'total points': self.total_points,
+            'status': self.status,
+            'error': self.error,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+    def save(self):
+        state = json.dumps(self.to_dict(), indent=4).encode()
+        write_atomic(self.path, lambda file: file.write(state))
+
+    def checkpoint(self, completed, writer=None, accumulator=None, force=False):
+        ''' Records completed points (and the accumulator state) at most once per interval unless forced. The scan's
+            writer is flushed first, so the rows on disk cover every point the checkpoint counts.
+        '''
+        self.completed = completed
+        now = time.monotonic()
+        if not force and now - self.last_checkpoint < self.interval:
+            return
+        self.last_checkpoint = now
+        if writer is not None:
+            writer.flush()
+        if accumulator is not None:
+            # the statistics carry their own point count, so they stay consistent with themselves if the journal write is lost
+            arrays = {'completed': completed, **accumulator.state()}
+            write_atomic(self.accumulator_path, lambda file: np.savez(file, **arrays))
+        self.save()
+
+    def accumulated_points(self):
+        ''' Points included in the checkpointed statistics of a repeated scan, 0 if there are none. They are written
+            before the journal itself, so they can be ahead of completed after an interruption.
+        '''
+        try:
+            with np.load(self.accumulator_path) as state:
+                return int(state['completed'])
+        except FileNotFoundError:
+            return 0
+
+    def restore_accumulator(self, accumulator):
+        ''' Loads the checkpointed statistics into accumulator. Returns the number of points they include. '''
+        try:
+            state = np.load(self.accumulator_path)
+        except FileNotFoundError:
+            return 0
+        accumulator.restore(state)
+        return int(state['completed'])
+
+    def finish(self, status, error=None, accumulator=None):
+        self.status = status
+        self.error = error
+        self.checkpoint(self.completed, accumulator=accumulator, force=True)
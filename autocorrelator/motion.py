@@ -0,0 +1,58 @@
+''' Trapezoidal motion profile of the delay stage.
+
+    The stage accelerates at a constant rate up to its target speed, cruises, and decelerates to the target.
+    Short moves never reach the target speed and follow a triangular profile instead.
+'''
+import numpy as np
+
+
+def move_time(distance, velocity, acceleration):
+    ''' Time (s) for the stage to travel distance (mm) starting and ending at rest. '''
+    distance = abs(distance)
+    ramp_distance = velocity**2/acceleration # distance covered while accelerating and decelerating
+    if distance <= ramp_distance:
+        return 2*np.sqrt(distance/acceleration)
+    return 2*velocity/acceleration + (distance - ramp_distance)/velocity
+
+
+def trapezoid_position(t, start, end, velocity, acceleration):
+    ''' Stage position (mm) t seconds after starting a move from start to end.
+
+        Inputs :
+            t (float or array): time since the move started (s). Values outside the move are clipped.
+            start, end (float): move endpoints (mm).
+            velocity (float): target speed (mm/s).
+            acceleration (float): acceleration and deceleration (mm/s^2).
+
+        Returns :
+            position: same shape as t
+    '''
+    t = np.asarray(t, dtype=np.float64)
+    distance = abs(end - start)
+    direction = 1. if end >= start else -1.
+    total = move_time(distance, velocity, acceleration)
+    t = np.clip(t, 0., total)
+
+    # peak speed is lower than the target speed for triangular profiles
+    peak = min(velocity, np.sqrt(distance*acceleration))
+    t_ramp = peak/acceleration
+    ramp_distance = 0.5*acceleration*t_ramp**2
+
+    travelled = np.where(
+        t < t_ramp,
+        0.5*acceleration*t**2,
+        np.where(
+            t < total - t_ramp,
+            ramp_distance + peak*(t - t_ramp),
+            distance - 0.5*acceleration*(total - t)**2
+        )
+    )
+    return start + direction*travelled
+
+
+def constant_velocity_window(start, end, velocity, acceleration):
+    ''' Times (s) after starting a move at which the stage enters and leaves the constant velocity section. '''
+    distance = abs(end - start)
+    total = move_time(distance, velocity, acceleration)
+    t_ramp = min(velocity, np.sqrt(distance*acceleration))/acceleration
+    return t_ramp, total - t_ramp
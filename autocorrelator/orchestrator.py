@@ -0,0 +1,151 @@
+''' asyncio orchestration of acquisitions.
+
+    Each acquisition is a coroutine running as a task on an event loop thread owned by the orchestrator. Blocking
+    hardware calls are awaited on a single hardware thread (or the stage service thread for stage moves), each
+    with its own timeout, so the event loop stays free for concurrent tasks such as publishing the status while
+    the scan runs.
+
+    Stopping cancels the acquisition task: the await on the current move or read ends at once, the stage is
+    halted, and the acquisition's cleanup (flushing the processing worker, saving, stopping the DAQ task) runs
+    before the acquisition counts as finished. A read that is already running on the hardware thread completes
+    in the background, and the cleanup's hardware calls queue behind it.
+'''
+import asyncio
+import concurrent.futures
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+
+# time (s) a hardware operation may take beyond its expected duration before it fails with HardwareTimeout
+default_timeouts = {
+    'move': 10.,    # stage moves, expected duration from the motion profile
+    'read': 5.,     # DAQ reads and streamed blocks, expected duration from the sample clock
+    'command': 10., # opening and stopping tasks, stage settings
+}
+
+
+class HardwareTimeout(TimeoutError):
+    ''' A hardware operation did not finish within its timeout. '''
+
+
+class AcquisitionOrchestrator:
+    ''' Runs acquisition coroutines on a background event loop.
+
+        Usage:  orchestrator = AcquisitionOrchestrator()
+                future = orchestrator.start(acquisition()) # concurrent.futures.Future of the acquisition
+                orchestrator.running
+                orchestrator.cancel()  # stop
+                orchestrator.wait()
+                orchestrator.close()
+
+                # inside the acquisition coroutine
+                await orchestrator.call('command', sensor.stop)
+                await orchestrator.wait_for('move', stage.submit_move(position), expected=move_time(...))
+                await orchestrator.call(None, acquire_point, position) # no overall timeout, the steps time out themselves
+                orchestrator.timeout('read', samples/sample_rate)     # to pass to a driver's own timeout
+                orchestrator.spawn(publish_status())                  # cancelled when the acquisition ends
+
+        Inputs :
+            timeouts (dict): overrides of default_timeouts.
+    '''
+    def __init__(self, timeouts=None):
+        self.timeouts = dict(default_timeouts)
+        self.timeouts.update(timeouts or {})
+        self.hardware = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hardware') # one DAQ call at a time
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.future = None # of the current acquisition
+        self.task = None # task of the current acquisition, on the event loop
+        self.cancelled = False # the current acquisition was asked to stop
+        self.tasks = set() # concurrent tasks of the current acquisition
+
+    @property
+    def running(self):
+        return self.future is not None and not self.future.done()
+
+    def start(self, coroutine):
+        ''' Runs coroutine as the current acquisition. Returns its concurrent.futures.Future. '''
+        if self.running:
+            raise RuntimeError('An acquisition is already running.')
+        self.cancelled = False
+        self.future = asyncio.run_coroutine_threadsafe(self.__run(coroutine), self.loop)
+        return self.future
+
+    async def __run(self, coroutine):
+        self.task = asyncio.current_task()
+        if self.cancelled:
+            self.task.cancel() # stopped before it began, the coroutine still runs its cleanup
+        try:
+            return await coroutine
+        finally:
+            self.task = None
+            for task in self.tasks:
+                task.cancel()
+            self.tasks.clear()
+
+    def cancel(self):
+        ''' Stops the current acquisition. Only the first call cancels it, so repeated stops cannot interrupt its cleanup. '''
+        if self.running and not self.cancelled:
+            self.cancelled = True
+            self.loop.call_soon_threadsafe(self.__cancel)
+
+    def __cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def wait(self, timeout=None):
+        ''' Blocks until the current acquisition finished. Returns False if timeout (s) elapsed first. '''
+        if self.future is None:
+            return True
+        done, _ = concurrent.futures.wait([self.future], timeout)
+        return bool(done)
+
+    def spawn(self, coroutine):
+        ''' Runs coroutine concurrently with the current acquisition (on the event loop), until the acquisition ends. '''
+        task = self.loop.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def timeout(self, operation, expected=0.):
+        ''' Timeout (s) of an operation expected to take expected seconds. None for operation None, which has no timeout
+            of its own (i.e. a sequence of hardware operations that each have one).
+        '''
+        return expected + self.timeouts[operation] if operation is not None else None
+
+    async def wait_for(self, operation, future, expected=0.):
+        ''' Awaits a concurrent.futures.Future of a hardware operation, raising HardwareTimeout after its timeout.
+            (asyncio.wait rather than asyncio.wait_for, which can swallow a cancellation arriving as the operation completes.)
+        '''
+        timeout = self.timeout(operation, expected)
+        future = asyncio.wrap_future(future)
+        try:
+            done, _ = await asyncio.wait([future], timeout=timeout)
+        except asyncio.CancelledError:
+            future.cancel() # drops the operation if it has not started yet
+            raise
+        if not done:
+            future.cancel()
+            raise HardwareTimeout(f'{operation.capitalize()} did not finish within {timeout:.1f} s')
+        return future.result()
+
+    async def call(self, operation, function, *args, expected=0., **kwargs):
+        ''' Runs the blocking function(*args, **kwargs) on the hardware thread with the timeout of operation. '''
+        return await self.wait_for(operation, self.hardware.submit(functools.partial(function, *args, **kwargs)), expected)
+
+    async def idle(self):
+        ''' Waits until the calls already submitted to the hardware thread, including any abandoned by a cancellation, finished. '''
+        await asyncio.wrap_future(self.hardware.submit(lambda: None))
+
+    async def run_blocking(self, function, *args):
+        ''' Runs a blocking function that is not a hardware call (i.e. flushing the processing worker) off the event loop. '''
+        return await self.loop.run_in_executor(None, function, *args)
+
+    def close(self):
+        self.cancel()
+        self.wait()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.hardware.shutdown()
@@ -0,0 +1,71 @@
+''' Background processing of acquired sample blocks.
+
+    The acquisition loop only waits on hardware. Reduction, plotting and saving run on a worker thread which
+    handles every block that queued up while it was busy in one batch, so slow plotting or disk I/O never
+    delays the next stage move.
+'''
+import traceback
+from queue import Queue
+from threading import Thread
+
+
+class ProcessingWorker:
+    ''' Runs process(blocks) on a background thread for batches of submitted blocks.
+
+        Usage:  worker = ProcessingWorker(process)
+                worker.start()
+                worker.submit(position, data)
+                ...
+                worker.finish()
+
+        Inputs :
+            process (callable): called with a list of submitted argument tuples.
+            max_queued (int): submit blocks once this many blocks are waiting, bounding memory use.
+    '''
+    def __init__(self, process, max_queued=10000):
+        self.process = process
+        self.queue = Queue(maxsize=max_queued)
+        self.thread = None
+        self.error = None
+
+    def start(self):
+        self.error = None
+        self.thread = Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def submit(self, *block):
+        ''' Queues a block for processing. Raises the worker's exception if processing failed. '''
+        if self.error:
+            raise self.error
+        self.queue.put(block)
+
+    def drain(self):
+        ''' Blocks until every submitted block has been processed. '''
+        self.queue.join()
+
+    def finish(self):
+        ''' Processes the remaining blocks and stops the worker. '''
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def __run(self):
+        finished = False
+        while not finished:
+            blocks = [self.queue.get()]
+            while not self.queue.empty():
+                blocks.append(self.queue.get())
+            count = len(blocks)
+            if blocks[-1] is None:
+                finished = True
+                blocks.pop()
+            try:
+                if blocks and not self.error:
+                    self.process(blocks)
+            except Exception as error:
+                traceback.print_exc()
+                self.error = error
+            finally:
+                for _ in range(count):
+                    self.queue.task_done()
@@ -0,0 +1,115 @@
+''' Reducers turning blocks of samples into one intensity per block.
+
+    Every reducer works on a whole batch at once: data has shape (..., samples) and the reduction runs along the
+    last axis, so a batch of blocks (blocks, samples) or of multi-channel blocks (blocks, channels, samples) is
+    reduced without a Python loop.
+
+    The lock-in demodulates the signal at the chopper frequency. Only noise near that frequency passes, so the
+    1/f noise and drifts that limit the plain mean are rejected and fewer samples per point reach the same SNR.
+'''
+import numpy as np
+
+
+def mean(data):
+    return data.mean(axis=-1)
+
+
+def median(data):
+    ''' Median of each block, insensitive to occasional spikes. '''
+    return np.median(data, axis=-1)
+
+
+def trimmed_mean(data, proportion=0.1):
+    ''' Mean of each block without its lowest and highest proportion of samples. '''
+    samples = data.shape[-1]
+    cut = int(proportion*samples)
+    if cut == 0 or 2*cut >= samples:
+        return data.mean(axis=-1)
+    return np.sort(data, axis=-1)[..., cut:samples - cut].mean(axis=-1)
+
+
+class LockIn:
+    ''' Digital lock-in amplifier demodulating blocks at a reference frequency.
+
+        The block is multiplied by a Hann window and by exp(-i 2 pi f t), with t from the DAQ sample rate, and summed.
+        Subtracting the block mean first and the window keep the DC level and its drift from leaking into the result
+        when a block does not hold a whole number of periods.
+
+        Usage:  lock_in = LockIn(frequency=137., sample_rate=1000)
+                amplitude, phase = lock_in.demodulate(blocks)                    # phase relative to each block's first sample
+                amplitude, phase = lock_in.demodulate(blocks, chopper_reference) # phase relative to the chopper
+                intensities = lock_in(blocks)                                    # amplitude only
+
+        Inputs :
+            frequency (float): chopper frequency (Hz).
+            sample_rate (float): DAQ sample clock rate (Hz).
+            harmonic (int): demodulate at this multiple of frequency.
+    '''
+    def __init__(self, frequency, sample_rate, harmonic=1):
+        if not 0 < harmonic*frequency < sample_rate/2:
+            raise ValueError(f'Lock-in frequency {harmonic*frequency} Hz must be between 0 and the Nyquist frequency {sample_rate/2} Hz.')
+        self.frequency = frequency
+        self.sample_rate = sample_rate
+        self.harmonic = harmonic
+        self.__kernels = {} # samples per block: windowed complex reference
+
+    def kernel(self, samples):
+        ''' Windowed reference exp(-i 2 pi f t) for blocks of samples, normalized so a sine of amplitude A gives A. '''
+        if samples not in self.__kernels:
+            t = np.arange(samples)/self.sample_rate
+            window = np.hanning(samples) if samples > 2 else np.ones(samples)
+            self.__kernels[samples] = 2*window*np.exp(-2j*np.pi*self.harmonic*self.frequency*t)/window.sum()
+        return self.__kernels[samples]
+
+    def components(self, data):
+        ''' Complex amplitude (X + iY) of each block at the reference frequency. '''
+        data = np.asarray(data)
+        return (data - data.mean(axis=-1, keepdims=True)) @ self.kernel(data.shape[-1])
+
+    def demodulate(self, data, reference=None):
+        ''' Amplitude (V, peak) and phase (rad) of each block. With reference (the chopper's reference output, same shape
+            as data) the phase is measured against it instead of the first sample of the block.
+        '''
+        signal = self.components(data)
+        phase = np.angle(signal)
+        if reference is not None:
+            phase = np.angle(signal*np.conj(self.components(reference)))
+        return np.abs(signal), phase
+
+    def __call__(self, data):
+        return np.abs(self.components(data))
+
+
+reducers = {
+    'mean': mean,
+    'median': median,
+    'trimmed mean': trimmed_mean,
+    'lock-in': LockIn,
+}
+
+
+def create_reducer(name, sample_rate=None, frequency=None, trim=0.1):
+    ''' Reducer function (or LockIn) for a settings name. '''
+    if name == 'lock-in':
+        return LockIn(frequency, sample_rate)
+    if name == 'trimmed mean':
+        return lambda data: trimmed_mean(data, trim)
+    if name not in reducers:
+        raise ValueError(f"Unknown reducer: {name}, choose from {', '.join(reducers)}")
+    return reducers[name]
+
+
+if __name__ == '__main__':
+    # Chopped signal on a drifting background: the lock-in recovers the modulation amplitude, the mean does not
+    rng = np.random.default_rng(0)
+    sample_rate, frequency, samples = 1000, 137., 200
+    t = np.arange(100*samples)/sample_rate
+    chopper = (t*frequency % 1) < 0.5
+    background = 0.5*np.sin(2*np.pi*0.3*t) + np.cumsum(rng.normal(0., 0.002, len(t)))
+    data = (0.1*chopper + background + rng.normal(0., 0.05, len(t))).reshape(-1, samples)
+    reference = (5.*chopper).reshape(-1, samples)
+
+    lock_in = LockIn(frequency, sample_rate)
+    amplitude, phase = lock_in.demodulate(data, reference)
+    print(f'Mean:    {mean(data).mean():.4f} +/- {mean(data).std():.4f} V')
+    print(f'Lock-in: {amplitude.mean():.4f} +/- {amplitude.std():.4f} V (fundamental of a 0.1 V square wave: {0.2/np.pi:.4f} V), phase {phase.mean():.3f} rad')
@@ -0,0 +1,117 @@
+''' Fixed-capacity ring buffer with rolling statistics for long monitor sessions. '''
+from collections import deque
+from threading import Lock
+
+import numpy as np
+
+
+class RingBuffer:
+    ''' Keeps the most recent capacity values in a preallocated NumPy array.
+
+        The rolling mean, standard deviation, minimum and maximum of the buffered values are updated
+        incrementally on every extend, so the cost per update is independent of how long the session runs.
+
+        Usage:  buffer = RingBuffer(capacity=10000)
+                buffer.extend(intensities)
+                buffer.mean, buffer.std, buffer.min, buffer.max
+                buffer.values()
+    '''
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.data = np.zeros(self.capacity, dtype=np.float64)
+        self.count = 0 # total number of values ever added
+        self.lock = Lock()
+
+        self.__sum = 0.
+        self.__sum_squares = 0.
+        # monotonic queues of (count, value) for the sliding window minimum and maximum
+        self.__minima = deque()
+        self.__maxima = deque()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        skipped = max(len(values) - self.capacity, 0) # overwritten by the end of the batch itself
+        values = values[skipped:]
+        if len(values) == 0:
+            return
+        with self.lock:
+            buffered = len(self)
+            if skipped:
+                # the batch replaces every buffered value
+                self.count += skipped
+                self.__sum = 0.
+                self.__sum_squares = 0.
+                self.__minima.clear()
+                self.__maxima.clear()
+                buffered = 0
+            start = self.count % self.capacity
+            indices = (start + np.arange(len(values))) % self.capacity
+            # the value at count c overwrites the one at count c - capacity, if there was one
+            evicted = self.data[indices[self.capacity - buffered:]]
+
+            self.__sum += values.sum() - evicted.sum()
+            self.__sum_squares += np.dot(values, values) - np.dot(evicted, evicted)
+            self.data[indices] = values
+
+            first = self.count
+            self.count += len(values)
+            for count, value in enumerate(values.tolist(), start=first):
+                while self.__minima and self.__minima[-1][1] >= value:
+                    self.__minima.pop()
+                self.__minima.append((count, value))
+                while self.__maxima and self.__maxima[-1][1] <= value:
+                    self.__maxima.pop()
+                self.__maxima.append((count, value))
+            oldest = self.count - len(self)
+            while self.__minima[0][0] < oldest:
+                self.__minima.popleft()
+            while self.__maxima[0][0] < oldest:
+                self.__maxima.popleft()
+
+            if self.count//self.capacity != first//self.capacity:
+                # resum once per lap around the buffer so rounding errors cannot accumulate
+                window = self.data[:len(self)]
+                self.__sum = window.sum()
+                self.__sum_squares = np.dot(window, window)
+
+    def values(self):
+        ''' Buffered values, oldest first (copy). '''
+        with self.lock:
+            if self.count <= self.capacity:
+                return self.data[:self.count].copy()
+            start = self.count % self.capacity
+            return np.concatenate((self.data[start:], self.data[:start]))
+
+    def clear(self):
+        with self.lock:
+            self.count = 0
+            self.__sum = 0.
+            self.__sum_squares = 0.
+            self.__minima.clear()
+            self.__maxima.clear()
+
+    @property
+    def mean(self):
+        n = len(self)
+        return self.__sum/n if n else np.nan
+
+    @property
+    def std(self):
+        n = len(self)
+        if not n:
+            return np.nan
+        mean = self.__sum/n
+        return np.sqrt(max(self.__sum_squares/n - mean**2, 0.))
+
+    @property
+    def min(self):
+        minima = self.__minima
+        return minima[0][1] if minima else np.nan
+
+    @property
+    def max(self):
+        maxima = self.__maxima
+        return maxima[0][1] if maxima else np.nan
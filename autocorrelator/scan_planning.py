@@ -0,0 +1,68 @@
+''' Delay position planning for adaptive coarse-to-fine scans.
+
+    A coarse uniform pass locates the autocorrelation. Each refinement pass bisects the intervals that contain
+    signal or strong curvature until they reach the fine step, so flat baseline far from zero delay is only
+    sampled at the coarse step.
+'''
+import numpy as np
+
+
+def step_positions(start, end, step):
+    ''' Delay positions (mm) of one pass of a step scan from start to end (either way), the end included. '''
+    if end < start:
+        step = -abs(step)
+    return np.arange(start, end + step, step)
+
+
+def coarse_positions(start, end, step, coarse_factor=8):
+    ''' Uniform grid at coarse_factor times the fine step. A power of two keeps the bisected points on the fine grid. '''
+    coarse_step = step*coarse_factor
+    if end < start:
+        coarse_step = -coarse_step
+    positions = np.arange(start, end + coarse_step/2, coarse_step)
+    if not np.isclose(positions[-1], end):
+        positions = np.append(positions, end)
+    return positions
+
+
+def max_points(start, end, step):
+    ''' Upper bound of the points an adaptive scan measures: intervals are only bisected while wider than 1.5 steps,
+        so no two points are closer than 0.75 step.
+    '''
+    return int(np.ceil(abs(end - start)/(0.75*abs(step)))) + 1
+
+
+def refine_positions(positions, intensities, step, signal_threshold=0.05, curvature_threshold=0.05):
+    ''' Midpoints of the measured intervals that still need refinement.
+
+        An interval (wider than the fine step) is refined when either end has signal above signal_threshold of the
+        peak height or the second difference of the normalized trace around it exceeds curvature_threshold.
+
+        Inputs :
+            positions, intensities (array): points measured so far (any order).
+            step (float): fine step (mm).
+
+        Returns :
+            new positions (mm), sorted ascending
+    '''
+    positions = np.asarray(positions, dtype=np.float64)
+    intensities = np.asarray(intensities, dtype=np.float64)
+    order = np.argsort(positions)
+    x, y = positions[order], intensities[order]
+    if len(x) < 3:
+        return np.zeros(0)
+
+    baseline = np.percentile(y, 10)
+    height = y.max() - baseline
+    if height <= 0:
+        return np.zeros(0)
+    normalized = (y - baseline)/height
+
+    curvature = np.zeros_like(normalized)
+    curvature[1:-1] = np.abs(normalized[:-2] - 2*normalized[1:-1] + normalized[2:])
+
+    signal = np.maximum(normalized[:-1], normalized[1:]) > signal_threshold
+    curved = np.maximum(curvature[:-1], curvature[1:]) > curvature_threshold
+    wide = np.diff(x) > 1.5*abs(step)
+    refine = wide & (signal | curved)
+    return (x[:-1][refine] + x[1:][refine])/2
@@ -0,0 +1,180 @@
+''' Queue of scan jobs run back-to-back on one AutocorrelatorCore.
+
+    The core keeps its DAQ task and stage connection between jobs, so a sweep of scans with different ranges,
+    steps, samples and modes only pays the hardware setup once. Each job saves into its own directory inside
+    the session directory, next to a summary of all jobs.
+'''
+import json
+import os
+import time
+import traceback
+from threading import Thread
+
+from core import AlreadyAcquiring, default_settings
+
+
+class ScanJob:
+    ''' Settings of one queued acquisition and its outcome.
+
+        status is 'queued', 'running', 'done', 'failed' or 'cancelled'. duration (s) limits Monitor jobs, and raises
+        ValueError for any other job.
+    '''
+    def __init__(self, name, settings, duration=None):
+        if duration is not None and settings['scan mode'] != 'Monitor':
+            raise ValueError(f"Job {name}: duration only applies to Monitor jobs, {settings['scan mode']} jobs run until the scan is done.")
+        self.name = name
+        self.settings = settings
+        self.duration = duration
+        self.status = 'queued'
+        self.save_directory = None
+        self.fit_result = None
+        self.start_time = None
+        self.end_time = None
+        self.error = None
+
+    def summary(self):
+        result = self.fit_result
+        fitted = result is not None and result.success
+        return {
+            'name': self.name,
+            'scan mode': self.settings['scan mode'],
+            'status': self.status,
+            'start time': self.start_time,
+            'run time (s)': self.end_time - self.start_time if self.end_time else None,
+            'save directory': self.save_directory,
+            'pulse duration (fs)': float(result.pulse_duration) if fitted else None,
+            'pulse duration error (fs)': float(result.pulse_duration_error) if fitted else None,
+            'error': self.error,
+        }
+
+    def __repr__(self):
+        return f"ScanJob({self.name}, {self.settings['scan mode']}, {self.status})"
+
+
+class ScanScheduler:
+    ''' Runs queued scan jobs one after another.
+
+        Usage:  scheduler = ScanScheduler(core, directory='D:/data', save=True)
+                scheduler.add(**{'scan mode': 'Fly Scan', 'scan step': 0.002})
+                scheduler.add({'scan mode': 'Repeated Scan', 'passes': 50})
+                scheduler.add({'scan mode': 'Monitor'}, duration=600)
+                scheduler.run() # or start() to run in the background, stop() to cancel
+
+        Inputs :
+            core (AutocorrelatorCore): shared core whose hardware sessions are reused by every job.
+            directory (str): parent directory of the session directory (default the settings' directory).
+            save (bool): save every job (default per job settings).
+            base_settings (dict): settings jobs start from (default core.default_settings()).
+    '''
+    def __init__(self, core, directory=None, save=None, base_settings=None, session_name='session'):
+        self.core = core
+        self.base_settings = dict(base_settings or default_settings())
+        if directory is not None:
+            self.base_settings['directory'] = directory
+        if save is not None:
+            self.base_settings['save'] = save
+        self.session_name = session_name
+        self.session_directory = None
+        self.jobs = []
+        self.running = False
+        self.thread = None
+
+    def add(self, settings=None, duration=None, name=None, **overrides):
+        ''' Queues a job with the base settings updated by settings and overrides. Returns the job. '''
+        job_settings = dict(self.base_settings)
+        job_settings.update(settings or {})
+        job_settings.update(overrides)
+        if name is None:
+            name = f"job{len(self.jobs) + 1:03d}_{job_settings['scan mode'].lower().replace(' ', '_')}"
+        job = ScanJob(name, job_settings, duration)
+        self.jobs.append(job)
+        return job
+
+    def add_entries(self, entries):
+        ''' Queues jobs from settings dictionaries, each optionally with 'name' and 'duration'. Queues none of them if
+            any is invalid. Returns the jobs.
+        '''
+        queued = len(self.jobs)
+        try:
+            return [self.add(entry, duration=entry.pop('duration', None), name=entry.pop('name', None)) for entry in map(dict, entries)]
+        except Exception:
+            del self.jobs[queued:]
+            raise
+
+    def load(self, path):
+        ''' Queues the jobs of a JSON file: a list of settings dictionaries, each optionally with 'name' and 'duration'. '''
+        with open(path) as file:
+            return self.add_entries(json.load(file))
+
+    @property
+    def pending(self):
+        return [job for job in self.jobs if job.status == 'queued']
+
+    def run(self):
+        ''' Runs every queued job. Blocks until the queue is empty or stop() was called. '''
+        self.running = True
+        try:
+            while self.running and self.pending:
+                self.run_job(self.pending[0])
+        finally:
+            self.running = False
+            self.save_summary()
+
+    def start(self):
+        ''' Runs the queue on a background thread. Jobs can still be added while it runs. '''
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        ''' Cancels the running job and every job still queued. '''
+        self.running = False
+        self.core.stop_acquire()
+        for job in self.pending:
+            job.status = 'cancelled'
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def run_job(self, job):
+        ''' Runs job and blocks until it ends. Raises AlreadyAcquiring, leaving the job queued, if another acquisition
+            is running.
+        '''
+        settings = dict(job.settings)
+        if settings['save']:
+            # each job saves to session_directory/<job name>_<time>
+            settings['directory'] = self.open_session()
+            settings['filename'] = job.name
+        job.status = 'running'
+        job.start_time = time.time()
+        print(f'Running {job.name} ({len(self.pending)} queued)')
+        try:
+            job.fit_result = self.core.run(settings, duration=job.duration)
+            if self.core.error is not None:
+                raise self.core.error
+            job.status = 'done' if self.running else 'cancelled'
+        except AlreadyAcquiring:
+            job.status = 'queued'
+            raise
+        except Exception as error:
+            traceback.print_exc()
+            job.status = 'failed'
+            job.error = str(error)
+        job.end_time = time.time()
+        job.save_directory = self.core.save_directory if settings['save'] else None
+        return job
+
+    def open_session(self):
+        ''' Creates the session directory on first use. '''
+        if self.session_directory is None:
+            session_time = time.strftime("%Y_%m_%d_%H%M%S", time.gmtime())
+            self.session_directory = f"{self.base_settings['directory']}/{self.session_name}_{session_time}"
+            os.makedirs(self.session_directory)
+        return self.session_directory
+
+    def save_summary(self):
+        ''' Writes summary.json with the outcome of every job to the session directory (if anything was saved). '''
+        if self.session_directory is not None:
+            with open(f'{self.session_directory}/summary.json', 'w') as file:
+                json.dump([job.summary() for job in self.jobs], file, indent=4)
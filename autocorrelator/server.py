@@ -0,0 +1,327 @@
+''' Local streaming server publishing the live autocorrelator data to other lab tools.
+
+    Clients connect over TCP (or a Unix socket) and exchange newline-delimited JSON. Subscribers receive every
+    acquisition event of the core: run start and finish with their settings and metadata, batches of points, fit
+    updates and periodic status (stage position, throughput, remaining time). Clients can also query the status, start and stop acquisitions and queue scan jobs.
+
+    The core's listener only hands each event to the server's event loop, which fans it out to one bounded queue
+    per subscriber. A client that reads too slowly loses messages according to its drop policy instead of
+    holding up the other clients or the acquisition:
+        'drop oldest'  discard the oldest queued message (default, keeps the stream current)
+        'drop newest'  discard the incoming message (keeps the stream contiguous up to the gap)
+        'disconnect'   close the connection
+    Dropped messages are reported to the client with a {"event": "dropped", "count": total} message.
+
+    Requests are {"id": 1, "command": "status", ...}, answered with {"id": 1, "result": ...} or {"id": 1, "error": "..."}:
+        subscribe   policy (str), queue_size (int)
+        unsubscribe
+        status
+        acquire     settings (dict, updates the core's current settings)
+        stop
+        queue       jobs (list of settings dicts, each optionally with 'name' and 'duration')
+        jobs
+        cancel      cancels the running and queued jobs
+'''
+import asyncio
+import json
+import time
+import traceback
+from threading import Thread, Event
+
+import numpy as np
+
+from core import AlreadyAcquiring
+from scheduler import ScanScheduler
+
+
+drop_policies = ['drop oldest', 'drop newest', 'disconnect']
+
+
+def to_json(value):
+    ''' JSON-compatible copy of value, converting numpy arrays and scalars. '''
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def encode(message):
+    return (json.dumps(to_json(message)) + '\n').encode()
+
+
+class Subscriber:
+    ''' Bounded outgoing message queue of one client, drained by the client's writer task. '''
+    def __init__(self, policy='drop oldest', queue_size=1000):
+        if policy not in drop_policies:
+            raise ValueError(f"Unknown drop policy: {policy}, choose from {', '.join(drop_policies)}")
+        self.policy = policy
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.overflowed = False # set with the 'disconnect' policy once the queue overflowed
+
+    def put(self, data):
+        ''' Queues an encoded message without ever waiting. '''
+        if not self.queue.full():
+            self.queue.put_nowait(data)
+        elif self.policy == 'drop oldest':
+            self.queue.get_nowait()
+            self.queue.put_nowait(data)
+            self.dropped += 1
+        elif self.policy == 'drop newest':
+            self.dropped += 1
+        else:
+            self.overflowed = True
+
+
+class StreamServer:
+    ''' Publishes the core's acquisition events to subscribed clients and accepts remote commands.
+
+        Usage:  server = StreamServer(core, port=8765)
+                server.start()  # serves on a background thread
+                ...
+                server.close()
+
+        Inputs :
+            core (AutocorrelatorCore): core whose acquisitions are published and controlled.
+            host (str): interface to listen on. The default only accepts connections from this computer.
+            port (int): TCP port.
+            path (str): serve on this Unix socket instead of TCP.
+            queue_size (int): default number of messages queued per subscriber.
+    '''
+    def __init__(self, core, host='127.0.0.1', port=8765, path=None, queue_size=1000):
+        self.core = core
+        self.host = host
+        self.port = port
+        self.path = path
+        self.queue_size = queue_size
+        self.clients = set() # stream writers of the connected clients
+        self.subscribers = {} # writer: Subscriber
+        self.scheduler = ScanScheduler(core)
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.error = None # exception that stopped the server thread
+        self.jobs = None # asyncio.Queue of remotely queued ScanJobs
+        self.last_start = None # 'start' event of the running or last acquisition, sent to new subscribers
+
+    def start(self, timeout=5.):
+        ''' Starts serving on a background thread. Returns once the server is listening, raises if it could not start. '''
+        started = Event()
+        self.thread = Thread(target=self.__run, args=(started,), daemon=True)
+        self.thread.start()
+        started.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def __run(self, started):
+        try:
+            asyncio.run(self.serve(started))
+        except Exception as error:
+            self.error = error
+            started.set()
+
+    async def serve(self, started=None):
+        ''' Serves until close() is called. Can also be awaited directly in an existing event loop.
+            started (threading.Event) is set once the server is listening.
+        '''
+        self.loop = asyncio.get_running_loop()
+        self.jobs = asyncio.Queue()
+        if self.path:
+            self.server = await asyncio.start_unix_server(self.handle_client, path=self.path)
+        else:
+            self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1] # the port picked by the system when port is 0
+        self.core.add_listener(self.on_event)
+        print(f'Streaming server listening on {self.path or f"{self.host}:{self.port}"}')
+        if started is not None:
+            started.set()
+        job_runner = asyncio.ensure_future(self.run_jobs())
+        try:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.core.remove_listener(self.on_event)
+            job_runner.cancel()
+            self.server.close()
+            for writer in list(self.clients):
+                writer.close()
+
+    def close(self):
+        ''' Stops serving and disconnects every client. Running jobs are stopped. '''
+        if self.loop is None or self.server is None:
+            return
+        if any(job.status == 'running' for job in self.scheduler.jobs):
+            self.scheduler.stop()
+        self.loop.call_soon_threadsafe(self.server.close)
+        if self.thread is not None:
+            self.thread.join(5.)
+
+    def on_event(self, event, data):
+        ''' Core listener, called on the acquisition and processing threads. Only hands the event to the event loop. '''
+        try:
+            self.loop.call_soon_threadsafe(self.publish, event, data)
+        except RuntimeError:
+            pass # the server just closed
+
+    def publish(self, event, data):
+        ''' Encodes an event once and queues it for every subscriber (on the event loop). '''
+        message = {'event': event, 'time': time.time()}
+        message.update(data)
+        encoded = encode(message)
+        if event == 'start':
+            self.last_start = encoded
+        for writer, subscriber in list(self.subscribers.items()):
+            subscriber.put(encoded)
+            if subscriber.overflowed:
+                del self.subscribers[writer]
+                writer.close()
+
+    async def handle_client(self, reader, writer):
+        self.clients.add(writer)
+        sender = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(encode(await self.handle_request(line, writer)))
+                await writer.drain()
+                # events are sent by their own task, started after the subscribe response
+                subscriber = self.subscribers.get(writer)
+                if subscriber is not None and sender is None:
+                    sender = asyncio.ensure_future(self.send_events(writer, subscriber))
+                elif subscriber is None and sender is not None:
+                    sender.cancel()
+                    sender = None
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass # disconnected, or the server is shutting down
+        finally:
+            self.clients.discard(writer)
+            self.subscribers.pop(writer, None)
+            if sender is not None:
+                sender.cancel()
+            writer.close()
+
+    async def send_events(self, writer, subscriber):
+        ''' Writes queued events to one client. Waiting on a slow client only blocks this task. '''
+        reported = 0
+        try:
+            while writer in self.subscribers:
+                data = await subscriber.queue.get()
+                if subscriber.dropped != reported:
+                    reported = subscriber.dropped
+                    writer.write(encode({'event': 'dropped', 'count': reported}))
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def handle_request(self, line, writer):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            command = request['command']
+            handler = getattr(self, f'command_{command}', None)
+            if handler is None:
+                raise ValueError(f'Unknown command: {command}')
+            result = await handler(writer, **{key: value for key, value in request.items() if key not in ('id', 'command')})
+            return {'id': request_id, 'result': result}
+        except Exception as error:
+            return {'id': request_id, 'error': f'{type(error).__name__}: {error}'}
+
+    async def command_subscribe(self, writer, policy='drop oldest', queue_size=None):
+        subscriber = Subscriber(policy, queue_size or self.queue_size)
+        if self.last_start is not None:
+            subscriber.put(self.last_start)
+        self.subscribers[writer] = subscriber
+        return {'policy': policy, 'queue_size': subscriber.queue.maxsize}
+
+    async def command_unsubscribe(self, writer):
+        self.subscribers.pop(writer, None)
+        return True
+
+    async def command_status(self, writer):
+        core = self.core
+        stage = core.backends['stage']
+        result = core.fit_result
+        return {
+            'acquiring': core.acquiring,
+            'settings': core.settings,
+            'stage position (mm)': core.delay_stage.position if stage.ready else None,
+            'points': core.acquired_points(),
+            'pulse duration (fs)': float(result.pulse_duration) if result is not None and result.success else None,
+            'save directory': core.save_directory,
+            'queued jobs': len(self.scheduler.pending),
+            'subscribers': len(self.subscribers),
+        }
+
+    async def command_acquire(self, writer, settings=None):
+        new_settings = dict(self.core.settings)
+        new_settings.update(settings or {})
+        self.core.acquire(new_settings)
+        return True
+
+    async def command_stop(self, writer):
+        self.core.stop_acquire()
+        return True
+
+    async def command_queue(self, writer, jobs):
+        ''' Queues jobs after any previously queued ones. Returns their names. '''
+        self.scheduler.base_settings = dict(self.core.settings)
+        names = []
+        for job in self.scheduler.add_entries(jobs):
+            self.jobs.put_nowait(job)
+            names.append(job.name)
+        return names
+
+    async def command_jobs(self, writer):
+        return [job.summary() for job in self.scheduler.jobs]
+
+    async def command_cancel(self, writer):
+        self.scheduler.stop()
+        return True
+
+    async def run_jobs(self):
+        ''' Runs remotely queued jobs one after another on an executor thread, waiting for manual acquisitions to end. '''
+        while True:
+            job = await self.jobs.get()
+            while job.status == 'queued':
+                while self.core.acquiring:
+                    await asyncio.sleep(0.2)
+                self.scheduler.running = True # cleared by cancel
+                try:
+                    await self.loop.run_in_executor(None, self.scheduler.run_job, job)
+                except AlreadyAcquiring:
+                    pass # a manual acquisition started after the check, wait for it to end too
+                except Exception:
+                    traceback.print_exc()
+                    break
+            self.scheduler.save_summary()
+
+
+if __name__ == '__main__':
+    import argparse
+    from core import AutocorrelatorCore
+
+    parser = argparse.ArgumentParser(description='Serves the live autocorrelator data to local clients.')
+    parser.add_argument('--simulate', action='store_true', help='use the simulated hardware')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--path', help='serve on this Unix socket instead of TCP')
+    args = parser.parse_args()
+
+    core = AutocorrelatorCore(simulate=args.simulate)
+    server = StreamServer(core, port=args.port, path=args.path)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        core.close()
@@ -0,0 +1,111 @@
+''' Ring buffer of fixed-width float64 records in shared memory, to pass data between processes without copying
+    it through pipes.
+
+    There is a single writer, which never waits for the readers: a reader that falls more than capacity records
+    behind loses the oldest ones. The header holds the number of records ever written, updated after the records
+    themselves, so readers only copy complete records, and the number of records claimed by the write in progress,
+    updated before. Records a write may have overwritten while they were being copied are detected afterwards from
+    the claimed count, and dropped.
+'''
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedRing:
+    ''' Fixed-capacity ring of (capacity, width) float64 records in a shared memory block.
+
+        Usage:  ring = SharedRing.create(capacity=2**16, width=2)  # owner, i.e. the GUI process
+                reader = SharedRing(*ring.spec)                   # attach, i.e. in the acquisition process
+                ring.write(records)                               # (n, width) array
+                count, records = reader.read(count)               # records written since count (0 for all)
+                reader.latest(1000)
+                reader.close()
+                ring.close(); ring.unlink()
+
+        Inputs :
+            name (str): name of the shared memory block.
+            capacity (int): number of records kept.
+            width (int): values per record.
+    '''
+    def __init__(self, name, capacity, width, create=False):
+        self.capacity = int(capacity)
+        self.width = int(width)
+        size = 16 + 8*self.capacity*self.width
+        self.memory = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.name = self.memory.name
+        self.header = np.ndarray((2,), dtype=np.int64, buffer=self.memory.buf) # records written, records claimed
+        self.data = np.ndarray((self.capacity, self.width), dtype=np.float64, buffer=self.memory.buf, offset=16)
+        if create:
+            self.header[:] = 0
+
+    @classmethod
+    def create(cls, capacity, width):
+        return cls(None, capacity, width, create=True)
+
+    @property
+    def spec(self):
+        ''' Arguments that attach another SharedRing to this one. '''
+        return self.name, self.capacity, self.width
+
+    @property
+    def written(self):
+        return int(self.header[0])
+
+    def write(self, records):
+        ''' Appends (n, width) records, overwriting the oldest ones. Only one process may write. '''
+        records = np.asarray(records, dtype=np.float64).reshape(-1, self.width)
+        total = len(records)
+        if total == 0:
+            return
+        records = records[-self.capacity:] # the older ones would be overwritten by the newer ones anyway
+        n = len(records)
+        written = int(self.header[0])
+        self.header[1] = written + total # claimed before any record is overwritten
+        start = (written + total - n) % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = records[:first]
+        self.data[:n - first] = records[first:]
+        self.header[0] = written + total # published once the records are in place
+
+    def read(self, start=0):
+        ''' Records written since the count start, oldest first (copy). Returns the count to pass to the next read
+            and the records, which skip those that were overwritten before they could be read.
+        '''
+        end = int(self.header[0])
+        first = max(start, end - self.capacity)
+        if first >= end:
+            return end, self.data[:0].copy()
+        indices = np.arange(first, end) % self.capacity
+        records = self.data[indices]
+        # a write that started before the copy finished may have overwritten the oldest records, even half way
+        overwritten = int(self.header[1]) - self.capacity
+        if overwritten > first:
+            records = records[overwritten - first:]
+        return end, records
+
+    def latest(self, n):
+        ''' The last n records written (fewer if there are not as many), oldest first. '''
+        return self.read(max(self.written - int(n), 0))[1]
+
+    def close(self):
+        del self.header, self.data # views of the block must be released before it can be closed
+        self.memory.close()
+
+    def unlink(self):
+        ''' Frees the shared memory block once every process closed it. Called by its owner. '''
+        self.memory.unlink()
+
+
+if __name__ == '__main__':
+    ring = SharedRing.create(capacity=8, width=2)
+    reader = SharedRing(*ring.spec)
+    ring.write(np.arange(12.).reshape(6, 2))
+    count, records = reader.read()
+    print(count, records.tolist())
+    ring.write(np.arange(20.).reshape(10, 2)) # laps the reader
+    count, records = reader.read(count)
+    print(count, records.tolist())
+    reader.close()
+    ring.close()
+    ring.unlink()
@@ -1,18 +1,327 @@
+import time
+from threading import Thread, Event
+
 import numpy as np
-import matplotlib.pyplot as plt
 
+from motion import move_time, trapezoid_position
+from blocks import BlockPool, count_channels
+from analysis import sech2
+
+
+class SimulatedDelayStageController:
+    ''' Drop-in replacement for delay_controller.DelayStageController that needs no Zaber hardware.
+
+        The stage follows a trapezoidal motion profile so the position read back mid-move is realistic.
+        With realtime=False moves complete instantly, which lets scans run at full speed.
+        After moving towards smaller positions the mirror lags the reported position by backlash (mm).
+    '''
+    def __init__(self, serial_port=None, velocity=7., acceleration=200., settle_time=0.005, command_latency=0.002, realtime=True, position=0., backlash=0.002):
+        self.serial_port = serial_port
+        self.velocity = velocity            # mm/s
+        self.acceleration = acceleration    # mm/s^2
+        self.settle_time = settle_time      # s, added to the end of every move
+        self.command_latency = command_latency # s, serial round trip per command
+        self.realtime = realtime
+        self.backlash = backlash
+        self.direction = 1 # of the last move
+        self.__move = (time.perf_counter(), position, position, velocity, acceleration)
+
+    def get_position(self):
+        self.__sleep(self.command_latency)
+        return float(self.position_at(time.perf_counter()))
+
+    def set_position(self, position):
+        self.start_move(position)
+        if self.realtime:
+            self.wait_until_idle()
+        else:
+            # anchor the move in the past so it has already completed
+            t_start, start, end, velocity, acceleration = self.__move
+            self.__move = (t_start - self.__move_duration(), start, end, velocity, acceleration)
+
+    def start_move(self, position):
+        current = float(self.position_at(time.perf_counter()))
+        if position != current:
+            self.direction = 1 if position > current else -1
+        self.__move = (time.perf_counter() + self.command_latency, current, position, self.velocity, self.acceleration)
+
+    def wait_until_idle(self):
+        # re-checked in short sleeps so a stop from another thread ends the wait early
+        remaining = self.__move[0] + self.__move_duration() - time.perf_counter()
+        while self.realtime and remaining > 0:
+            time.sleep(min(remaining, 0.01))
+            remaining = self.__move[0] + self.__move_duration() - time.perf_counter()
+
+    def stop(self):
+        current = float(self.position_at(time.perf_counter()))
+        self.__move = (time.perf_counter(), current, current, self.velocity, self.acceleration)
+
+    def get_velocity(self):
+        return self.velocity
+
+    def set_velocity(self, velocity):
+        self.__sleep(self.command_latency)
+        self.velocity = velocity
+
+    def get_acceleration(self):
+        return self.acceleration
+
+    def home(self):
+        self.set_position(0.)
+
+    def position_at(self, t):
+        ''' Stage position (mm) at perf_counter time(s) t. '''
+        t_start, start, end, velocity, acceleration = self.__move
+        return trapezoid_position(np.asarray(t) - t_start, start, end, velocity, acceleration)
+
+    def mirror_position_at(self, t):
+        ''' Position (mm) of the delay mirror at perf_counter time(s) t, including the backlash. '''
+        return self.position_at(t) + (self.backlash if self.direction < 0 else 0.)
+
+    def __move_duration(self):
+        t_start, start, end, velocity, acceleration = self.__move
+        return move_time(end - start, velocity, acceleration) + self.settle_time
+
+    def __sleep(self, duration):
+        if self.realtime and duration > 0:
+            time.sleep(duration)
+
+
+class SimulatedAnalogInput:
+    ''' Drop-in replacement for analog_input.AnalogInput that synthesizes an autocorrelation trace.
+
+        Each sample is evaluated at its own sample clock time using the stage position at that time, so
+        reads taken while the stage is moving are smeared the same way they would be on the real setup.
+
+        Inputs (in addition to the AnalogInput arguments) :
+            stage: object with mirror_position_at(t) (i.e. SimulatedDelayStageController). Without a stage the delay is fixed at zero.
+            pulse_duration (float): FWHM of the sech^2 pulse intensity (fs).
+            amplitude, baseline (float): peak signal and background level (V).
+            noise (float): standard deviation of the additive gaussian noise (V).
+            wavelength (float): central wavelength (nm). If given the trace is interferometric (fringe-resolved).
+            zero_position (float): stage position (mm) of zero delay.
+            realtime (bool): if True reads take as long as the sample clock dictates.
+            power_drift (float): relative amplitude of the slow laser power drift.
+            drift_period (float): period of the power drift (s).
+            reference_level (float): reference photodiode voltage at nominal power. The first channel is the autocorrelation
+                signal, any further channels are reference photodiodes.
+            flicker_noise (float): standard deviation of a slowly wandering 1/f-like background on the signal (V).
+            chopper_frequency (float): if set the beam is chopped at this frequency (Hz), modulating the signal.
+            chopper_channel (str): channel carrying the chopper's TTL reference output (0/5 V).
+    '''
+    c = 0.000299792 # mm/fs
+
+    def __init__(self, channel_name, voltage_min=-10., voltage_max=10., clock_rate=5000000, mode='continuous', samples_per_channel=1, source=None, trigger=None, offset=0,
+                 stage=None, pulse_duration=190., amplitude=1., baseline=0.01, noise=0.01, wavelength=None, zero_position=12.5, realtime=True, seed=None,
+                 power_drift=0.02, drift_period=30., reference_level=2., flicker_noise=0., chopper_frequency=None, chopper_channel=None):
+        assert mode in ['continuous', 'finite']
+        if not isinstance(channel_name, str):
+            channel_name = ', '.join(channel_name)
+        self.channel_name = channel_name
+        self.number_of_channels = count_channels(channel_name)
+        self.voltage_min = voltage_min
+        self.voltage_max = voltage_max
+        self.clock_rate = int(clock_rate)
+        self.mode = mode
+        self.samples_per_channel = int(samples_per_channel)
+        self.source = source
+        self.trigger = trigger
+        self.offset = offset
+        self.task_started = False
+
+        self.stage = stage
+        self.pulse_duration = pulse_duration
+        self.amplitude = amplitude
+        self.baseline = baseline
+        self.noise = noise
+        self.wavelength = wavelength
+        self.zero_position = zero_position
+        self.realtime = realtime
+        self.rng = np.random.default_rng(seed)
+        self.power_drift = power_drift
+        self.drift_period = drift_period
+        self.reference_level = reference_level
+        self.flicker_noise = flicker_noise
+        self.chopper_frequency = chopper_frequency
+        self.chopper_channel = chopper_channel
+        channels = [channel.strip() for channel in channel_name.split(',')]
+        self.chopper_index = channels.index(chopper_channel) if chopper_channel in channels else None
+        # background components from 0.05 to 20 Hz with a 1/f power spectrum
+        self.flicker_frequencies = np.logspace(np.log10(0.05), np.log10(20.), 16)
+        self.flicker_phases = self.rng.uniform(0., 2*np.pi, len(self.flicker_frequencies))
+        weights = 1/np.sqrt(self.flicker_frequencies)
+        self.flicker_weights = np.sqrt(2)*weights/np.sqrt(np.sum(weights**2))
 
-def sech2(t, duration):
-    return 1/np.cosh(1.76*t/duration)**2
+        self.__start_time = 0.
+        self.__samples_read = 0
+        self.pool = None
+        self.stream_start_time = None
+        self.__streaming = Event()
+        self.__build_trace()
 
+    def __build_trace(self):
+        ''' Precomputes the intensity and field autocorrelation envelopes on a delay grid (fs). '''
+        self.delay_grid = np.linspace(-10*self.pulse_duration, 10*self.pulse_duration, 2001)
+        intensity = sech2(self.delay_grid, self.pulse_duration)
+        field = np.sqrt(intensity)
+        self.intensity_autocorrelation = np.correlate(intensity, intensity, 'same')
+        self.intensity_autocorrelation /= self.intensity_autocorrelation.max()
+        self.field_autocorrelation = np.correlate(field, field, 'same')
+        self.field_autocorrelation /= self.field_autocorrelation.max()
 
+    def signal(self, delay):
+        ''' Noise-free detector voltage at delay (fs). '''
+        g2 = np.interp(delay, self.delay_grid, self.intensity_autocorrelation, left=0., right=0.)
+        if self.wavelength is None:
+            trace = g2
+        else:
+            g1 = np.interp(delay, self.delay_grid, self.field_autocorrelation, left=0., right=0.)
+            phase = 2*np.pi*299.792458/self.wavelength*delay # c in nm/fs
+            trace = (1 + 2*g2 + 4*g1*np.cos(phase) + g2*np.cos(2*phase))/8
+        return self.baseline + self.amplitude*trace
+
+    def read(self, samples_per_channel=None, timeout=10):
+        if not samples_per_channel:
+            samples_per_channel = self.samples_per_channel
+        else:
+            samples_per_channel = int(samples_per_channel)
+
+        self.start()
+
+        now = time.perf_counter()
+        block_time = samples_per_channel/self.clock_rate
+        first = self.__start_time + self.__samples_read/self.clock_rate
+        if self.mode == 'finite' or now - first > block_time:
+            # reader fell behind the sample clock, restart the stream at the current time
+            self.__start_time, self.__samples_read, first = now, 0, now
+        sample_times = first + np.arange(samples_per_channel)/self.clock_rate
+        self.__samples_read += samples_per_channel
+
+        if self.realtime:
+            remaining = sample_times[-1] + 1/self.clock_rate - time.perf_counter()
+            if remaining > timeout:
+                raise TimeoutError('Simulated read timed out.')
+            if remaining > 0:
+                time.sleep(remaining)
+
+        return self.__samples(sample_times, np.zeros(self.block_shape(samples_per_channel)))
+
+    def block_shape(self, samples_per_channel):
+        if self.number_of_channels == 1:
+            return (samples_per_channel,)
+        return (self.number_of_channels, samples_per_channel)
+
+    def __samples(self, sample_times, out):
+        ''' Fills out with the detector voltages (and reference voltages) at the given sample clock times. '''
+        position = self.stage.mirror_position_at(sample_times) if self.stage else self.zero_position
+        delay = (position - self.zero_position)/self.c
+        power = 1 + self.power_drift*np.sin(2*np.pi*sample_times/self.drift_period)
+        signal = out if out.ndim == 1 else out[0]
+        signal[:] = (self.signal(delay) - self.baseline)*power**2 # second order signal
+        if self.chopper_frequency:
+            chopper_open = (sample_times*self.chopper_frequency) % 1 < 0.5
+            signal *= chopper_open
+        signal += self.baseline
+        if self.flicker_noise:
+            signal += self.flicker_noise*(np.sin(2*np.pi*np.multiply.outer(sample_times, self.flicker_frequencies) + self.flicker_phases) @ self.flicker_weights)
+        if out.ndim == 2:
+            out[1:] = self.reference_level*power
+            if self.chopper_index is not None:
+                out[self.chopper_index] = 5.*chopper_open if self.chopper_frequency else 0.
+        out += self.rng.normal(0., self.noise, out.shape)
+        return np.clip(out, self.voltage_min, self.voltage_max, out=out)
+
+    def stream(self, samples_per_block, number_of_buffers=32, auto_release=True, timeout=10):
+        ''' Simulated AnalogInput.stream: a producer thread fills pooled buffers at the sample clock rate. '''
+        assert self.mode == 'continuous', 'Streaming needs a continuous task.'
+        samples_per_block = int(samples_per_block)
+        self.stop_stream()
+        self.pool = BlockPool(number_of_buffers, self.block_shape(samples_per_block))
+        self.stream_start_time = time.perf_counter()
+        self.__streaming.set()
+        Thread(target=self.__produce, args=(self.pool, samples_per_block), daemon=True).start()
+        return self.__blocks(self.pool, auto_release, timeout)
+
+    def __produce(self, pool, samples_per_block):
+        offsets = np.arange(samples_per_block)/self.clock_rate
+        block_time = samples_per_block/self.clock_rate
+        index = 0
+        while self.__streaming.is_set() and pool is self.pool:
+            first = self.stream_start_time + index*block_time
+            if self.realtime:
+                remaining = first + block_time - time.perf_counter()
+                if remaining > 0:
+                    time.sleep(remaining)
+            elif pool.free.empty():
+                time.sleep(0.0001) # without a sample clock the producer waits for the consumer instead of dropping blocks
+                continue
+            pool.publish(index, self.__samples(first + offsets, pool.take()))
+            index += 1
+
+    def __blocks(self, pool, auto_release, timeout):
+        try:
+            while True:
+                item = pool.get(timeout=timeout)
+                if item is None:
+                    return
+                yield item
+                if auto_release:
+                    pool.release(item[1])
+        finally:
+            self.stop_stream()
+
+    def release(self, data):
+        if self.pool is not None:
+            self.pool.release(data)
+
+    def stop_stream(self):
+        if self.pool is not None:
+            self.__streaming.clear()
+            self.pool.close()
+            self.pool = None
+
+    def start(self):
+        if not self.task_started:
+            self.__start_time = time.perf_counter()
+            self.__samples_read = 0
+            self.task_started = True
+
+    def wait(self, timeout=10.):
+        pass
+
+    def stop(self):
+        self.task_started = False
+
+    def clear(self):
+        self.task_started = False
+
+
+class SimulatedMCCDev:
+    ''' Drop-in replacement for mcc.MCCDev that keeps the output states in memory. '''
+    channels = {'1208': 2, '3101': 4}
+
+    def __init__(self, model='3101', board_number=0):
+        self.model = model
+        self.board_num = board_number
+        self.number_of_channels = self.channels[model]
+        self.analog_out = {}
+        self.digital_out = {}
+
+    def set_analog_out(self, voltage, channel):
+        assert channel in range(self.number_of_channels), 'Invalid channel number.'
+        self.analog_out[channel] = voltage
+
+    def set_digital_out(self, value, port):
+        self.digital_out[port] = value
 
 
 if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
     x = np.linspace(-500,500,1000)
     y = sech2(x, 190)
     ac = np.correlate(y, y, 'same')
-    
+
     plt.figure()
     plt.title('Pulse')
     plt.plot(x, y)
@@ -0,0 +1,181 @@
+''' Background service that owns the delay stage connection.
+
+    Every stage command runs on one service thread, so the GUI, the scan threads and the status poller never
+    talk over each other on the serial line. Whenever no command is waiting the service polls the position and
+    caches it; during a move the cached position follows the trapezoidal motion profile. Reading the cache never
+    touches serial I/O.
+'''
+import time
+import traceback
+from concurrent.futures import Future
+from queue import Queue, Empty
+from threading import Thread
+
+from motion import trapezoid_position
+
+
+class StageService:
+    ''' Serializes commands to a delay stage controller and publishes its cached position.
+
+        Exposes the controller interface (get_position, set_position, start_move, wait_until_idle, stop,
+        get_velocity, set_velocity, get_acceleration, home), with get_position answered from the cache.
+
+        Usage:  stage = StageService(DelayStageController('COM5'), poll_interval=0.2)
+                stage.add_listener(callback) # called with the position after every poll (on the service thread)
+                stage.set_position(12.5)
+                stage.position
+                stage.close()
+
+        Inputs :
+            stage: delay stage controller (i.e. DelayStageController or SimulatedDelayStageController).
+            poll_interval (float): time (s) between position polls while no commands are running.
+    '''
+    def __init__(self, stage, poll_interval=0.2):
+        self.stage = stage
+        self.poll_interval = poll_interval
+        self.commands = Queue()
+        self.listeners = []
+        self.move = None # future of the running start_move
+
+        # cached stage state, read once at startup
+        self.__position = stage.get_position()
+        self.velocity = stage.get_velocity()
+        self.acceleration = stage.get_acceleration()
+        self.position_time = time.perf_counter()
+        self.__profile = None # (t_start, start, end, velocity, acceleration) of the running move
+
+        self.thread = Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    @property
+    def position(self):
+        ''' Cached stage position (mm). Estimated from the motion profile while a move is running. '''
+        profile = self.__profile
+        if profile is not None:
+            t_start, start, end, velocity, acceleration = profile
+            return float(trapezoid_position(time.perf_counter() - t_start, start, end, velocity, acceleration))
+        return self.__position
+
+    @property
+    def moving(self):
+        return self.__profile is not None
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def submit(self, function, *args):
+        ''' Queues function(*args) to run on the service thread. Returns a concurrent.futures.Future. '''
+        future = Future()
+        self.commands.put((function, args, future))
+        return future
+
+    def call(self, function, *args):
+        ''' Runs function(*args) on the service thread and returns its result. '''
+        return self.submit(function, *args).result()
+
+    def get_position(self):
+        return self.position
+
+    def read_position(self):
+        ''' Queries the stage position, bypassing the cache. '''
+        return self.call(self.__poll)
+
+    def set_position(self, position):
+        self.submit_move(position).result()
+
+    def submit_move(self, position):
+        ''' Queues a move to position (mm). Returns a concurrent.futures.Future that completes once the stage arrived. '''
+        return self.submit(self.__move, position)
+
+    def start_move(self, position):
+        ''' Queues a move to position (mm) and returns immediately. Use wait_until_idle to block until the move is done. '''
+        self.move = self.submit(self.__move, position, self.__start_and_wait)
+
+    def wait_until_idle(self):
+        if self.move:
+            self.move.result()
+            self.move = None
+
+    def stop(self):
+        ''' Halts the stage. Sent directly rather than queued, since it has to interrupt a running move. '''
+        self.stage.stop()
+        try:
+            self.wait_until_idle()
+        except Exception as error:
+            print(f'Delay stage move interrupted: {error}')
+            self.move = None
+
+    def get_velocity(self):
+        return self.velocity
+
+    def set_velocity(self, velocity):
+        self.call(self.stage.set_velocity, velocity)
+        self.velocity = velocity
+
+    def get_acceleration(self):
+        return self.acceleration
+
+    def home(self):
+        self.call(self.__move, 0., lambda position: self.stage.home())
+
+    def close(self):
+        ''' Finishes the queued commands and stops the service thread. '''
+        if self.thread.is_alive():
+            self.commands.put(None)
+            self.thread.join()
+
+    def __move(self, position, command=None):
+        self.__profile = (time.perf_counter(), self.position, position, self.velocity, self.acceleration)
+        try:
+            (command or self.stage.set_position)(position)
+            # assume the target was reached, the next idle poll corrects it without slowing down step scans
+            self.__publish(position)
+        finally:
+            self.__profile = None
+
+    def __start_and_wait(self, position):
+        self.stage.start_move(position)
+        self.stage.wait_until_idle()
+
+    def __poll(self):
+        position = self.stage.get_position()
+        self.__publish(position)
+        return position
+
+    def __publish(self, position):
+        self.__position = position
+        self.position_time = time.perf_counter()
+        for callback in self.listeners:
+            callback(position)
+
+    def __run(self):
+        while True:
+            try:
+                command = self.commands.get(timeout=self.poll_interval)
+            except Empty:
+                try:
+                    self.__poll()
+                except Exception:
+                    traceback.print_exc()
+                continue
+            if command is None:
+                break
+            function, args, future = command
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args))
+                except Exception as error:
+                    future.set_exception(error)
+
+
+if __name__ == '__main__':
+    from simulator import SimulatedDelayStageController
+
+    stage = StageService(SimulatedDelayStageController(velocity=2.), poll_interval=0.05)
+    stage.start_move(1.)
+    for _ in range(6):
+        time.sleep(0.1)
+        print(f'{stage.position:.3f} mm (moving: {stage.moving})')
+    stage.wait_until_idle()
+    print(f'Final position: {stage.read_position():.3f} mm')
+    stage.close()
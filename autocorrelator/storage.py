@@ -0,0 +1,201 @@
+''' Saving scan data.
+
+    Scan rows are appended to a .npy file through a buffered writer that keeps a single file handle open and
+    flushes from a background thread. The header is rewritten on every flush, so the file is always a valid
+    .npy array that can be loaded (or memory-mapped) while the scan is still running.
+'''
+import struct
+import time
+from threading import Thread, Condition, Lock
+
+import numpy as np
+
+
+def save_settings(fname, settings):
+    with open(fname, 'w') as file:
+        for key, value in settings.items():
+            file.write(f'{key} = {value}\n')
+
+
+class ScanWriter:
+    ''' Buffered, append-only writer for 2D float64 scan data (one row per point).
+
+        Usage:  writer = ScanWriter('intensities.npy', columns=['delay (mm)', 'intensity (V)'])
+                writer.append_rows([[position, intensity], ...])
+                writer.close()
+                writer.export_csv()
+
+        Inputs :
+            path (str): .npy file to create.
+            columns (list): column names, used as the CSV header.
+            flush_rows (int): flush once this many rows are buffered.
+            flush_interval (float): flush buffered rows at least this often (s).
+            rows (int): reopen the existing file at path keeping its first rows, to append to a resumed scan
+                (default creates a new file).
+    '''
+    header_size = 128 # bytes, fixed so the header can be rewritten in place as rows are added
+
+    def __init__(self, path, columns=('delay (mm)', 'intensity (V)'), flush_rows=1000, flush_interval=1., rows=None):
+        self.path = path
+        self.columns = list(columns)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+
+        self.__buffer = []
+        self.__buffered_rows = 0
+        self.__condition = Condition()
+        self.__file_lock = Lock()
+        self.__closed = False
+
+        if rows is None:
+            self.file = open(path, 'wb')
+        else:
+            # drops anything past the kept rows, i.e. a flush cut short by a crash
+            self.file = open(path, 'r+b')
+            self.file.truncate(self.header_size + rows*len(self.columns)*8)
+            self.rows_written = rows
+        self.__write_header()
+        self.thread = Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def __write_header(self):
+        header = f"{{'descr': '<f8', 'fortran_order': False, 'shape': ({self.rows_written}, {len(self.columns)}), }}"
+        header_length = self.header_size - 10
+        header = header.ljust(header_length - 1) + '\n'
+        self.file.seek(0)
+        self.file.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', header_length) + header.encode('latin1'))
+        self.file.seek(0, 2)
+
+    def append_rows(self, rows):
+        ''' Buffers rows (2D array-like with one column per name in columns). Never touches the disk. '''
+        rows = np.asarray(rows, dtype='<f8').reshape(-1, len(self.columns))
+        with self.__condition:
+            self.__buffer.append(rows)
+            self.__buffered_rows += len(rows)
+            if self.__buffered_rows >= self.flush_rows:
+                self.__condition.notify()
+
+    def append(self, *row):
+        self.append_rows([row])
+
+    def flush(self):
+        ''' Writes buffered rows and updates the header. '''
+        with self.__condition:
+            buffer, self.__buffer, self.__buffered_rows = self.__buffer, [], 0
+        if not buffer:
+            return
+        with self.__file_lock:
+            for rows in buffer:
+                self.file.write(rows.tobytes())
+                self.rows_written += len(rows)
+            self.__write_header()
+            self.file.flush()
+
+    def close(self):
+        ''' Flushes remaining rows and closes the file. '''
+        if self.__closed:
+            return
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+
+    def export_csv(self, path=None):
+        ''' Writes the saved rows to a CSV file next to the .npy file (or to path). '''
+        if path is None:
+            path = self.path[:-len('.npy')] + '.csv' if self.path.endswith('.npy') else self.path + '.csv'
+        export_csv(self.path, path, self.columns)
+        return path
+
+    def __run(self):
+        while True:
+            deadline = time.monotonic() + self.flush_interval
+            with self.__condition:
+                while not self.__closed and self.__buffered_rows < self.flush_rows and time.monotonic() < deadline:
+                    self.__condition.wait(deadline - time.monotonic())
+                closed = self.__closed
+            if closed:
+                return
+            self.flush()
+
+
+class RawArchive:
+    ''' Memory-mapped archive of the raw sample blocks of a scan, preallocated as (positions x samples), or
+        (positions x channels x samples) for multi-channel reads.
+
+        Blocks are copied straight into the mapped file so memory use stays flat however long the scan is.
+        Delay positions are archived alongside, with NaN marking positions that were never acquired.
+
+        Usage:  archive = RawArchive(directory, number_of_positions=1000, samples_per_position=100)
+                archive.write(index, position, data)
+                archive.close()
+                positions, blocks = load_raw(directory)
+    '''
+    def __init__(self, directory, number_of_positions, samples_per_position, number_of_channels=1, resume=False):
+        self.directory = directory
+        if resume:
+            # reopen the archive of an interrupted scan, keeping the blocks acquired so far
+            self.blocks = np.lib.format.open_memmap(f'{directory}/raw_blocks.npy', mode='r+')
+            self.positions = np.lib.format.open_memmap(f'{directory}/raw_positions.npy', mode='r+')
+            return
+        shape = (number_of_positions, samples_per_position) if number_of_channels == 1 else (number_of_positions, number_of_channels, samples_per_position)
+        self.blocks = np.lib.format.open_memmap(f'{directory}/raw_blocks.npy', mode='w+', dtype=np.float64, shape=shape)
+        self.positions = np.lib.format.open_memmap(f'{directory}/raw_positions.npy', mode='w+', dtype=np.float64, shape=(number_of_positions,))
+        self.positions[:] = np.nan
+
+    def write(self, index, position, data):
+        self.blocks[index] = data
+        self.positions[index] = position
+
+    def close(self):
+        self.blocks.flush()
+        self.positions.flush()
+        self.blocks = None
+        self.positions = None
+
+
+def load_raw(directory):
+    ''' Zero-copy (memory-mapped) read of a raw archive. Returns positions and blocks of the acquired positions only. '''
+    positions = np.load(f'{directory}/raw_positions.npy', mmap_mode='r')
+    blocks = np.load(f'{directory}/raw_blocks.npy', mmap_mode='r')
+    acquired = int(np.count_nonzero(~np.isnan(positions)))
+    return positions[:acquired], blocks[:acquired]
+
+
+def load_scan(path, mmap=True):
+    ''' Loads a saved scan (.npy) without reading it into memory unless mmap is False. '''
+    return np.load(path, mmap_mode='r' if mmap else None)
+
+
+def sort_scan(path, column=0):
+    ''' Sorts the rows of a saved scan (.npy) in place by column, i.e. by delay. '''
+    data = np.load(path, mmap_mode='r+')
+    data[:] = data[np.argsort(data[:, column], kind='stable')]
+    data.flush()
+
+
+def saved_rows(path):
+    ''' Number of complete rows of a saved scan (.npy), 0 if there is no file. '''
+    try:
+        return load_scan(path).shape[0]
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def export_csv(npy_path, csv_path, columns=('delay (mm)', 'intensity (V)')):
+    ''' Converts a saved .npy scan to CSV. '''
+    data = load_scan(npy_path)
+    np.savetxt(csv_path, data, delimiter=',', header=', '.join(columns))
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Usage: python storage.py path/to/intensities.npy [path/to/intensities.csv]
+    npy_path = sys.argv[1]
+    csv_path = sys.argv[2] if len(sys.argv) > 2 else npy_path[:-len('.npy')] + '.csv'
+    export_csv(npy_path, csv_path)
+    print(f'Exported {csv_path}')
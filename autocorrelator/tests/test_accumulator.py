@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from accumulator import BidirectionalAccumulator, ScanAccumulator
+
+
+def passes(number_of_passes=6, number_of_positions=20, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(np.linspace(0., 3., number_of_positions), 0.2, (number_of_passes, number_of_positions))
+
+
+def test_statistics_match_numpy():
+    values = passes()
+    accumulator = ScanAccumulator(np.linspace(12., 13., values.shape[1]))
+    for scan_pass in values:
+        accumulator.add(np.arange(len(scan_pass)), scan_pass)
+    np.testing.assert_allclose(accumulator.mean, values.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(accumulator.std, values.std(axis=0, ddof=1), rtol=1e-10)
+    np.testing.assert_allclose(accumulator.standard_error, values.std(axis=0, ddof=1)/np.sqrt(len(values)), rtol=1e-10)
+    np.testing.assert_array_equal(accumulator.count, len(values))
+
+
+def test_points_in_any_order_and_batch():
+    values = passes()
+    indices = np.tile(np.arange(values.shape[1]), len(values))
+    order = np.random.default_rng(1).permutation(values.size)
+    accumulator = ScanAccumulator(np.arange(values.shape[1]))
+    # batches with repeated indices take the one at a time path
+    for batch in np.array_split(order, 7):
+        accumulator.add(indices[batch], values.ravel()[batch])
+    np.testing.assert_allclose(accumulator.mean, np.mean(values, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(accumulator.std, np.std(values, axis=0, ddof=1), rtol=1e-10)
+
+
+def test_partial_pass():
+    accumulator = ScanAccumulator([0., 1., 2.])
+    accumulator.add([0, 1], [1., 2.])
+    accumulator.add([0], [3.])
+    np.testing.assert_array_equal(accumulator.measured, [True, True, False])
+    assert accumulator.mean[0] == 2. and accumulator.std[0] == pytest.approx(np.sqrt(2))
+    assert np.isnan(accumulator.std[1]) # a single value has no spread
+    np.testing.assert_array_equal(accumulator.to_array()[:, [0, 1, 4]], [[0., 2., 2.], [1., 2., 1.]])
+
+
+def test_state_round_trip():
+    values = passes()
+    accumulator = ScanAccumulator(np.arange(values.shape[1]))
+    for scan_pass in values[:3]:
+        accumulator.add(np.arange(len(scan_pass)), scan_pass)
+    restored = ScanAccumulator(np.arange(values.shape[1]))
+    restored.restore({name: array.copy() for name, array in accumulator.state().items()})
+    for scan_pass in values[3:]:
+        restored.add(np.arange(len(scan_pass)), scan_pass)
+    np.testing.assert_allclose(restored.mean, values.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(restored.std, values.std(axis=0, ddof=1), rtol=1e-10)
+
+
+def test_save(tmp_path):
+    values = passes(3, 4)
+    accumulator = ScanAccumulator([1., 2., 3., 4.])
+    for scan_pass in values:
+        accumulator.add(np.arange(4), scan_pass)
+    path = str(tmp_path/'averaged.npy')
+    accumulator.save(path, unit='normalized')
+    np.testing.assert_array_equal(np.load(path), accumulator.to_array())
+    with open(str(tmp_path/'averaged.csv')) as file:
+        assert file.readline().strip() == '# delay (mm), mean intensity (normalized), std (normalized), standard error (normalized), count'
+    np.testing.assert_allclose(np.loadtxt(str(tmp_path/'averaged.csv'), delimiter=','), accumulator.to_array(), rtol=1e-15)
+
+
+def serpentine(backlash, passes=6, step=0.001, noise=0., seed=0):
+    ''' Accumulator of a simulated bidirectional scan whose reverse sweeps read the trace shifted by backlash (mm). '''
+    rng = np.random.default_rng(seed)
+    grid = np.arange(12.3, 12.7 + step/2, step)
+    trace = lambda x: 0.01 + 1/np.cosh((x - 12.5)/0.04)**2
+    accumulator = BidirectionalAccumulator(grid)
+    for scan_pass in range(passes):
+        reverse = scan_pass % 2 == 1
+        indices = np.arange(len(grid))[::-1] if reverse else np.arange(len(grid))
+        values = trace(grid[indices] + (backlash if reverse else 0.)) + rng.normal(0., noise, len(grid))
+        accumulator.add(indices, values, reverse)
+    return accumulator, trace
+
+
+@pytest.mark.parametrize('backlash', [0., 0.002, -0.0035])
+def test_backlash_estimate(backlash):
+    accumulator, trace = serpentine(backlash)
+    assert accumulator.backlash == pytest.approx(backlash, abs=1e-5)
+    # the merged trace lines up with the forward one where both directions were measured
+    inside = accumulator.count == 6
+    np.testing.assert_allclose(accumulator.mean[inside], trace(accumulator.positions[inside]), atol=1e-4)
+
+
+def test_backlash_estimate_with_noise():
+    accumulator, _ = serpentine(0.002, passes=20, noise=0.01)
+    assert accumulator.backlash == pytest.approx(0.002, abs=3e-4)
+    np.testing.assert_array_equal(accumulator.forward.count, 10)
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from analysis import IncrementalFitter, fit, fringe_envelope, models, sech2, sech2_autocorrelation
+
+
+pulses = {
+    'sech2': lambda t, duration: 1/np.cosh(2*np.arccosh(np.sqrt(2))*t/duration)**2,
+    'gaussian': lambda t, duration: np.exp(-4*np.log(2)*t**2/duration**2),
+}
+
+
+def autocorrelation(model, duration, delays):
+    ''' Intensity autocorrelation of a pulse, computed numerically. '''
+    t = np.linspace(-20*duration, 20*duration, 8001)
+    intensity = pulses[model](t, duration)
+    trace = np.correlate(intensity, intensity, 'same')
+    return np.interp(delays, t, trace/trace.max())
+
+
+@pytest.mark.parametrize('model', list(models))
+def test_recovers_pulse_duration(model):
+    delays = np.linspace(-1000., 1000., 401)
+    trace = 0.01 + 2*autocorrelation(model, 190., delays - 30.)
+    result = fit(delays, trace, model)
+    assert result.success
+    assert result.pulse_duration == pytest.approx(190., rel=2e-3)
+    np.testing.assert_allclose(result.params[[0, 1, 3]], [2., 30., 0.01], rtol=2e-3, atol=2e-3)
+
+
+@pytest.mark.parametrize('model', list(models))
+def test_recovers_pulse_duration_with_noise(model):
+    rng = np.random.default_rng(1)
+    delays = np.linspace(-1000., 1000., 801)
+    trace = 0.01 + autocorrelation(model, 150., delays) + rng.normal(0., 0.01, len(delays))
+    result = fit(delays, trace, model)
+    assert result.success
+    assert abs(result.pulse_duration - 150.) < 4*result.pulse_duration_error
+
+
+@pytest.mark.parametrize('model', list(models))
+@pytest.mark.parametrize('seed', range(20))
+def test_noise_only_fit_fails(model, seed):
+    delays = np.linspace(-1000., 1000., 401)
+    trace = np.random.default_rng(seed).normal(0.01, 0.01, len(delays))
+    assert not fit(delays, trace, model).success
+
+
+
+@pytest.mark.parametrize('wavelength', [None, 800.])
+def test_fringe_envelope(wavelength):
+    delays = np.arange(-300., 300., 0.2)
+    envelope = np.exp(-4*np.log(2)*delays**2/100.**2)
+    carrier = 299.792458/800. # 1/fs
+    trace = 1 + 2*envelope + 4*envelope*np.cos(2*np.pi*carrier*delays)
+    fringes = fringe_envelope(delays, trace, wavelength)
+    assert fringes.carrier_frequency == pytest.approx(carrier, rel=1e-3)
+    inner = abs(delays) < 250. # away from the edge effects of the FFT
+    np.testing.assert_allclose(fringes.envelope[inner], 4*envelope[inner], atol=1e-3)
+    np.testing.assert_allclose(fringes.dc[inner], 1 + 2*envelope[inner], atol=1e-3)
+
+@pytest.mark.parametrize('model', list(models))
+def test_jacobian(model):
+    function, jacobian = models[model]
+    t = np.linspace(-800., 800., 1601) # includes the center, where the sech^2 autocorrelation switches to its series
+    params = np.array([1.3, 20., 290., 0.01])
+    numerical = np.column_stack([(function(t, *(params + step)) - function(t, *(params - step)))/(2*step.sum())
+                                 for step in 1e-5*np.eye(4)*np.maximum(np.abs(params), 1.)])
+    np.testing.assert_allclose(jacobian(t, *params), numerical, atol=1e-6)
+
+
+def test_sech2_autocorrelation():
+    x = np.array([-800., -3., -0.1, -1e-9, 0., 1e-4, 0.0999, 0.1001, 1.3598, 40.])
+    value, derivative = sech2_autocorrelation(x)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        closed_form = 3*(x/np.tanh(x) - 1)/np.sinh(x)**2
+    large = np.abs(x) > 0.05
+    np.testing.assert_allclose(value[large], closed_form[large], rtol=1e-9, atol=1e-300)
+    np.testing.assert_allclose(value[~large], 1 - 0.4*x[~large]**2, atol=1e-6)
+    assert value[x == 0.] == 1. and derivative[x == 0.] == 0.
+    assert np.all(np.isfinite(value)) and np.all(np.isfinite(derivative))
+    assert value[8] == pytest.approx(0.5, abs=1e-4)
+
+
+def test_incremental_fitter():
+    delays = np.linspace(-1000., 1000., 500)
+    trace = 0.01 + autocorrelation('sech2', 190., delays)
+    fitter = IncrementalFitter('sech2')
+    assert fitter.update(delays[:5], trace[:5]) is None # fewer than min_points
+    for batch in range(5, len(delays), 25):
+        result = fitter.update(delays[batch:batch + 25], trace[batch:batch + 25])
+    assert result.success
+    assert result.pulse_duration == pytest.approx(190., rel=2e-3)
+    fitter.clear()
+    assert fitter.result is None and fitter.update() is None
+
+
+def test_simulated_pulse():
+    # the simulator's sech^2 pulse, with its FWHM constant rounded to 1.76
+    delays = np.linspace(-1000., 1000., 401)
+    t = np.linspace(-4000., 4000., 8001)
+    intensity = sech2(t, 190.)
+    trace = np.correlate(intensity, intensity, 'same')
+    result = fit(delays, np.interp(delays, t, trace/trace.max()), 'sech2')
+    assert result.pulse_duration == pytest.approx(190.*2*np.arccosh(np.sqrt(2))/1.76, rel=1e-3)
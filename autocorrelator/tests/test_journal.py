@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from accumulator import BidirectionalAccumulator, ScanAccumulator
+from journal import ScanJournal
+
+
+positions = np.array([12.4, 12.45, 12.5, 12.55, 12.6])
+
+
+def settings(**changes):
+    return {'scan mode': 'Repeated Scan', 'passes': 3, 'bidirectional': False, **changes}
+
+
+@pytest.mark.parametrize('completed, remaining', [
+    (0, [12.4, 12.45, 12.5, 12.55, 12.6]),
+    (3, [12.55, 12.6]),
+    (5, [12.6, 12.55, 12.5, 12.45, 12.4]), # second pass sweeps back
+    (7, [12.5, 12.45, 12.4]),
+    (10, [12.4, 12.45, 12.5, 12.55, 12.6]),
+    (14, [12.6]),
+    (15, []),
+])
+def test_remaining_positions_bidirectional(tmp_path, completed, remaining):
+    journal = ScanJournal.create(str(tmp_path), settings(bidirectional=True), positions)
+    journal.checkpoint(completed, force=True)
+    np.testing.assert_array_equal(ScanJournal.load(str(tmp_path)).remaining_positions, remaining)
+
+
+def test_remaining_positions(tmp_path):
+    journal = ScanJournal(str(tmp_path), settings(), positions, completed=7)
+    np.testing.assert_array_equal(journal.remaining_positions, [12.5, 12.55, 12.6])
+    journal = ScanJournal(str(tmp_path), {'scan mode': 'Scan', 'passes': 3}, positions, completed=2)
+    assert journal.total_points == 5
+    np.testing.assert_array_equal(journal.remaining_positions, [12.5, 12.55, 12.6])
+
+
+def test_load(tmp_path):
+    journal = ScanJournal.create(str(tmp_path), settings(), positions)
+    journal.checkpoint(4, force=True)
+    journal.finish('failed', 'stage fault')
+    loaded = ScanJournal.load(str(tmp_path))
+    assert (loaded.completed, loaded.status, loaded.error) == (4, 'failed', 'stage fault')
+    assert loaded.settings == settings()
+    np.testing.assert_array_equal(loaded.positions, positions)
+    with pytest.raises(FileNotFoundError):
+        ScanJournal.load(str(tmp_path/'missing'))
+
+
+def test_restore_accumulator(tmp_path):
+    journal = ScanJournal.create(str(tmp_path), settings(bidirectional=True), positions)
+    assert journal.restore_accumulator(ScanAccumulator(positions)) == 0 # nothing checkpointed yet
+    accumulator = BidirectionalAccumulator(positions)
+    accumulator.add(np.arange(5), np.arange(5.), False)
+    accumulator.add(np.arange(4, 1, -1), [4.5, 3.5, 2.5], True)
+    journal.checkpoint(8, accumulator=accumulator, force=True)
+    restored = BidirectionalAccumulator(positions)
+    assert ScanJournal.load(str(tmp_path)).restore_accumulator(restored) == 8
+    for name in ['count', 'mean', 'm2']:
+        np.testing.assert_array_equal(getattr(restored, name), getattr(accumulator, name))
+
+
+def test_accumulated_points_ahead_of_journal(tmp_path):
+    journal = ScanJournal.create(str(tmp_path), settings(), positions)
+    assert journal.accumulated_points() == 0
+    accumulator = ScanAccumulator(positions)
+    accumulator.add(np.arange(5), np.ones(5))
+    journal.checkpoint(5, accumulator=accumulator, force=True)
+    # an interruption after the statistics were checkpointed but before the journal was saved
+    accumulator.add(np.arange(3), np.ones(3))
+    journal.checkpoint(8, accumulator=accumulator, force=True)
+    journal.completed = 5
+    journal.save()
+    loaded = ScanJournal.load(str(tmp_path))
+    assert loaded.completed == 5
+    assert loaded.accumulated_points() == 8 == loaded.restore_accumulator(ScanAccumulator(positions))
+
@@ -0,0 +1,71 @@
+import time
+from threading import Event
+
+import numpy as np
+import pytest
+
+from core import AutocorrelatorCore, default_settings
+from orchestrator import AcquisitionOrchestrator, HardwareTimeout
+
+
+@pytest.fixture
+def core():
+    core = AutocorrelatorCore(simulate=True)
+    core.update_scan_time_model = lambda: None # keep test runs out of the saved model
+    finished = []
+    core.add_listener(lambda event, data: finished.append(data) if event == 'finish' else None)
+    core.finished = finished
+    yield core
+    core.close()
+
+
+@pytest.mark.parametrize('mode', ['Scan', 'Fly Scan'])
+def test_stop_halts_stage_and_cleans_up(core, mode, tmp_path):
+    settings = {**default_settings(), 'scan mode': mode, 'scan start': 5., 'scan end': 40., 'scan step': 0.005, 'samples': 20,
+                'save': True, 'directory': str(tmp_path)}
+    core.acquire(settings)
+    time.sleep(1.)
+    assert core.acquiring
+    start = time.perf_counter()
+    core.stop_acquire()
+    core.wait(5.)
+    assert not core.acquiring
+    assert time.perf_counter() - start < 1.
+    assert core.error is None
+    assert core.finished == [{'error': None, 'points': core.acquired_points(), 'save_directory': core.save_directory}]
+    # the stage stays where it was halted, short of the scan end
+    assert not core.delay_stage.moving
+    position = core.delay_stage.read_position()
+    time.sleep(0.3)
+    assert core.delay_stage.read_position() == pytest.approx(position)
+    assert position < 40.
+    # the points acquired before the stop were flushed and saved
+    rows = np.load(f'{core.save_directory}/intensities.npy')
+    assert len(rows) == core.acquired_points() > 0
+
+
+def test_hung_stage_move_times_out(core):
+    controller = core.delay_stage.stage
+    released = Event()
+    controller.set_position = lambda position: released.wait(5.) # never reaches the position
+    core.orchestrator.timeouts['move'] = 0.2
+    try:
+        core.acquire({**default_settings(), 'scan mode': 'Scan', 'scan start': 12.4, 'scan end': 12.6, 'scan step': 0.01})
+        core.wait(5.)
+        assert not core.acquiring
+    finally:
+        released.set()
+    assert isinstance(core.error, HardwareTimeout)
+    assert core.finished[-1]['error'] == str(core.error)
+
+
+def test_hung_hardware_call_times_out():
+    orchestrator = AcquisitionOrchestrator(timeouts={'read': 0.1})
+    released = Event()
+    future = orchestrator.start(orchestrator.call('read', released.wait, 5., expected=0.05))
+    try:
+        with pytest.raises(HardwareTimeout):
+            future.result(2.)
+    finally:
+        released.set()
+        orchestrator.close()
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from reducers import LockIn, create_reducer, trimmed_mean
+
+
+sample_rate, frequency = 10000., 137.
+
+
+def sine(amplitude, phase, samples=2000, blocks=1, harmonic=1):
+    t = np.arange(blocks*samples)/sample_rate
+    return (amplitude*np.sin(2*np.pi*harmonic*frequency*t + phase)).reshape(blocks, samples)
+
+
+@pytest.mark.parametrize('samples', [2000, 2345]) # a whole and a fractional number of periods
+def test_lock_in_amplitude(samples):
+    lock_in = LockIn(frequency, sample_rate)
+    amplitudes = np.array([0.01, 0.5, 2.])
+    data = np.concatenate([sine(amplitude, 0.3, samples) for amplitude in amplitudes])
+    np.testing.assert_allclose(lock_in(data), amplitudes, rtol=1e-3)
+
+
+def test_lock_in_rejects_offset_and_drift():
+    lock_in = LockIn(frequency, sample_rate)
+    t = np.arange(2345)/sample_rate
+    data = sine(0.1, 1., 2345) + 3. + 0.5*t # DC level and a slow drift
+    assert lock_in(data)[0] == pytest.approx(0.1, rel=5e-3)
+    # a signal far from the reference frequency is rejected
+    assert lock_in(sine(1., 0., 2345, harmonic=3))[0] < 1e-3
+
+
+def test_lock_in_phase():
+    lock_in = LockIn(frequency, sample_rate)
+    signal = sine(0.2, 1.2)
+    reference = sine(5., 0.4)
+    amplitude, phase = lock_in.demodulate(signal, reference)
+    assert amplitude[0] == pytest.approx(0.2, rel=1e-3)
+    assert phase[0] == pytest.approx(0.8, abs=1e-3)
+    # without reference the phase is relative to the first sample of the block, sin = cos shifted by -pi/2
+    assert lock_in.demodulate(signal)[1][0] == pytest.approx(1.2 - np.pi/2, abs=1e-3)
+
+
+def test_lock_in_batches_and_harmonics():
+    lock_in = LockIn(frequency, sample_rate, harmonic=2)
+    data = np.stack([sine(0.3, 0., blocks=4, harmonic=2), sine(0.7, 0., blocks=4, harmonic=2)], axis=1) # (blocks, channels, samples)
+    np.testing.assert_allclose(lock_in(data), [[0.3, 0.7]]*4, rtol=1e-3)
+
+
+def test_lock_in_frequency_range():
+    with pytest.raises(ValueError):
+        LockIn(6000., sample_rate)
+    with pytest.raises(ValueError):
+        LockIn(frequency, sample_rate, harmonic=0)
+
+
+def test_create_reducer():
+    data = np.array([[0., 1., 2., 3., 100.]])
+    assert create_reducer('mean')(data)[0] == 21.2
+    assert create_reducer('median')(data)[0] == 2.
+    assert create_reducer('trimmed mean', trim=0.2)(data)[0] == trimmed_mean(data, 0.2)[0] == 2.
+    assert isinstance(create_reducer('lock-in', sample_rate, frequency), LockIn)
+    with pytest.raises(ValueError):
+        create_reducer('mode')
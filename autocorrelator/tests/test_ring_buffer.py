@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from ring_buffer import RingBuffer
+
+
+def assert_matches(buffer, values):
+    window = values[-buffer.capacity:]
+    assert len(buffer) == len(window)
+    np.testing.assert_array_equal(buffer.values(), window)
+    assert buffer.mean == pytest.approx(np.mean(window), rel=1e-12, abs=1e-12)
+    assert buffer.std == pytest.approx(np.std(window), rel=1e-9, abs=1e-12)
+    assert buffer.min == np.min(window)
+    assert buffer.max == np.max(window)
+
+
+def test_empty():
+    buffer = RingBuffer(10)
+    assert len(buffer) == 0
+    assert np.isnan(buffer.mean) and np.isnan(buffer.std) and np.isnan(buffer.min) and np.isnan(buffer.max)
+
+
+@pytest.mark.parametrize('capacity', [1, 7, 100])
+def test_rolling_statistics(capacity):
+    rng = np.random.default_rng(capacity)
+    buffer = RingBuffer(capacity)
+    values = np.zeros(0)
+    for size in rng.integers(1, 3*capacity + 2, 50):
+        batch = 5 + rng.normal(size=size)
+        buffer.extend(batch)
+        values = np.concatenate((values, batch))
+        assert_matches(buffer, values)
+
+
+def test_rolling_extremes_of_a_trend():
+    # the minimum leaves the window first while rising, the maximum while falling
+    buffer = RingBuffer(5)
+    values = np.concatenate((np.arange(20.), np.arange(20.)[::-1]))
+    for index in range(len(values)):
+        buffer.extend(values[index:index + 1])
+        assert_matches(buffer, values[:index + 1])
+
+
+def test_batch_larger_than_capacity():
+    buffer = RingBuffer(4)
+    buffer.extend([1., 2., 3.])
+    buffer.extend(np.arange(10.))
+    assert buffer.count == 13
+    assert_matches(buffer, np.concatenate(([1., 2., 3.], np.arange(10.))))
+
+
+def test_clear():
+    buffer = RingBuffer(4)
+    buffer.extend([1., 2., 3., 4., 5.])
+    buffer.clear()
+    assert len(buffer) == 0
+    buffer.extend([-1., 1.])
+    assert_matches(buffer, np.array([-1., 1.]))
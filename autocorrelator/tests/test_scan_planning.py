@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from scan_planning import coarse_positions, max_points, refine_positions, step_positions
+
+
+def trace(positions):
+    ''' Autocorrelation 0.06 mm wide (about 200 fs) at 12.5 mm on a baseline. '''
+    return 0.1 + 1/np.cosh((positions - 12.5)/0.03)**2
+
+
+@pytest.mark.parametrize('start, end', [(10., 15.), (15., 10.)])
+def test_step_positions(start, end):
+    positions = step_positions(start, end, 0.01)
+    assert len(positions) == 501
+    assert positions[0] == start and positions[-1] == pytest.approx(end)
+    np.testing.assert_allclose(np.abs(np.diff(positions)), 0.01)
+
+
+def test_refines_only_near_peak():
+    start, end, step = 10., 15., 0.001
+    positions = coarse_positions(start, end, step)
+    assert positions[-1] == pytest.approx(end)
+    coarse = len(positions)
+    while True:
+        new = refine_positions(positions, trace(positions), step)
+        if not len(new):
+            break
+        assert np.all(np.diff(new) > 0)
+        assert np.all(np.abs(new - 12.5) < 0.1) # the baseline is left at the coarse step
+        positions = np.concatenate([positions, new])
+
+    x = np.sort(positions)
+    assert len(x) - coarse < 200
+    assert len(x) <= max_points(start, end, step)
+    # the peak is sampled at the fine step, on the fine grid
+    peak = np.abs(x - 12.5) < 0.05
+    np.testing.assert_allclose(np.diff(x[peak]), step)
+    np.testing.assert_allclose(np.round((x - start)/step), (x - start)/step, atol=1e-6)
+
+
+def test_flat_trace_is_not_refined():
+    positions = coarse_positions(10., 15., 0.001)
+    assert len(refine_positions(positions, np.full(len(positions), 0.1), 0.001)) == 0
@@ -0,0 +1,72 @@
+import json
+from threading import Barrier, Thread
+
+import pytest
+
+from core import AlreadyAcquiring, AutocorrelatorCore
+from scheduler import ScanScheduler
+
+
+def test_duration_only_for_monitor_jobs(tmp_path):
+    scheduler = ScanScheduler(core=None)
+    job = scheduler.add({'scan mode': 'Monitor'}, duration=60)
+    assert job.duration == 60
+    with pytest.raises(ValueError):
+        scheduler.add({'scan mode': 'Fly Scan'}, duration=60)
+    assert scheduler.jobs == [job]
+
+
+def test_invalid_entry_queues_nothing(tmp_path):
+    path = str(tmp_path/'jobs.json')
+    with open(path, 'w') as file:
+        json.dump([{'scan mode': 'Scan', 'name': 'first'}, {'scan mode': 'Repeated Scan', 'duration': 10}], file)
+    scheduler = ScanScheduler(core=None)
+    with pytest.raises(ValueError):
+        scheduler.load(path)
+    assert scheduler.jobs == []
+    jobs = scheduler.add_entries([{'scan mode': 'Scan', 'name': 'first', 'scan step': 0.002}, {'scan mode': 'Monitor', 'duration': 10}])
+    assert [job.name for job in scheduler.pending] == ['first', 'job002_monitor']
+    assert jobs[0].settings['scan step'] == 0.002 and jobs[1].duration == 10
+
+
+def test_job_stays_queued_while_core_busy():
+    core = AutocorrelatorCore(simulate=True)
+    try:
+        core.acquire({**core.settings, 'scan mode': 'Monitor'})
+        scheduler = ScanScheduler(core)
+        job = scheduler.add({'scan mode': 'Scan'})
+        with pytest.raises(AlreadyAcquiring):
+            scheduler.run_job(job)
+        assert job.status == 'queued' and scheduler.pending == [job]
+        assert core.acquiring
+    finally:
+        core.stop_acquire()
+        core.wait()
+        core.close()
+
+
+def test_concurrent_acquires_start_once():
+    core = AutocorrelatorCore(simulate=True)
+    settings = {**core.settings, 'scan mode': 'Monitor'}
+    barrier = Barrier(8)
+    started = []
+
+    def acquire():
+        barrier.wait()
+        try:
+            core.acquire(settings)
+            started.append(True)
+        except AlreadyAcquiring:
+            pass
+
+    threads = [Thread(target=acquire) for _ in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(started) == 1
+    finally:
+        core.stop_acquire()
+        core.wait()
+        core.close()
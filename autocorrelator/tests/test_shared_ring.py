@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from shared_ring import SharedRing
+
+
+@pytest.fixture
+def rings():
+    ring = SharedRing.create(capacity=8, width=2)
+    reader = SharedRing(*ring.spec)
+    yield ring, reader
+    reader.close()
+    ring.close()
+    ring.unlink()
+
+
+def records(first, n):
+    return np.arange(2*first, 2*(first + n), dtype=np.float64).reshape(n, 2)
+
+
+def test_wraparound(rings):
+    ring, reader = rings
+    count = 0
+    for first, n in [(0, 5), (5, 6), (11, 3), (14, 8)]:
+        ring.write(records(first, n))
+        count, new = reader.read(count)
+        np.testing.assert_array_equal(new, records(first, n))
+    assert count == reader.written == 22
+    np.testing.assert_array_equal(reader.latest(3), records(19, 3))
+    np.testing.assert_array_equal(reader.latest(100), records(14, 8))
+    assert reader.read(count)[1].shape == (0, 2)
+
+
+def test_lapped_reader_loses_oldest(rings):
+    ring, reader = rings
+    ring.write(records(0, 3))
+    count, _ = reader.read()
+    for first in range(3, 15, 4):
+        ring.write(records(first, 4))
+    count, new = reader.read(count)
+    assert count == 15
+    np.testing.assert_array_equal(new, records(7, 8)) # only the last capacity records are still there
+
+
+def test_write_larger_than_capacity(rings):
+    ring, reader = rings
+    ring.write(records(0, 3))
+    ring.write(records(3, 20))
+    assert reader.written == 23
+    count, new = reader.read()
+    assert count == 23
+    np.testing.assert_array_equal(new, records(15, 8))
+    ring.write(records(23, 2))
+    np.testing.assert_array_equal(reader.read(count)[1], records(23, 2))
+    np.testing.assert_array_equal(reader.latest(8), records(17, 8))
+
+
+def test_empty_write(rings):
+    ring, reader = rings
+    ring.write(np.zeros((0, 2)))
+    assert reader.written == 0
+    assert reader.latest(4).shape == (0, 2)
+
+
+class ReadDuringWrite:
+    ''' Stands in for the writer's data array and reads the ring after the writer's assignments'th slice copy. '''
+    def __init__(self, data, reader, start, assignments):
+        self.data = data
+        self.reader = reader
+        self.start = start
+        self.assignments = assignments
+        self.reads = []
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.assignments -= 1
+        if self.assignments == 0:
+            self.reads.append(self.reader.read(self.start))
+
+
+def test_read_overlapping_write(rings):
+    ring, reader = rings
+    ring.write(records(0, 6))
+    # the write wraps around: the read happens once it overwrote records 0 to 3, before it is published
+    ring.data = ReadDuringWrite(ring.data, reader, 0, assignments=2)
+    ring.write(records(6, 6))
+    count, new = ring.data.reads[0]
+    assert count == 6
+    np.testing.assert_array_equal(new, records(4, 2))
+    ring.data = ring.data.data
+    np.testing.assert_array_equal(reader.read(count)[1], records(6, 6))
+
@@ -0,0 +1,55 @@
+import numpy as np
+
+from storage import ScanWriter, export_csv, saved_rows, sort_scan
+
+
+def test_header_counts_flushed_rows(tmp_path):
+    path = str(tmp_path/'scan.npy')
+    writer = ScanWriter(path, columns=['delay (mm)', 'intensity (V)'], flush_interval=60.)
+    assert np.load(path).shape == (0, 2)
+    writer.append_rows([[1., 2.], [3., 4.]])
+    assert saved_rows(path) == 0 # buffered, not flushed yet
+    writer.flush()
+    np.testing.assert_array_equal(np.load(path), [[1., 2.], [3., 4.]])
+    writer.append(5., 6.)
+    writer.close()
+    np.testing.assert_array_equal(np.load(path), [[1., 2.], [3., 4.], [5., 6.]])
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path/'scan.npy')
+    rows = np.random.default_rng(0).normal(size=(2500, 3))
+    writer = ScanWriter(path, columns=['delay (mm)', 'intensity (V)', 'phase (rad)'], flush_rows=1000)
+    for batch in np.array_split(rows, 17):
+        writer.append_rows(batch)
+    writer.close()
+    np.testing.assert_array_equal(np.load(path), rows)
+    np.testing.assert_array_equal(np.load(path, mmap_mode='r'), rows)
+    csv_path = writer.export_csv()
+    np.testing.assert_allclose(np.loadtxt(csv_path, delimiter=','), rows, rtol=1e-15)
+
+
+def test_reopen_keeps_rows(tmp_path):
+    path = str(tmp_path/'scan.npy')
+    writer = ScanWriter(path)
+    writer.append_rows([[1., 2.], [3., 4.], [5., 6.]])
+    writer.close()
+    # rows past the kept ones, i.e. a flush cut short by a crash, are dropped
+    writer = ScanWriter(path, rows=2)
+    assert saved_rows(path) == 2
+    writer.append_rows([[7., 8.]])
+    writer.close()
+    np.testing.assert_array_equal(np.load(path), [[1., 2.], [3., 4.], [7., 8.]])
+
+
+def test_saved_rows_without_file(tmp_path):
+    assert saved_rows(str(tmp_path/'missing.npy')) == 0
+
+
+def test_sort_scan(tmp_path):
+    path = str(tmp_path/'scan.npy')
+    np.save(path, np.array([[3., 30.], [1., 10.], [2., 20.]]))
+    sort_scan(path)
+    np.testing.assert_array_equal(np.load(path), [[1., 10.], [2., 20.], [3., 30.]])
+    export_csv(path, str(tmp_path/'scan.csv'))
+    np.testing.assert_array_equal(np.loadtxt(str(tmp_path/'scan.csv'), delimiter=','), np.load(path))
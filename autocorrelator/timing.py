@@ -0,0 +1,250 @@
+''' Per-phase timing of acquisitions and a scan time model fitted to the measured timings.
+
+    The acquisition loop records how long each point spends moving, settling and reading, and the processing
+    worker how long each batch spends reducing, fitting, plotting and saving. The timings give the live
+    throughput and remaining time of a scan, are saved with the run, and calibrate the ScanTimeModel used for
+    the estimated scan time before a scan starts.
+'''
+import json
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+import numpy as np
+
+from motion import move_time
+from scan_planning import step_positions
+
+
+phases = ['move', 'settle', 'read', 'reduce', 'fit', 'plot', 'save']
+histogram_bins = np.logspace(-5, 1, 61) # s per point, 10 bins per decade
+
+
+def format_duration(seconds):
+    ''' Duration as i.e. '42 s', '3 min 12 s' or '2 h 5 min'. '''
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f'{seconds} s'
+    if seconds < 3600:
+        return f'{seconds//60} min {seconds%60} s'
+    return f'{seconds//3600} h {seconds%3600//60} min'
+
+
+class PhaseTimer:
+    ''' Collects per-point durations of the acquisition phases. Only the most recent history durations of each
+        phase are kept, so monitoring for hours does not grow without bound.
+
+        Usage:  timer = PhaseTimer(expected_points=1000)
+                with timer.phase('move'):
+                    stage.set_position(position)
+                with timer.phase('reduce', points=len(blocks)): # batch of points, recorded per point
+                    ...
+                timer.point_done()
+                timer.throughput(), timer.remaining_time(), timer.summary()
+    '''
+    def __init__(self, expected_points=None, history=100000):
+        self.expected_points = expected_points
+        self.history = history
+        self.durations = {phase: [] for phase in phases} # s per point
+        self.weights = {phase: [] for phase in phases} # points each duration stands for
+        self.point_times = [] # perf_counter time each recent point was acquired
+        self.count = 0 # points acquired
+        self.start_time = time.perf_counter()
+        self.lock = Lock()
+
+    @contextmanager
+    def phase(self, name, points=1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, points)
+
+    def record(self, name, seconds, points=1):
+        if points:
+            with self.lock:
+                durations, weights = self.durations[name], self.weights[name]
+                durations.append(seconds/points)
+                weights.append(points)
+                if len(durations) > 2*self.history:
+                    # drop old durations in bulk so trimming stays amortized O(1)
+                    del durations[:-self.history], weights[:-self.history]
+
+    def point_done(self, points=1):
+        now = time.perf_counter()
+        with self.lock:
+            self.point_times.extend([now]*points)
+            self.count += points
+            if len(self.point_times) > 2*self.history:
+                del self.point_times[:-self.history]
+
+    @property
+    def points(self):
+        return self.count
+
+    def __snapshot(self, name):
+        with self.lock:
+            return np.array(self.durations[name]), np.array(self.weights[name])
+
+    def throughput(self, window=5.):
+        ''' Points per second over the last window seconds. '''
+        with self.lock:
+            times = np.array(self.point_times)
+        if len(times) < 2:
+            return np.nan
+        recent = times[times >= times[-1] - window]
+        if len(recent) < 2:
+            recent = times[-2:]
+        return (len(recent) - 1)/(recent[-1] - recent[0]) if recent[-1] > recent[0] else np.nan
+
+    def point_period(self, last=50):
+        ''' Median time (s) between the last points acquired. '''
+        with self.lock:
+            times = np.array(self.point_times[-last - 1:])
+        return float(np.median(np.diff(times))) if len(times) > 1 else np.nan
+
+    def remaining_time(self):
+        ''' Estimated time (s) until expected_points were acquired, from the recent point rate. None if unknown. '''
+        if not self.expected_points or self.points < 2:
+            return None
+        return max(self.expected_points - self.points, 0)*self.point_period()
+
+    def mean(self, name):
+        durations, weights = self.__snapshot(name)
+        return float(np.average(durations, weights=weights)) if len(durations) else np.nan
+
+    def median(self, name):
+        durations, weights = self.__snapshot(name)
+        return float(np.median(durations)) if len(durations) else np.nan
+
+    def histogram(self, name, bins):
+        ''' Number of points per bin of per-point duration (s). '''
+        durations, weights = self.__snapshot(name)
+        return np.histogram(durations, bins=bins, weights=weights)[0]
+
+    def summary(self):
+        ''' Per-phase statistics in ms per point, throughput and run time. '''
+        result = {}
+        for name in phases:
+            durations, weights = self.__snapshot(name)
+            if not len(durations):
+                continue
+            result[name] = {
+                'points': int(weights.sum()),
+                'mean (ms)': 1000*float(np.average(durations, weights=weights)),
+                'median (ms)': 1000*float(np.median(durations)),
+                'p95 (ms)': 1000*float(np.percentile(durations, 95)),
+                'max (ms)': 1000*float(durations.max()),
+                'total (s)': float(np.dot(durations, weights)),
+            }
+        with self.lock:
+            elapsed = (self.point_times[-1] if self.point_times else time.perf_counter()) - self.start_time
+        return {
+            'phases': result,
+            'points': self.points,
+            'run time (s)': elapsed,
+            'points per second': self.points/elapsed if elapsed > 0 else None,
+        }
+
+    def save(self, path):
+        ''' Saves the summary (JSON) and the raw per-point durations (path with .npz) with the run. '''
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=4)
+        with self.lock:
+            arrays = {name: np.array(values) for name, values in self.durations.items() if values}
+            arrays.update({f'{name} weights': np.array(self.weights[name]) for name in arrays})
+            arrays['point times'] = np.array(self.point_times) - self.start_time
+        np.savez(os.path.splitext(path)[0] + '.npz', **arrays)
+
+
+class ScanTimeModel:
+    ''' Predicts scan times from the stage motion profile, the sample clock and the latencies measured in past scans.
+
+        time per point = move_time(step) + move latency + settle + samples/sample rate + read latency + overhead
+
+        Usage:  model = ScanTimeModel.load(path)
+                model.predict(settings, velocity, acceleration, sample_rate, settle_time)
+                model.update(timer, settings, velocity, acceleration, sample_rate) # after a step scan
+                model.save(path)
+    '''
+    step_modes = ['Scan', 'Adaptive Scan', 'Repeated Scan']
+
+    def __init__(self, move_latency=0.01, read_latency=0.002, overhead=0.001, smoothing=0.5):
+        self.move_latency = move_latency # s per move beyond the motion profile (commands, settling in the controller)
+        self.read_latency = read_latency # s per read beyond the sample clock
+        self.overhead = overhead         # s per point not spent moving or reading
+        self.smoothing = smoothing       # weight of the newest measurement
+        self.calibrated = False
+
+    def point_time(self, step, samples, velocity, acceleration, sample_rate, settle_time=0.):
+        move = move_time(step, velocity, acceleration) + self.move_latency
+        read = samples/sample_rate + self.read_latency
+        return move + settle_time + read + self.overhead
+
+    def predict(self, settings, velocity, acceleration, sample_rate, settle_time=0., position=None):
+        ''' Predicted duration (s) of an acquisition with settings, including the move from the stage position (mm) to
+            the scan start if given. None for Monitor, which runs until stopped. Adaptive scans are predicted as the
+            full uniform scan, their upper bound.
+        '''
+        mode = settings['scan mode']
+        start, end, step = settings['scan start'], settings['scan end'], abs(settings['scan step'])
+        samples = settings['samples']
+        if mode == 'Monitor' or step == 0:
+            return None
+        approach = move_time(start - position, velocity, acceleration) + self.move_latency if position is not None else 0.
+        points = len(step_positions(start, end, step))
+        if mode == 'Fly Scan':
+            block_time = samples/sample_rate
+            return approach + move_time(end - start, min(step/block_time, velocity), acceleration) + self.move_latency + block_time
+        scan = points*self.point_time(step, samples, velocity, acceleration, sample_rate, settle_time)
+        if mode == 'Repeated Scan':
+            if settings['bidirectional']:
+                return approach + settings['passes']*scan # no return travel between the passes
+            return approach + settings['passes']*scan + (settings['passes'] - 1)*(move_time(end - start, velocity, acceleration) + self.move_latency)
+        return approach + scan
+
+    def update(self, timer, settings, velocity, acceleration, sample_rate):
+        ''' Refines the latencies with the timings of a finished step scan. Medians are used so the long moves to the
+            scan start and between passes do not count as step latency.
+        '''
+        if settings['scan mode'] not in self.step_modes or timer.points < 10:
+            return
+        step, samples = abs(settings['scan step']), settings['samples']
+        move, read, settle = timer.median('move'), timer.median('read'), np.nan_to_num(timer.median('settle'))
+        measured = {
+            'move_latency': move - move_time(step, velocity, acceleration),
+            'read_latency': read - samples/sample_rate,
+            'overhead': timer.point_period(last=timer.points) - move - settle - read,
+        }
+        for name, value in measured.items():
+            if np.isfinite(value):
+                value = max(float(value), 0.)
+                weight = self.smoothing if self.calibrated else 1.
+                setattr(self, name, (1 - weight)*getattr(self, name) + weight*value)
+        self.calibrated = True
+
+    def to_dict(self):
+        return {'move_latency': self.move_latency, 'read_latency': self.read_latency, 'overhead': self.overhead, 'calibrated': self.calibrated}
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=4)
+
+    @classmethod
+    def from_dict(cls, values):
+        model = cls()
+        for name in ['move_latency', 'read_latency', 'overhead', 'calibrated']:
+            if name in values:
+                setattr(model, name, values[name])
+        return model
+
+    @classmethod
+    def load(cls, path):
+        ''' Model saved at path, or the default model if there is none. '''
+        try:
+            with open(path) as file:
+                values = json.load(file)
+        except (OSError, ValueError):
+            return cls()
+        return cls.from_dict(values)